@@ -0,0 +1,78 @@
+"""
+Denormalized per-profile counters.
+
+Profile.reviews and the favorite_* counters are bumped with F() expressions
+by the review and favorite signals (see signals.py), inside the transaction
+that writes the review or favorite, so profile lists never count rows.
+verify_profile_counters() recounts them from the source tables to fix drift.
+"""
+import logging
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Profile, Review, Favorite
+
+logger = logging.getLogger(__name__)
+
+# Favorite.content_type -> Profile counter
+FAVORITE_COUNTERS = {
+    'album': 'favorite_albums',
+    'song': 'favorite_songs',
+    'artist': 'favorite_artists',
+}
+
+
+def adjust_counter(user_id, field, delta):
+    """
+    Add delta to one of a user's profile counters with a single UPDATE.
+    """
+    if field and delta:
+        Profile.objects.filter(user_id=user_id).update(**{field: F(field) + delta})
+
+
+def counted(queryset):
+    """
+    Correlated subquery counting the rows of queryset that belong to the
+    profile being updated.
+    """
+    rows = queryset.filter(user=OuterRef('user')).order_by().values('user').annotate(n=Count('id')).values('n')
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+def counter_sources():
+    """
+    Profile counter -> queryset of the rows it counts.
+    """
+    sources = {'reviews': Review.objects.all()}
+    for content_type, field in FAVORITE_COUNTERS.items():
+        sources[field] = Favorite.objects.filter(content_type=content_type)
+    return sources
+
+
+def recount_reviews(user_ids):
+    """
+    Set the review counters of specific users from the reviews table.
+    """
+    Profile.objects.filter(user_id__in=user_ids).update(reviews=counted(Review.objects.all()))
+
+
+def verify_profile_counters(dry_run=False):
+    """
+    Recount every profile counter and fix those that have drifted, one
+    set-based UPDATE per counter.
+    Args:
+        dry_run (bool): Only count drifted profiles, don't write
+    Returns:
+        dict: Counter name -> number of profiles whose value was wrong
+    """
+    drifted = {}
+    for field, source in counter_sources().items():
+        wrong = Profile.objects.annotate(actual=counted(source)).exclude(**{field: F('actual')})
+        ids = list(wrong.values_list('pk', flat=True))
+        if ids and not dry_run:
+            Profile.objects.filter(pk__in=ids).update(**{field: counted(source)})
+        drifted[field] = len(ids)
+        if ids:
+            logger.warning('%d profiles had a drifted %s counter', len(ids), field)
+    return drifted
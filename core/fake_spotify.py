@@ -0,0 +1,180 @@
+"""
+A local stand-in for the Spotify Web API and accounts service, for offline
+development and load testing.
+
+Responses are built from recorded fixtures in core/fixtures/spotify
+(artists.json, albums.json, tracks.json). Point SPOTIFY_API_URL and
+SPOTIFY_TOKEN_URL at the server to use it, e.g. with `manage.py fake_spotify`
+running on port 8888:
+
+    SPOTIFY_API_URL=http://localhost:8888/v1
+    SPOTIFY_TOKEN_URL=http://localhost:8888/api/token
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+FIXTURES_DIR = Path(__file__).resolve().parent / 'fixtures' / 'spotify'
+CONTENT_TYPES = ('artist', 'album', 'track')
+
+
+class FakeSpotifyCatalog:
+    """
+    Fixture data indexed for the endpoints the app uses.
+    """
+    def __init__(self, fixtures_dir=FIXTURES_DIR):
+        self.items = {}
+        for content_type in CONTENT_TYPES:
+            path = Path(fixtures_dir) / f"{content_type}s.json"
+            data = json.loads(path.read_text()) if path.exists() else []
+            self.items[content_type] = {item['id']: item for item in data}
+
+        self.album_tracks = {}
+        for track in sorted(self.items['track'].values(), key=lambda t: (t.get('disc_number', 1), t.get('track_number', 0))):
+            simplified = {key: value for key, value in track.items() if key != 'album'}
+            self.album_tracks.setdefault(track['album']['id'], []).append(simplified)
+
+    def get(self, content_type, spotify_id, base_url=''):
+        item = self.items[content_type].get(spotify_id)
+        if item is None or content_type != 'album':
+            return item
+        return dict(item, tracks=self.tracks_page(spotify_id, 0, 50, base_url))
+
+    def tracks_page(self, album_id, offset, limit, base_url=''):
+        tracks = self.album_tracks.get(album_id, [])
+        return self.page(tracks, offset, limit, f"{base_url}/v1/albums/{album_id}/tracks", {})
+
+    def search(self, query, types, offset, limit, base_url=''):
+        words = query.lower().split()
+        results = {}
+        for content_type in types:
+            matches = [
+                item for item in self.items.get(content_type, {}).values()
+                if all(word in item['name'].lower() for word in words)
+            ]
+            params = {'q': query, 'type': content_type}
+            results[f"{content_type}s"] = self.page(matches, offset, limit, f"{base_url}/v1/search", params)
+        return results
+
+    def page(self, items, offset, limit, url, params):
+        next_url = None
+        if offset + limit < len(items):
+            next_url = f"{url}?{urlencode(dict(params, offset=offset + limit, limit=limit))}"
+        return {
+            'items': items[offset:offset + limit],
+            'total': len(items),
+            'limit': limit,
+            'offset': offset,
+            'next': next_url,
+        }
+
+
+class FakeSpotifyHandler(BaseHTTPRequestHandler):
+    server_version = 'FakeSpotify/1.0'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_POST(self):
+        if not self.inject_faults():
+            return
+        if urlsplit(self.path).path != '/api/token':
+            return self.send_json(404, {'error': {'status': 404, 'message': 'Not found'}})
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        self.send_json(200, {'access_token': 'fake-token', 'token_type': 'Bearer', 'expires_in': 3600})
+
+    def do_GET(self):
+        if not self.inject_faults():
+            return
+        url = urlsplit(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        parts = url.path.strip('/').split('/')
+        if not self.headers.get('Authorization', '').startswith('Bearer '):
+            return self.send_json(401, {'error': {'status': 401, 'message': 'No token provided'}})
+
+        catalog = self.server.catalog
+        base_url = f"http://{self.headers.get('Host')}"
+        offset = int(params.get('offset', 0))
+        limit = int(params.get('limit', 20))
+        kind = parts[1][:-1] if len(parts) > 1 else None
+
+        if parts == ['v1', 'search']:
+            types = [t for t in params.get('type', '').split(',') if t in CONTENT_TYPES]
+            return self.send_json(200, catalog.search(params.get('q', ''), types, offset, limit, base_url))
+        if len(parts) == 2 and kind in CONTENT_TYPES and 'ids' in params:
+            items = [catalog.get(kind, spotify_id, base_url) for spotify_id in params['ids'].split(',')]
+            return self.send_json(200, {parts[1]: items})
+        if len(parts) == 3 and kind in CONTENT_TYPES:
+            item = catalog.get(kind, parts[2], base_url)
+            if item is not None:
+                return self.send_json(200, item)
+        if len(parts) == 4 and parts[1] == 'albums' and parts[3] == 'tracks' and parts[2] in catalog.items['album']:
+            return self.send_json(200, catalog.tracks_page(parts[2], offset, limit, base_url))
+        return self.send_json(404, {'error': {'status': 404, 'message': 'Not found'}})
+
+    def inject_faults(self):
+        """
+        Apply configured latency and random errors. Returns False if an error
+        response was sent instead of the real one.
+        """
+        server = self.server
+        if server.latency or server.jitter:
+            time.sleep(max(server.latency + random.uniform(-server.jitter, server.jitter), 0))
+        if server.rate_limit_rate and random.random() < server.rate_limit_rate:
+            self.send_json(429, {'error': {'status': 429, 'message': 'API rate limit exceeded'}},
+                           {'Retry-After': str(server.retry_after)})
+            return False
+        if server.error_rate and random.random() < server.error_rate:
+            self.send_json(503, {'error': {'status': 503, 'message': 'Service unavailable'}})
+            return False
+        return True
+
+    def send_json(self, status_code, data, headers=None):
+        body = json.dumps(data).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeSpotifyServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server answering Spotify requests from fixtures.
+    Args:
+        latency (float): Seconds added to every response
+        jitter (float): Random +/- variation applied to the latency
+        error_rate (float): Fraction of requests answered with a 503
+        rate_limit_rate (float): Fraction of requests answered with a 429
+        retry_after (int): Retry-After seconds sent with injected 429s
+    """
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 8888), fixtures_dir=FIXTURES_DIR, latency=0, jitter=0,
+                 error_rate=0, rate_limit_rate=0, retry_after=1, verbose=False):
+        super().__init__(address, FakeSpotifyHandler)
+        self.catalog = FakeSpotifyCatalog(fixtures_dir)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.verbose = verbose
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start_in_background(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,265 @@
+"""
+Bulk import of Spotify catalog items into Artist, Album and Song rows.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Artist, Album, Song, IngestJob, with_search_text
+from .ratelimit import BACKGROUND, request_priority
+from .spotify import (
+    IngestContext, build_album_songs, client, create_resource, fetch_album_tracks, first_image,
+    get_spotify_token, parse_release_date,
+)
+from .vectors import index_items
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of IDs accepted by Spotify's several-items endpoints
+CHUNK_SIZES = {
+    'artist': 50,
+    'album': 20,
+    'track': 50,
+}
+
+
+def parse_spotify_uri(value):
+    """
+    Split a Spotify URI ("spotify:album:<id>") or open.spotify.com URL into
+    (type, id). Returns (None, None) if the value isn't recognised.
+    """
+    value = value.strip()
+    if value.startswith('spotify:'):
+        parts = value.split(':')
+        if len(parts) == 3:
+            return parts[1], parts[2]
+    elif 'open.spotify.com/' in value:
+        path = value.split('open.spotify.com/', 1)[1].split('?', 1)[0]
+        parts = path.strip('/').split('/')
+        if len(parts) == 2:
+            return parts[0], parts[1]
+    return None, None
+
+
+def fetch_several(content_type, spotify_ids, token):
+    """
+    Fetch items through Spotify's several-items endpoint (e.g. /albums?ids=),
+    chunked to the endpoint's limit. Returns a dict of uri -> item data.
+    """
+    items = {}
+    spotify_ids = list(spotify_ids)
+    chunk_size = CHUNK_SIZES[content_type]
+    for start in range(0, len(spotify_ids), chunk_size):
+        chunk = spotify_ids[start:start + chunk_size]
+        response = client.api_get(f"/{content_type}s", token, endpoint='item', params={'ids': ','.join(chunk)})
+        if response is None or response.status_code != 200:
+            logger.warning('Failed to fetch %d %ss from Spotify', len(chunk), content_type)
+            continue
+        for item in response.json().get(f"{content_type}s", []):
+            if item:
+                items[item['uri']] = item
+    return items
+
+
+def existing_by_uri(model, uris):
+    return {obj.spotify_uri: obj for obj in model.objects.filter(spotify_uri__in=uris)}
+
+
+def ingest_spotify_uris(uris, token=None, context=None):
+    """
+    Import many Spotify items at once.
+
+    URIs are grouped by type and fetched through the several-items endpoints,
+    pulling in the artists and albums they depend on. New rows are written
+    with conflict-tolerant bulk_create, one transaction per model, so
+    concurrent imports of the same items don't fail. New albums get all of their
+    tracks, starting from the page Spotify embeds in the album response.
+    Args:
+        uris (iterable): Spotify URIs or open.spotify.com URLs
+        token (str): Valid Spotify access token, fetched if not given
+        context (IngestContext): Memo shared with other ingest operations in
+            the same batch; items already in it are neither looked up nor
+            fetched, and everything imported is added to it
+    Returns:
+        dict: Requested URI -> Artist, Album or Song instance, for every item
+        that exists after the import
+    """
+    context = context or IngestContext()
+    requested = {'artist': set(), 'album': set(), 'track': set()}
+    requested_uris = []
+    for value in uris:
+        content_type, spotify_id = parse_spotify_uri(value)
+        if content_type not in requested:
+            logger.warning('Skipping unrecognised Spotify URI %r', value)
+            continue
+        uri = f"spotify:{content_type}:{spotify_id}"
+        requested_uris.append(uri)
+        if uri not in context.resolved:
+            requested[content_type].add(uri)
+
+    token = token or get_spotify_token()
+    if not token:
+        raise RuntimeError('Failed to authenticate with Spotify API')
+
+    # Tracks first, since they tell us which albums and artists we also need
+    songs = existing_by_uri(Song, requested['track'])
+    track_data = fetch_several('track', [uri.split(':')[-1] for uri in requested['track'] - songs.keys()], token)
+
+    album_uris = requested['album'] | {track['album']['uri'] for track in track_data.values()}
+    albums = existing_by_uri(Album, album_uris)
+    album_data = fetch_several('album', [uri.split(':')[-1] for uri in album_uris - albums.keys()], token)
+
+    artist_uris = (
+        requested['artist']
+        | {track['artists'][0]['uri'] for track in track_data.values()}
+        | {album['artists'][0]['uri'] for album in album_data.values()}
+    )
+    artists = existing_by_uri(Artist, artist_uris)
+    artist_data = fetch_several('artist', [uri.split(':')[-1] for uri in artist_uris - artists.keys()], token)
+
+    with transaction.atomic():
+        Artist.objects.bulk_create(with_search_text(
+            Artist(
+                spotify_uri=uri,
+                name=data['name'],
+                genre=data['genres'][0] if data.get('genres') else '',
+                image=first_image(data),
+            )
+            for uri, data in artist_data.items()
+        ), ignore_conflicts=True)
+    created_artists = existing_by_uri(Artist, artist_data.keys())
+    artists.update(created_artists)
+    index_items('artists', list(created_artists.values()))
+
+    new_albums = [
+        Album(
+            spotify_uri=uri,
+            title=data['name'],
+            artist=artists[data['artists'][0]['uri']],
+            genre=artists[data['artists'][0]['uri']].genre,
+            release_date=parse_release_date(data),
+            tracks=data['total_tracks'],
+            cover_art=first_image(data),
+        )
+        for uri, data in album_data.items()
+        if data['artists'][0]['uri'] in artists
+    ]
+    with transaction.atomic():
+        Album.objects.bulk_create(with_search_text(new_albums), ignore_conflicts=True)
+    created_albums = existing_by_uri(Album, [album.spotify_uri for album in new_albums])
+    albums.update(created_albums)
+    index_items('albums', list(created_albums.values()))
+
+    # Every track of the new albums, plus the individually requested tracks
+    new_songs = {}
+    for uri, album in created_albums.items():
+        tracks = fetch_album_tracks(album_data[uri]['id'], token, album_data[uri].get('tracks'))
+        for song in build_album_songs(album, tracks):
+            new_songs[song.spotify_uri] = song
+    for uri, data in track_data.items():
+        artist = artists.get(data['artists'][0]['uri'])
+        album = albums.get(data['album']['uri'])
+        if artist is None:
+            continue
+        new_songs[uri] = Song(
+            spotify_uri=uri,
+            title=data['name'],
+            artist=artist,
+            album=album,
+            duration=timedelta(milliseconds=data['duration_ms']),
+            image=first_image(data['album']),
+        )
+    already_stored = existing_by_uri(Song, new_songs.keys())
+    with transaction.atomic():
+        Song.objects.bulk_create(
+            with_search_text(song for uri, song in new_songs.items() if uri not in already_stored),
+            ignore_conflicts=True,
+        )
+    songs.update(existing_by_uri(Song, requested['track']))
+
+    for rows in (artists, albums, songs):
+        for obj in rows.values():
+            context.add(obj)
+    return {uri: context.resolved[uri] for uri in requested_uris if uri in context.resolved}
+
+
+def enqueue_ingest(content_type, spotify_uri):
+    """
+    Queue a Spotify item for import by the ingest worker.
+    Jobs are keyed by URI: re-enqueueing returns the existing job, putting it
+    back in the queue if it failed or its row has since disappeared.
+    Returns:
+        IngestJob: The job for this URI
+    """
+    job, created = IngestJob.objects.get_or_create(
+        spotify_uri=spotify_uri,
+        defaults={'content_type': content_type},
+    )
+    if not created and job.status in (IngestJob.FAILED, IngestJob.DONE):
+        job.status = IngestJob.PENDING
+        job.attempts = 0
+        job.save(update_fields=['status', 'attempts', 'updated_at'])
+    return job
+
+
+def claim_ingest_jobs(limit=1):
+    """
+    Mark up to `limit` pending jobs as running and return them. Rows are
+    locked with SKIP LOCKED so concurrent workers never claim the same job.
+    Jobs left running by a crashed worker are requeued first.
+    """
+    now = timezone.now()
+    IngestJob.objects.filter(
+        status=IngestJob.RUNNING,
+        locked_at__lt=now - timedelta(seconds=settings.INGEST_JOB_TIMEOUT),
+    ).update(status=IngestJob.PENDING)
+
+    with transaction.atomic():
+        jobs = list(
+            IngestJob.objects.select_for_update(skip_locked=True)
+            .filter(status=IngestJob.PENDING)
+            .order_by('created_at')[:limit]
+        )
+        IngestJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status=IngestJob.RUNNING, locked_at=now, updated_at=now
+        )
+    return jobs
+
+
+def run_ingest_job(job, context=None):
+    """
+    Import the job's item. Recent searches recorded against the job are
+    keyed by its Spotify URI, so they resolve to the imported row by themselves.
+    Returns:
+        Model instance: The imported row, or None if the import failed
+    """
+    obj = None
+    error = ''
+    try:
+        with request_priority(BACKGROUND):
+            token = get_spotify_token()
+            if not token:
+                error = 'Failed to authenticate with Spotify API'
+            else:
+                obj = create_resource(job.content_type, job.spotify_uri, token, context)
+                if obj is None:
+                    error = 'Spotify item could not be imported'
+    except Exception as e:
+        logger.exception('Ingest job %s failed', job.spotify_uri)
+        error = str(e)
+
+    job.attempts += 1
+    job.locked_at = None
+    if obj is not None:
+        job.status = IngestJob.DONE
+        job.object_id = obj.id
+        job.last_error = ''
+    else:
+        job.status = IngestJob.FAILED if job.attempts >= settings.INGEST_JOB_MAX_ATTEMPTS else IngestJob.PENDING
+        job.last_error = error
+    job.save()
+    return obj
+
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from core.recommendations import build_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Rebuild per-user album recommendations with item-item collaborative filtering'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--neighbors', type=int, help='Similar albums kept per album')
+        parser.add_argument('--limit', type=int, help='Recommendations stored per user')
+
+    def handle(self, *args, **options):
+        counts = build_recommendations(neighbors=options['neighbors'], limit=options['limit'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {counts['recommendations']} recommendations for {counts['users']} users "
+            f"over {counts['albums']} albums"
+        ))
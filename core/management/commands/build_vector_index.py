@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.vectors import INDEXED_MODELS, indexes
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the similar albums/artists vector index in VECTOR_INDEX_DIR'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=sorted(INDEXED_MODELS), help='Only rebuild this index')
+
+    def handle(self, *args, **options):
+        for kind in [options['kind']] if options['kind'] else INDEXED_MODELS:
+            count = indexes[kind].build()
+            self.stdout.write(self.style.SUCCESS(f"Indexed {count} {kind}"))
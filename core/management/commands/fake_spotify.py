@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from core.fake_spotify import FIXTURES_DIR, FakeSpotifyServer
+
+
+class Command(BaseCommand):
+    help = 'Run a local stand-in for the Spotify API that serves recorded fixtures'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8888)
+        parser.add_argument('--fixtures', default=str(FIXTURES_DIR), help='Directory of recorded fixtures')
+        parser.add_argument('--latency', type=float, default=0, help='Milliseconds added to every response')
+        parser.add_argument('--jitter', type=float, default=0, help='Random +/- milliseconds applied to the latency')
+        parser.add_argument('--error-rate', type=float, default=0, help='Fraction of requests answered with a 503')
+        parser.add_argument('--rate-limit-rate', type=float, default=0, help='Fraction of requests answered with a 429')
+        parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds sent with injected 429s')
+        parser.add_argument('--verbose', action='store_true', help='Log every request')
+
+    def handle(self, *args, **options):
+        server = FakeSpotifyServer(
+            (options['host'], options['port']),
+            fixtures_dir=options['fixtures'],
+            latency=options['latency'] / 1000,
+            jitter=options['jitter'] / 1000,
+            error_rate=options['error_rate'],
+            rate_limit_rate=options['rate_limit_rate'],
+            retry_after=options['retry_after'],
+            verbose=options['verbose'],
+        )
+        self.stdout.write(f"Fake Spotify listening on {server.base_url}")
+        self.stdout.write(f"  SPOTIFY_API_URL={server.base_url}/v1")
+        self.stdout.write(f"  SPOTIFY_TOKEN_URL={server.base_url}/api/token")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.ingest import ingest_spotify_uris, parse_spotify_uri
+from core.ratelimit import BACKGROUND, request_priority
+
+
+class Command(BaseCommand):
+    help = 'Import Spotify artists, albums and tracks in bulk from URIs or open.spotify.com URLs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('uris', nargs='*', help='Spotify URIs or URLs to import')
+        parser.add_argument('--file', help='Read additional URIs from this file, one per line')
+
+    def handle(self, *args, **options):
+        uris = list(options['uris'])
+        if options['file']:
+            with open(options['file']) as f:
+                uris.extend(line.strip() for line in f if line.strip())
+        if not uris:
+            raise CommandError('No Spotify URIs given')
+
+        try:
+            with request_priority(BACKGROUND):
+                imported = ingest_spotify_uris(uris)
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f'Imported {len(imported)} of {len(uris)} items'))
+        for value in uris:
+            content_type, spotify_id = parse_spotify_uri(value)
+            if f"spotify:{content_type}:{spotify_id}" not in imported:
+                self.stdout.write(self.style.WARNING(f'Could not import {value}'))
@@ -0,0 +1,34 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from core.ratings import recompute_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recompute artist, album and song rating totals from the reviews table with set-based updates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only recompute items reviewed since this date or ISO datetime')
+        parser.add_argument('--batch-size', type=int, default=10000, help='IDs per UPDATE')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                day = parse_date(options['since'])
+                if day is None:
+                    raise CommandError(f"Invalid --since value {options['since']!r}")
+                since = datetime.combine(day, time.min)
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+
+        def progress(model, done, total):
+            self.stdout.write(f'{model.__name__}: {done}/{total}')
+
+        updated = recompute_ratings(since=since, batch_size=options['batch_size'], progress=progress)
+        for model_name, count in updated.items():
+            self.stdout.write(self.style.SUCCESS(f'Recomputed {count} {model_name} rating totals'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from core.ratings import reconcile_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recount artist, album and song rating totals from their reviews and repair any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Items checked per query')
+        parser.add_argument('--dry-run', action='store_true', help="Report drifted items without fixing them")
+
+    def handle(self, *args, **options):
+        repaired = reconcile_ratings(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        verb = 'Found' if options['dry_run'] else 'Repaired'
+        for model_name, count in repaired.items():
+            style = self.style.WARNING if count else self.style.SUCCESS
+            self.stdout.write(style(f'{verb} {count} drifted {model_name} rating totals'))
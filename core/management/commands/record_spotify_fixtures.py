@@ -0,0 +1,50 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.fake_spotify import CONTENT_TYPES, FIXTURES_DIR
+from core.ingest import fetch_several, parse_spotify_uri
+from core.spotify import fetch_album_tracks, get_spotify_token
+
+
+class Command(BaseCommand):
+    help = 'Record Spotify artists, albums and tracks into fixtures for the fake Spotify server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('uris', nargs='+', help='Spotify URIs or URLs to record')
+        parser.add_argument('--fixtures', default=str(FIXTURES_DIR), help='Directory of recorded fixtures')
+
+    def handle(self, *args, **options):
+        token = get_spotify_token()
+        if not token:
+            raise CommandError('Failed to authenticate with Spotify API')
+
+        ids = {content_type: set() for content_type in CONTENT_TYPES}
+        for value in options['uris']:
+            content_type, spotify_id = parse_spotify_uri(value)
+            if content_type not in ids:
+                raise CommandError(f'Unrecognised Spotify URI {value}')
+            ids[content_type].add(spotify_id)
+
+        # Albums bring all of their tracks; every item brings its artists
+        albums = fetch_several('album', ids['album'], token)
+        for album in albums.values():
+            tracks = fetch_album_tracks(album['id'], token, album.get('tracks'))
+            ids['track'].update(track['id'] for track in tracks)
+        tracks = fetch_several('track', ids['track'], token)
+        for item in list(albums.values()) + list(tracks.values()):
+            ids['artist'].update(artist['id'] for artist in item['artists'])
+        artists = fetch_several('artist', ids['artist'], token)
+
+        fixtures_dir = Path(options['fixtures'])
+        fixtures_dir.mkdir(parents=True, exist_ok=True)
+        for content_type, recorded in (('artist', artists), ('album', albums), ('track', tracks)):
+            path = fixtures_dir / f"{content_type}s.json"
+            existing = {item['id']: item for item in json.loads(path.read_text())} if path.exists() else {}
+            for item in recorded.values():
+                # The fake server rebuilds embedded track pages itself
+                item.pop('tracks', None)
+                existing[item['id']] = item
+            path.write_text(json.dumps(list(existing.values()), indent=1))
+            self.stdout.write(f"Recorded {len(recorded)} {content_type}s to {path}")
@@ -0,0 +1,60 @@
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from core.ingest import claim_ingest_jobs, run_ingest_job
+
+
+class Command(BaseCommand):
+    help = 'Process queued Spotify ingest jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.INGEST_WORKER_CONCURRENCY,
+            help='Number of jobs processed in parallel',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.INGEST_WORKER_POLL_INTERVAL,
+            help='Seconds to wait when the queue is empty',
+        )
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        self.stop = threading.Event()
+        threads = [
+            threading.Thread(target=self.work, args=(options['poll_interval'], options['once']), daemon=True)
+            for _ in range(max(options['concurrency'], 1))
+        ]
+        self.stdout.write(f"Starting {len(threads)} ingest worker(s)")
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            self.stop.set()
+            self.stdout.write('Stopping after current jobs')
+            for thread in threads:
+                thread.join()
+
+    def work(self, poll_interval, once):
+        try:
+            while not self.stop.is_set():
+                close_old_connections()
+                jobs = claim_ingest_jobs()
+                if not jobs:
+                    if once:
+                        return
+                    self.stop.wait(poll_interval)
+                    continue
+                for job in jobs:
+                    obj = run_ingest_job(job)
+                    if obj is not None:
+                        self.stdout.write(self.style.SUCCESS(f"Imported {job.spotify_uri}"))
+                    else:
+                        self.stdout.write(self.style.WARNING(f"Failed {job.spotify_uri}: {job.last_error}"))
+        finally:
+            connection.close()
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core.counters import verify_profile_counters
+
+
+class Command(BaseCommand):
+    help = 'Recount profile review and favorite counters and repair any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report drifted counters without fixing them")
+
+    def handle(self, *args, **options):
+        drifted = verify_profile_counters(dry_run=options['dry_run'])
+        verb = 'Found' if options['dry_run'] else 'Repaired'
+        for field, count in drifted.items():
+            style = self.style.WARNING if count else self.style.SUCCESS
+            self.stdout.write(style(f'{verb} {count} drifted {field} counters'))
@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import Review
+from core.recommendations import warm_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Precompute cached recommendations for recently active users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Warm users who logged in or reviewed within this many days')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        users = User.objects.filter(
+            Q(last_login__gte=since) | Q(pk__in=Review.objects.filter(created_at__gte=since).values('user'))
+        ).values_list('pk', flat=True)
+        count = warm_recommendations(users.iterator())
+        self.stdout.write(self.style.SUCCESS(f'Warmed recommendations for {count} users'))
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.5 on 2026-10-18 07:00
+
+from django.db import migrations, models
+
+
+def clear_duplicate_uris(apps, schema_editor):
+    """
+    Keep spotify_uri on the oldest row for each URI and clear it on the
+    others, so the unique index can be built without deleting anything.
+    """
+    for model_name in ('Artist', 'Album', 'Song'):
+        model = apps.get_model('core', model_name)
+        model.objects.filter(spotify_uri='').update(spotify_uri=None)
+        duplicates = (
+            model.objects.exclude(spotify_uri=None)
+            .values('spotify_uri')
+            .annotate(first_id=models.Min('id'), rows=models.Count('id'))
+            .filter(rows__gt=1)
+        )
+        for duplicate in duplicates:
+            model.objects.filter(spotify_uri=duplicate['spotify_uri']).exclude(
+                id=duplicate['first_id']
+            ).update(spotify_uri=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_ratelimitbucket'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_duplicate_uris, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='album',
+            name='spotify_uri',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='artist',
+            name='spotify_uri',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='song',
+            name='spotify_uri',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+    ]
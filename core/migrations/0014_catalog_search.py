@@ -0,0 +1,80 @@
+# Generated by Django 5.1.5 on 2026-10-18 07:05
+
+import unicodedata
+
+from django.db import migrations, models
+
+SEARCH_TABLES = ('core_artist', 'core_album', 'core_song')
+
+
+def normalize_search_text(*parts):
+    text = unicodedata.normalize('NFKD', ' '.join(part for part in parts if part))
+    text = ''.join(c if c.isalnum() else ' ' for c in text if not unicodedata.combining(c))
+    return ' '.join(text.lower().split())
+
+
+def populate_search_text(apps, schema_editor):
+    Artist = apps.get_model('core', 'Artist')
+    for model in (apps.get_model('core', 'Album'), apps.get_model('core', 'Song')):
+        items = list(model.objects.select_related('artist'))
+        for item in items:
+            item.search_text = normalize_search_text(item.title, item.artist.name)
+        model.objects.bulk_update(items, ['search_text'], batch_size=500)
+    artists = list(Artist.objects.all())
+    for artist in artists:
+        artist.search_text = normalize_search_text(artist.name)
+    Artist.objects.bulk_update(artists, ['search_text'], batch_size=500)
+
+
+def create_search_indexes(apps, schema_editor):
+    """
+    Full-text and trigram GIN indexes on search_text. Postgres only; other
+    databases fall back to scanning search_text.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in SEARCH_TABLES:
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_search_fts ON {table} "
+            f"USING GIN (to_tsvector('simple'::regconfig, search_text))"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_search_trgm ON {table} "
+            f"USING GIN (search_text gin_trgm_ops)"
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in SEARCH_TABLES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {table}_search_fts")
+        schema_editor.execute(f"DROP INDEX IF EXISTS {table}_search_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_unique_spotify_uri'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='artist',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(populate_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
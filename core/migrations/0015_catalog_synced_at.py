@@ -0,0 +1,28 @@
+# Generated by Django 5.1.5 on 2026-10-18 07:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_catalog_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='synced_at',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='artist',
+            name='synced_at',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='synced_at',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.5 on 2026-10-18 07:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_username_key(apps, schema_editor):
+    Profile = apps.get_model('core', 'Profile')
+    profiles = list(Profile.objects.select_related('user'))
+    for profile in profiles:
+        profile.username_key = profile.user.username.lower()
+    Profile.objects.bulk_update(profiles, ['username_key'], batch_size=500)
+
+
+def create_trigram_index(apps, schema_editor):
+    """
+    Trigram GIN index for infix username matches. Postgres only.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS core_profile_username_trgm ON core_profile '
+        'USING GIN (username_key gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS core_profile_username_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_catalog_synced_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='username_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=150),
+        ),
+        migrations.RunPython(populate_username_key, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['username_key'], name='core_profile_username_prefix', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.1.5 on 2026-10-18 07:13
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+REVIEW_TYPES = {
+    'Artist': ['artist'],
+    'Album': ['album'],
+    'Song': ['track', 'song'],
+}
+
+
+def populate_rating_totals(apps, schema_editor):
+    Review = apps.get_model('core', 'Review')
+    for model_name, content_types in REVIEW_TYPES.items():
+        model = apps.get_model('core', model_name)
+        totals = (
+            Review.objects.filter(content_type__in=content_types)
+            .values('content_id').annotate(total=Sum('rating'), count=Count('id'))
+        )
+        items = []
+        for row in totals:
+            item = model(pk=row['content_id'])
+            item.rating_sum = Decimal(row['total'])
+            item.rating_count = row['count']
+            item.average_rating = (item.rating_sum / item.rating_count).quantize(Decimal('0.1'), rounding=ROUND_HALF_UP)
+            items.append(item)
+        existing = set(model.objects.filter(pk__in=[item.pk for item in items]).values_list('pk', flat=True))
+        model.objects.bulk_update(
+            [item for item in items if item.pk in existing],
+            ['rating_sum', 'rating_count', 'average_rating'],
+            batch_size=500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_profile_username_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='rating_sum',
+            field=models.DecimalField(decimal_places=1, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='artist',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='artist',
+            name='rating_sum',
+            field=models.DecimalField(decimal_places=1, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='rating_sum',
+            field=models.DecimalField(decimal_places=1, default=0, editable=False, max_digits=12),
+        ),
+        migrations.RunPython(populate_rating_totals, migrations.RunPython.noop),
+    ]
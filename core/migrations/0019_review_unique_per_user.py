@@ -0,0 +1,61 @@
+# Generated by Django 5.1.5 on 2026-10-18 07:15
+
+from django.conf import settings
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+
+REVIEWED_MODELS = {
+    'album': 'Album',
+    'track': 'Song',
+    'song': 'Song',
+    'artist': 'Artist',
+}
+
+
+def delete_duplicate_reviews(apps, schema_editor):
+    """
+    Keep only the newest review per user and item, as the API would have
+    overwritten the older ones, and recount the affected items' totals.
+    """
+    Review = apps.get_model('core', 'Review')
+    duplicates = (
+        Review.objects.values('user', 'content_type', 'content_id')
+        .annotate(last_id=models.Max('id'), rows=models.Count('id'))
+        .filter(rows__gt=1)
+    )
+    for duplicate in duplicates:
+        Review.objects.filter(
+            user=duplicate['user'],
+            content_type=duplicate['content_type'],
+            content_id=duplicate['content_id'],
+        ).exclude(id=duplicate['last_id']).delete()
+
+        model_name = REVIEWED_MODELS.get(duplicate['content_type'])
+        if model_name is None:
+            continue
+        content_types = [key for key, value in REVIEWED_MODELS.items() if value == model_name]
+        totals = Review.objects.filter(
+            content_type__in=content_types, content_id=duplicate['content_id']
+        ).aggregate(total=models.Sum('rating'), count=models.Count('id'))
+        total = Decimal(totals['total'] or 0)
+        average = (total / totals['count']).quantize(Decimal('0.1'), rounding=ROUND_HALF_UP) if totals['count'] else 0
+        apps.get_model('core', model_name).objects.filter(pk=duplicate['content_id']).update(
+            rating_sum=total, rating_count=totals['count'], average_rating=average
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_review_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_reviews, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='review',
+            constraint=models.UniqueConstraint(fields=('user', 'content_type', 'content_id'), name='core_review_unique_per_user'),
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.1.5 on 2026-10-18 07:17
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+SUMMARY_KEYS = {
+    'album': 'album',
+    'track': 'track',
+    'song': 'track',
+    'artist': 'artist',
+}
+
+
+def populate_review_summaries(apps, schema_editor):
+    Review = apps.get_model('core', 'Review')
+    ReviewSummary = apps.get_model('core', 'ReviewSummary')
+    buckets = {}
+    for bucket in range(11):
+        condition = models.Q()
+        if bucket > 0:
+            condition &= models.Q(rating__gte=Decimal(bucket) / 2 - Decimal('0.25'))
+        if bucket < 10:
+            condition &= models.Q(rating__lt=Decimal(bucket) / 2 + Decimal('0.25'))
+        buckets[f'count_{bucket}'] = models.Count('id', filter=condition)
+    summaries = {}
+    rows = Review.objects.values('content_type', 'content_id').annotate(
+        total=models.Count('id'),
+        rating_sum=models.Sum('rating'),
+        latest_review_at=models.Max('created_at'),
+        **buckets,
+    )
+    for row in rows:
+        key = (SUMMARY_KEYS.get(row.pop('content_type')), row['content_id'])
+        if key[0] is None:
+            continue
+        summary = summaries.get(key)
+        if summary is None:
+            summaries[key] = ReviewSummary(content_type=key[0], **row)
+            continue
+        # Songs reviewed as both 'song' and 'track'
+        for field, value in row.items():
+            if field == 'latest_review_at':
+                summary.latest_review_at = max(summary.latest_review_at, value)
+            elif field != 'content_id':
+                setattr(summary, field, getattr(summary, field) + value)
+    ReviewSummary.objects.bulk_create(summaries.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_review_unique_per_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_type', models.CharField(choices=[('album', 'Album'), ('track', 'Track'), ('artist', 'Artist')], max_length=10)),
+                ('content_id', models.PositiveIntegerField()),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.DecimalField(decimal_places=1, default=0, max_digits=12)),
+                ('latest_review_at', models.DateTimeField(blank=True, null=True)),
+                ('count_0', models.PositiveIntegerField(default=0)),
+                ('count_1', models.PositiveIntegerField(default=0)),
+                ('count_2', models.PositiveIntegerField(default=0)),
+                ('count_3', models.PositiveIntegerField(default=0)),
+                ('count_4', models.PositiveIntegerField(default=0)),
+                ('count_5', models.PositiveIntegerField(default=0)),
+                ('count_6', models.PositiveIntegerField(default=0)),
+                ('count_7', models.PositiveIntegerField(default=0)),
+                ('count_8', models.PositiveIntegerField(default=0)),
+                ('count_9', models.PositiveIntegerField(default=0)),
+                ('count_10', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('content_type', 'content_id'), name='core_reviewsummary_item')],
+            },
+        ),
+        migrations.RunPython(populate_review_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.5 on 2026-10-18 07:19
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+FAVORITE_COUNTERS = {
+    'album': 'favorite_albums',
+    'song': 'favorite_songs',
+    'artist': 'favorite_artists',
+}
+
+
+def populate_profile_counters(apps, schema_editor):
+    Profile = apps.get_model('core', 'Profile')
+    Review = apps.get_model('core', 'Review')
+    Favorite = apps.get_model('core', 'Favorite')
+
+    def counted(queryset):
+        rows = (
+            queryset.filter(user=models.OuterRef('user')).order_by()
+            .values('user').annotate(n=models.Count('id')).values('n')
+        )
+        return Coalesce(models.Subquery(rows, output_field=models.IntegerField()), models.Value(0))
+
+    updates = {'reviews': counted(Review.objects.all())}
+    for content_type, field in FAVORITE_COUNTERS.items():
+        updates[field] = counted(Favorite.objects.filter(content_type=content_type))
+    Profile.objects.update(**updates)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_reviewsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='favorite_albums',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='favorite_artists',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='favorite_songs',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(populate_profile_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.5 on 2026-10-18 07:29
+
+from django.db import migrations, models
+
+
+def delete_non_numeric_ids(apps, schema_editor):
+    """
+    Every searchable model has an integer primary key, so anything else
+    can't be resolved and would fail the column type change.
+    """
+    RecentSearch = apps.get_model('core', 'RecentSearch')
+    RecentSearch.objects.exclude(object_id__regex=r'^[0-9]+$').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_recommendation'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_non_numeric_ids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='recentsearch',
+            name='object_id',
+            field=models.PositiveBigIntegerField(),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.1.5 on 2026-10-18 07:31
+
+from django.db import migrations, models
+
+RECENT_SEARCH_LIMIT = 10
+JOB_TYPES = {
+    'artist': 'artist',
+    'album': 'album',
+    'track': 'song',
+}
+
+
+def copy_recent_searches(apps, schema_editor):
+    """
+    Copy each profile's most recent searches into its recent_search_items
+    list. Searches recorded against a pending ingest job are keyed by the
+    job's Spotify URI, and searches for deleted items are dropped.
+    """
+    Profile = apps.get_model('core', 'Profile')
+    RecentSearch = apps.get_model('core', 'RecentSearch')
+    IngestJob = apps.get_model('core', 'IngestJob')
+    models_by_type = {
+        'artist': apps.get_model('core', 'Artist'),
+        'album': apps.get_model('core', 'Album'),
+        'song': apps.get_model('core', 'Song'),
+    }
+    for profile in Profile.objects.filter(pk__in=RecentSearch.objects.values('profile')):
+        items = []
+        searches = RecentSearch.objects.filter(profile=profile).select_related('content_type').order_by('-searched_at')
+        for search in searches[:RECENT_SEARCH_LIMIT]:
+            model_name = search.content_type.model
+            at = search.searched_at.isoformat()
+            if model_name == 'ingestjob':
+                job = IngestJob.objects.filter(pk=search.object_id).first()
+                if job is not None:
+                    items.append({'type': JOB_TYPES[job.content_type], 'uri': job.spotify_uri, 'at': at})
+            elif model_name == 'profile':
+                if Profile.objects.filter(pk=search.object_id).exists():
+                    items.append({'type': 'profile', 'id': search.object_id, 'at': at})
+            elif model_name in models_by_type:
+                obj = models_by_type[model_name].objects.filter(pk=search.object_id).first()
+                if obj is not None:
+                    items.append({'type': model_name, 'id': obj.pk, 'uri': obj.spotify_uri, 'at': at})
+        Profile.objects.filter(pk=profile.pk).update(recent_search_items=items)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('core', '0023_recent_search_object_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='recent_search_items',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.RunPython(copy_recent_searches, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='RecentSearch',
+        ),
+    ]
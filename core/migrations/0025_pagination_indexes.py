@@ -0,0 +1,40 @@
+# Generated by Django 5.1.5 on 2026-10-18 07:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_profile_recent_search_items'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['genre', 'id'], name='core_album_genre_id'),
+        ),
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['user', 'id'], name='core_favorite_user_id'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['content_type', 'content_id', 'created_at', 'id'], name='core_review_item_created'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['created_at', 'id'], name='core_review_created_id'),
+        ),
+        # Superseded by the indexes above, which start with the same columns
+        migrations.RemoveIndex(
+            model_name='review',
+            name='core_review_item',
+        ),
+        migrations.RemoveIndex(
+            model_name='review',
+            name='core_review_created',
+        ),
+    ]
@@ -1,9 +1,30 @@
-from django.db import models
+import unicodedata
+from datetime import datetime
+
+from django.conf import settings
+from django.db import models, transaction
 from django.contrib.auth.models import User
-from django.contrib.contenttypes.fields import GenericForeignKey
-from django.contrib.contenttypes.models import ContentType
 from django.utils import timezone
 
+def normalize_search_text(*parts):
+    """
+    Lowercase, strip accents and punctuation, and collapse whitespace so text
+    can be matched against the catalog search index.
+    """
+    text = unicodedata.normalize('NFKD', ' '.join(part for part in parts if part))
+    text = ''.join(c if c.isalnum() else ' ' for c in text if not unicodedata.combining(c))
+    return ' '.join(text.lower().split())
+
+def with_search_text(objs):
+    """
+    Fill in search_text on instances about to be bulk created, since
+    bulk_create doesn't call save().
+    """
+    objs = list(objs)
+    for obj in objs:
+        obj.search_text = obj.build_search_text()
+    return objs
+
 class SearchableMixin:
     """
     A mixin that defines common properties for searchable items.
@@ -40,19 +61,70 @@ class SearchableMixin:
             return self.bio
         return None
 
-class RecentSearch(models.Model):
+class IngestJob(models.Model):
     """
-    Model to store recent searches for a profile
+    A queued import of a Spotify item, processed by `manage.py run_ingest_worker`.
+    Jobs are keyed by spotify_uri so enqueueing the same item twice is a no-op.
     """
-    profile = models.ForeignKey('Profile', on_delete=models.CASCADE, related_name='recent_searches')
-    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
-    object_id = models.CharField(max_length=255)
-    content_object = GenericForeignKey('content_type', 'object_id')
-    searched_at = models.DateTimeField(auto_now=True)
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    CONTENT_CHOICES = [
+        ('artist', 'Artist'),
+        ('album', 'Album'),
+        ('track', 'Track'),
+    ]
+    spotify_uri = models.CharField(max_length=255, unique=True)
+    content_type = models.CharField(max_length=10, choices=CONTENT_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    object_id = models.PositiveBigIntegerField(blank=True, null=True)  # ID of the imported row
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
 
     class Meta:
-        ordering = ['-searched_at']
-        unique_together = ('profile', 'content_type', 'object_id')
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.spotify_uri} ({self.status})"
+
+    @property
+    def search_title(self):
+        return self.spotify_uri
+
+    @property
+    def search_image(self):
+        return None
+
+    @property
+    def search_description(self):
+        return None
+
+    @property
+    def model(self):
+        return {'artist': Artist, 'album': Album, 'track': Song}[self.content_type]
+
+class RateLimitBucket(models.Model):
+    """
+    Shared token-bucket state for the database rate limit backend.
+    Times are Unix timestamps.
+    """
+    key = models.CharField(max_length=100, unique=True)
+    tokens = models.FloatField(default=0)
+    updated_at = models.FloatField(default=0)
+    paused_until = models.FloatField(default=0)
+
+    def __str__(self):
+        return self.key
 
 class Profile(models.Model, SearchableMixin):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -61,43 +133,147 @@ class Profile(models.Model, SearchableMixin):
     favorite_genres = models.JSONField(default=list, blank=True)  # Store genres as a list of strings
     reviews = models.IntegerField(default=0)
     friends = models.IntegerField(default=0)
+    favorite_albums = models.IntegerField(default=0)
+    favorite_songs = models.IntegerField(default=0)
+    favorite_artists = models.IntegerField(default=0)
+    username_key = models.CharField(max_length=150, blank=True, default='', editable=False)  # Lowercased username for autocomplete
+    # Most recent first, capped at RECENT_SEARCH_LIMIT; see add_recent_search
+    recent_search_items = models.JSONField(default=list, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Serves LIKE 'prefix%' lookups regardless of the database collation
+            models.Index(fields=['username_key'], name='core_profile_username_prefix',
+                         opclasses=['varchar_pattern_ops']),
+        ]
 
     def __str__(self):
         return self.user.username
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_favorite_genres = instance.__dict__.get('favorite_genres')
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.username_key = self.user.username.lower()
+        super().save(*args, **kwargs)
+
     def add_recent_search(self, obj):
         """
-        Add an object to recent searches
+        Add an object to the front of recent searches with a single UPDATE.
+        Items still being imported (IngestJob) are recorded by Spotify URI,
+        so they resolve to the imported row once it exists. Searching again
+        for what is already the most recent search writes nothing.
+
+        The list is rebuilt from this instance, so concurrent searches by the
+        same user can drop one another's entry.
+        """
+        entry = recent_search_entry(obj)
+        if entry is None:
+            return
+        items = self.recent_search_items or []
+        key = recent_search_key(entry)
+        if items and recent_search_key(items[0]) == key:
+            return
+        items = [entry] + [item for item in items if recent_search_key(item) != key]
+        self.recent_search_items = items[:settings.RECENT_SEARCH_LIMIT]
+        Profile.objects.filter(pk=self.pk).update(recent_search_items=self.recent_search_items)
+
+    def recent_searches(self):
+        """
+        Resolve recent searches with one query per content type.
+        Returns:
+            list: Dicts with the entry's 'type', 'uri' and 'searched_at', and
+            the resolved 'object', which is None for items still being
+            imported. Items that have since been deleted, and imports
+            that failed or were never queued, are left out.
         """
-        if isinstance(obj, (Song, Album, Artist, Profile)):
-            content_type = ContentType.objects.get_for_model(obj)
-            RecentSearch.objects.update_or_create(
-                profile=self,
-                content_type=content_type,
-                object_id=obj.id,
-                defaults={'searched_at': timezone.now()}
+        by_id = {name: set() for name in RECENT_SEARCH_MODELS}
+        by_uri = {name: set() for name in RECENT_SEARCH_MODELS}
+        for item in self.recent_search_items:
+            if 'id' in item:
+                by_id[item['type']].add(item['id'])
+            else:
+                by_uri[item['type']].add(item['uri'])
+
+        found = {}
+        for name, model in RECENT_SEARCH_MODELS.items():
+            if not by_id[name] and not by_uri[name]:
+                continue
+            queryset = model.objects.select_related('user') if model is Profile else model.objects.all()
+            lookup = models.Q(pk__in=by_id[name])
+            if by_uri[name]:
+                lookup |= models.Q(spotify_uri__in=by_uri[name])
+            for obj in queryset.filter(lookup):
+                found[(name, obj.pk)] = obj
+                if by_uri[name]:
+                    found[(name, obj.spotify_uri)] = obj
+
+        # URIs that haven't been imported yet are only shown while their
+        # ingest job can still succeed
+        unresolved = {
+            item['uri'] for item in self.recent_search_items
+            if 'id' not in item and (item['type'], item['uri']) not in found
+        }
+        pending = set()
+        if unresolved:
+            pending = set(
+                IngestJob.objects.filter(spotify_uri__in=unresolved).exclude(status=IngestJob.FAILED)
+                .values_list('spotify_uri', flat=True)
             )
-            # Keep only the 10 most recent searches
-            recent_searches = self.recent_searches.all()
-            if recent_searches.count() > 10:
-                recent_searches.last().delete()
+
+        searches = []
+        for item in self.recent_search_items:
+            obj = found.get((item['type'], item.get('id', item.get('uri'))))
+            if obj is None and ('id' in item or item['uri'] not in pending):
+                continue
+            searches.append({
+                'type': item['type'],
+                'uri': item.get('uri'),
+                'searched_at': datetime.fromisoformat(item['at']),
+                'object': obj,
+            })
+        return searches
+
 
 class Artist(models.Model, SearchableMixin):
     name = models.CharField(max_length=255)
     genre = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
     average_rating = models.DecimalField(max_digits=3, decimal_places=1, default=0.0)
+    rating_sum = models.DecimalField(max_digits=12, decimal_places=1, default=0, editable=False)  # Running total of review ratings
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
     image = models.URLField(max_length=500, blank=True, null=True)
-    spotify_uri = models.CharField(max_length=255, blank=True, null=True)
+    spotify_uri = models.CharField(max_length=255, blank=True, null=True, unique=True)
+    search_text = models.TextField(blank=True, default='', editable=False)  # Normalized text for catalog search
+    synced_at = models.DateTimeField(auto_now=True, null=True)  # Last written from Spotify or an edit
 
     def __str__(self):
         return self.name
-    
-    def calculate_average_rating(self):
-        reviews = Review.objects.filter(content_type='artist', content_id=self.id)
-        if reviews.exists():
-            self.average_rating = reviews.aggregate(models.Avg('rating'))['rating__avg']
-            self.save()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_name = instance.__dict__.get('name')
+        return instance
+
+    def build_search_text(self):
+        return normalize_search_text(self.name)
+
+    def save(self, *args, **kwargs):
+        self.search_text = self.build_search_text()
+        super().save(*args, **kwargs)
+        # Albums and songs are indexed under their artist's name
+        if getattr(self, '_loaded_name', self.name) != self.name:
+            for model in (Album, Song):
+                items = list(model.objects.filter(artist=self))
+                for item in items:
+                    item.artist = self
+                    item.search_text = item.build_search_text()
+                model.objects.bulk_update(items, ['search_text'], batch_size=500)
+        self._loaded_name = self.name
 
 class Album(models.Model, SearchableMixin):
     title = models.CharField(max_length=255)
@@ -106,22 +282,28 @@ class Album(models.Model, SearchableMixin):
     release_date = models.DateField()
     cover_art = models.URLField(max_length=500, blank=True, null=True)
     average_rating = models.DecimalField(max_digits=3, decimal_places=1, default=0.0)
+    rating_sum = models.DecimalField(max_digits=12, decimal_places=1, default=0, editable=False)  # Running total of review ratings
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
     tracks = models.PositiveIntegerField(default=0)
-    spotify_uri = models.CharField(max_length=255, blank=True, null=True)
+    spotify_uri = models.CharField(max_length=255, blank=True, null=True, unique=True)
+    search_text = models.TextField(blank=True, default='', editable=False)  # Normalized text for catalog search
+    synced_at = models.DateTimeField(auto_now=True, null=True)  # Last written from Spotify or an edit
+
+    class Meta:
+        indexes = [
+            # Pages through a genre filter newest first
+            models.Index(fields=['genre', 'id'], name='core_album_genre_id'),
+        ]
 
     def __str__(self):
         return self.title
 
-    def calculate_average_rating(self):
-        reviews = Review.objects.filter(content_type='album', content_id=self.id)
-        print(f"Number of reviews: {reviews.count()}")
+    def build_search_text(self):
+        return normalize_search_text(self.title, self.artist.name)
 
-        for review in reviews:
-            print(f"Review score: {review.rating}")
-            print(f"Review text: {review.review_text}")
-        if reviews.exists():
-            self.average_rating = reviews.aggregate(models.Avg('rating'))['rating__avg']
-            self.save()
+    def save(self, *args, **kwargs):
+        self.search_text = self.build_search_text()
+        super().save(*args, **kwargs)
 
 class Song(models.Model, SearchableMixin):
     title = models.CharField(max_length=255)
@@ -129,17 +311,47 @@ class Song(models.Model, SearchableMixin):
     album = models.ForeignKey(Album, on_delete=models.CASCADE, related_name="songs", blank=True, null=True)
     duration = models.DurationField()
     average_rating = models.DecimalField(max_digits=3, decimal_places=1, default=0.0)
+    rating_sum = models.DecimalField(max_digits=12, decimal_places=1, default=0, editable=False)  # Running total of review ratings
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
     image = models.URLField(max_length=500, blank=True, null=True)
-    spotify_uri = models.CharField(max_length=255, blank=True, null=True)
+    spotify_uri = models.CharField(max_length=255, blank=True, null=True, unique=True)
+    search_text = models.TextField(blank=True, default='', editable=False)  # Normalized text for catalog search
+    synced_at = models.DateTimeField(auto_now=True, null=True)  # Last written from Spotify or an edit
 
     def __str__(self):
         return self.title
 
-    def calculate_average_rating(self):
-        reviews = Review.objects.filter(content_type='song', content_id=self.id)
-        if reviews.exists():
-            self.average_rating = reviews.aggregate(models.Avg('rating'))['rating__avg']
-            self.save()
+    def build_search_text(self):
+        return normalize_search_text(self.title, self.artist.name)
+
+    def save(self, *args, **kwargs):
+        self.search_text = self.build_search_text()
+        super().save(*args, **kwargs)
+
+# Models that can appear in recent searches, by entry type
+RECENT_SEARCH_MODELS = {
+    'album': Album,
+    'song': Song,
+    'artist': Artist,
+    'profile': Profile,
+}
+
+def recent_search_entry(obj):
+    """
+    The compact recent-search entry for a searchable object, or None.
+    """
+    at = timezone.now().isoformat()
+    if isinstance(obj, IngestJob):
+        return {'type': obj.model.__name__.lower(), 'uri': obj.spotify_uri, 'at': at}
+    if isinstance(obj, (Song, Album, Artist)):
+        return {'type': type(obj).__name__.lower(), 'id': obj.pk, 'uri': obj.spotify_uri, 'at': at}
+    if isinstance(obj, Profile):
+        return {'type': 'profile', 'id': obj.pk, 'at': at}
+    return None
+
+def recent_search_key(entry):
+    # A pending item and its imported row share a URI
+    return entry.get('uri') or f"{entry['type']}:{entry['id']}"
 
 class Review(models.Model):
     CONTENT_CHOICES = [
@@ -154,9 +366,96 @@ class Review(models.Model):
     review_text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # One review per user and item; submitting again overwrites it
+            models.UniqueConstraint(fields=['user', 'content_type', 'content_id'], name='core_review_unique_per_user'),
+        ]
+        indexes = [
+            # Looks up an item's reviews when recomputing its rating totals,
+            # and pages through them newest first
+            models.Index(fields=['content_type', 'content_id', 'created_at', 'id'], name='core_review_item_created'),
+            # Pages through all reviews newest first
+            models.Index(fields=['created_at', 'id'], name='core_review_created_id'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.content_type} ({self.content_id})"
 
+    def save(self, *args, **kwargs):
+        # Rating totals and the author's review count are updated by a
+        # post_save signal; keep them in the same transaction as the write
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What the reviewed item's rating totals currently count for this review
+        instance._loaded_rating = tuple(instance.__dict__.get(f) for f in ('content_type', 'content_id', 'rating'))
+        return instance
+
+class ReviewSummary(models.Model):
+    """
+    Maintained rating distribution for one reviewed item.
+    count_N is the number of ratings that round to N half-stars, so count_9
+    holds the 4.5-star ratings. Songs are summarized under 'track'.
+    """
+    content_type = models.CharField(max_length=10, choices=Review.CONTENT_CHOICES)
+    content_id = models.PositiveIntegerField()
+    total = models.PositiveIntegerField(default=0)
+    rating_sum = models.DecimalField(max_digits=12, decimal_places=1, default=0)
+    latest_review_at = models.DateTimeField(blank=True, null=True)
+    count_0 = models.PositiveIntegerField(default=0)
+    count_1 = models.PositiveIntegerField(default=0)
+    count_2 = models.PositiveIntegerField(default=0)
+    count_3 = models.PositiveIntegerField(default=0)
+    count_4 = models.PositiveIntegerField(default=0)
+    count_5 = models.PositiveIntegerField(default=0)
+    count_6 = models.PositiveIntegerField(default=0)
+    count_7 = models.PositiveIntegerField(default=0)
+    count_8 = models.PositiveIntegerField(default=0)
+    count_9 = models.PositiveIntegerField(default=0)
+    count_10 = models.PositiveIntegerField(default=0)
+
+    BUCKETS = range(11)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['content_type', 'content_id'], name='core_reviewsummary_item'),
+        ]
+
+    def __str__(self):
+        return f"{self.content_type} ({self.content_id}): {self.total} reviews"
+
+    @property
+    def average(self):
+        return self.rating_sum / self.total if self.total else 0
+
+    @property
+    def histogram(self):
+        """Rating ("0.0" to "5.0") -> number of reviews"""
+        return {f"{bucket / 2:.1f}": getattr(self, f'count_{bucket}') for bucket in self.BUCKETS}
+
+class Recommendation(models.Model):
+    """
+    A precomputed album recommendation for a user, built offline by
+    `manage.py build_recommendations`. rank 0 is the best match.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="recommendations")
+    album = models.ForeignKey('Album', on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'album'], name='core_recommendation_user_album'),
+        ]
+        indexes = [models.Index(fields=['user', 'rank'], name='core_recommendation_rank')]
+
+    def __str__(self):
+        return f"#{self.rank} for {self.user_id}: album {self.album_id}"
+
 class Favorite(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="favorites")
     content_type = models.CharField(max_length=10, choices=[('album', 'Album'), ('song', 'Song'), ('artist', 'Artist')])
@@ -164,10 +463,26 @@ class Favorite(models.Model):
 
     class Meta:
         unique_together = ('user', 'content_type', 'content_id')
-        
+        indexes = [
+            # Pages through a user's favorites newest first
+            models.Index(fields=['user', 'id'], name='core_favorite_user_id'),
+        ]
+
     def __str__(self):
         return f"{self.user.username}'s favorite {self.content_type}: {self.content_id}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_content_type = instance.__dict__.get('content_type')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # The profile's favorite counters are updated by a post_save signal;
+        # keep them in the same transaction as the write
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 
 
 
@@ -0,0 +1,45 @@
+"""
+Keyset (cursor) pagination for list endpoints.
+
+Each page is fetched with a WHERE on the ordering column from an opaque
+cursor rather than an OFFSET, so deep pages cost the same as the first. Every
+ordering used here is backed by an index that starts with the view's filter
+columns and ends with the ordering columns.
+"""
+from rest_framework.pagination import CursorPagination
+
+from .search import CatalogSearchFilter
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Newest rows first, by primary key. The default for every list endpoint.
+    """
+    ordering = '-id'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if is_ranked_search(request, view):
+            # Already ranked and capped at CatalogSearchFilter.max_results,
+            # so return them as a single page in rank order
+            self.request = request
+            self.has_next = self.has_previous = False
+            self.page = list(queryset)
+            return self.page
+        return super().paginate_queryset(queryset, request, view)
+
+
+class ReviewPagination(KeysetPagination):
+    """
+    Newest reviews first; the id breaks ties between equal timestamps.
+    """
+    ordering = ('-created_at', '-id')
+
+
+def is_ranked_search(request, view):
+    backends = getattr(view, 'filter_backends', [])
+    return (
+        any(issubclass(backend, CatalogSearchFilter) for backend in backends)
+        and bool(request.query_params.get(CatalogSearchFilter.search_param, '').strip())
+    )
@@ -0,0 +1,182 @@
+"""
+Token-bucket rate limiting for Spotify requests, shared by every worker.
+"""
+import contextlib
+import contextvars
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+_priority = contextvars.ContextVar('spotify_priority', default=INTERACTIVE)
+
+
+@contextlib.contextmanager
+def request_priority(priority):
+    """
+    Run the enclosed Spotify calls at the given priority, e.g.
+    `with request_priority(BACKGROUND): create_resource(...)`.
+    """
+    reset_token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(reset_token)
+
+
+def current_priority():
+    return _priority.get()
+
+
+def take_token(state, now, rate, capacity, reserve):
+    """
+    Refill a bucket state dict and try to take one token from it, leaving at
+    least `reserve` tokens behind. Updates the state in place.
+    Returns:
+        float: 0 if a token was taken, otherwise seconds until one is available
+    """
+    if state['paused_until'] > now:
+        return state['paused_until'] - now
+
+    state['tokens'] = min(capacity, state['tokens'] + (now - state['updated_at']) * rate)
+    state['updated_at'] = now
+    if state['tokens'] - 1 >= reserve:
+        state['tokens'] -= 1
+        return 0
+    return (reserve + 1 - state['tokens']) / rate
+
+
+class CacheBackend:
+    """
+    Keeps bucket state in a Django cache, guarded by a short cache lock.
+    The pause deadline has its own key, so setting it never races with a
+    bucket update.
+    """
+    lock_timeout = 1
+
+    @property
+    def cache(self):
+        return caches[settings.SPOTIFY_RATE_LIMIT_CACHE]
+
+    def acquire(self, key, rate, capacity, reserve):
+        lock_key = f"{key}:lock"
+        if not self.cache.add(lock_key, True, self.lock_timeout):
+            # Someone else is updating the bucket, try again shortly
+            return 0.01
+        try:
+            now = time.time()
+            stored = self.cache.get_many([key, f"{key}:paused"])
+            state = stored.get(key) or {'tokens': capacity, 'updated_at': now}
+            state['paused_until'] = stored.get(f"{key}:paused", 0)
+            wait = take_token(state, now, rate, capacity, reserve)
+            self.cache.set(key, {'tokens': state['tokens'], 'updated_at': state['updated_at']}, None)
+            return wait
+        finally:
+            self.cache.delete(lock_key)
+
+    def pause(self, key, until):
+        pause_key = f"{key}:paused"
+        until = max(self.cache.get(pause_key, 0), until)
+        self.cache.set(pause_key, until, max(until - time.time(), 1))
+
+
+class DatabaseBackend:
+    """
+    Keeps bucket state in a RateLimitBucket row, locked with SELECT FOR UPDATE.
+    """
+    def get_bucket(self, key, capacity):
+        from .models import RateLimitBucket
+
+        bucket = RateLimitBucket.objects.select_for_update().filter(key=key).first()
+        if bucket is None:
+            RateLimitBucket.objects.get_or_create(key=key, defaults={'tokens': capacity, 'updated_at': time.time()})
+            bucket = RateLimitBucket.objects.select_for_update().get(key=key)
+        return bucket
+
+    def acquire(self, key, rate, capacity, reserve):
+        with transaction.atomic():
+            bucket = self.get_bucket(key, capacity)
+            state = {'tokens': bucket.tokens, 'updated_at': bucket.updated_at, 'paused_until': bucket.paused_until}
+            wait = take_token(state, time.time(), rate, capacity, reserve)
+            bucket.tokens = state['tokens']
+            bucket.updated_at = state['updated_at']
+            bucket.save(update_fields=['tokens', 'updated_at'])
+            return wait
+
+    def pause(self, key, until):
+        with transaction.atomic():
+            bucket = self.get_bucket(key, 0)
+            if until > bucket.paused_until:
+                bucket.paused_until = until
+                bucket.save(update_fields=['paused_until'])
+
+
+BACKENDS = {
+    'cache': CacheBackend,
+    'database': DatabaseBackend,
+}
+
+
+class RateLimited(Exception):
+    """
+    Raised when no request slot became available within the caller's wait budget.
+    """
+
+
+class SpotifyRateLimiter:
+    """
+    Token bucket around all Spotify calls, coordinated through the backend
+    named by SPOTIFY_RATE_LIMIT_BACKEND so every worker draws from one quota.
+
+    Interactive requests may use the whole bucket. Background requests leave
+    SPOTIFY_RATE_LIMIT_BACKGROUND_RESERVE of it for interactive traffic and
+    are willing to wait longer for a slot. After a 429, pause() stops every
+    worker until Spotify's Retry-After has passed.
+    """
+    key = 'spotify:ratelimit'
+
+    def __init__(self):
+        self._backends = {}
+
+    @property
+    def backend(self):
+        name = settings.SPOTIFY_RATE_LIMIT_BACKEND
+        if name not in self._backends:
+            self._backends[name] = BACKENDS[name]()
+        return self._backends[name]
+
+    def acquire(self, priority=None):
+        """
+        Block until a request slot is available.
+        Raises:
+            RateLimited: If the wait would exceed the priority's wait budget
+        """
+        priority = priority or current_priority()
+        rate = settings.SPOTIFY_RATE_LIMIT_RATE
+        capacity = settings.SPOTIFY_RATE_LIMIT_BURST
+        reserve = capacity * settings.SPOTIFY_RATE_LIMIT_BACKGROUND_RESERVE if priority == BACKGROUND else 0
+        deadline = time.time() + settings.SPOTIFY_RATE_LIMIT_MAX_WAIT[priority]
+
+        while True:
+            wait = self.backend.acquire(self.key, rate, capacity, reserve)
+            if wait <= 0:
+                return
+            if time.time() + wait > deadline:
+                raise RateLimited(f"No Spotify request slot available for {priority} request")
+            self.sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Stop all workers from calling Spotify for the given number of seconds.
+        """
+        self.backend.pause(self.key, time.time() + seconds)
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+rate_limiter = SpotifyRateLimiter()
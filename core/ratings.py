@@ -0,0 +1,407 @@
+"""
+Running review totals on Artist, Album and Song.
+
+Each item keeps rating_sum and rating_count, adjusted with F() expressions
+whenever a review is created, changed or deleted (see signals.py), and
+average_rating is re-derived from them in the same UPDATE. Nothing here
+reads the item's reviews, so a new review costs the same however many the
+item already has. reconcile_ratings() recounts from the reviews table to
+repair any drift, and recompute_ratings() rewrites totals in bulk with one
+set-based UPDATE per batch of items. Batch review upserts, which bypass
+the signals, recompute the totals of the items they touch.
+
+Each reviewed item also has a ReviewSummary row with its rating histogram
+and latest review time, maintained the same way, so item pages read one
+row instead of scanning reviews.
+"""
+import logging
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    Avg, Case, Count, DecimalField, F, FloatField, IntegerField, Max, Min, OuterRef, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Cast, Coalesce, Greatest
+
+from .counters import recount_reviews
+from .models import Artist, Album, Song, Review, ReviewSummary
+from .recommendations import invalidate_recommendations
+
+logger = logging.getLogger(__name__)
+
+# Review.content_type -> reviewed model. Songs are reviewed as 'track';
+# 'song' is accepted for older rows.
+REVIEWED_MODELS = {
+    'album': Album,
+    'track': Song,
+    'song': Song,
+    'artist': Artist,
+}
+
+
+def content_types_for(model):
+    return [content_type for content_type, reviewed in REVIEWED_MODELS.items() if reviewed is model]
+
+
+def rating_update(delta_sum, delta_count):
+    """
+    Column updates that add delta_sum/delta_count to an item's totals and
+    recompute its average from the new totals.
+    """
+    total = F('rating_sum') + delta_sum
+    count = F('rating_count') + delta_count
+    return {
+        'rating_sum': total,
+        'rating_count': count,
+        'average_rating': Case(
+            When(rating_count__lte=-delta_count, then=Value(0.0)),
+            default=Cast(total, FloatField()) / count,
+            output_field=FloatField(),
+        ),
+    }
+
+
+def adjust_rating(content_type, content_id, delta_sum, delta_count):
+    """
+    Apply a change in one item's review totals with a single UPDATE.
+    Args:
+        content_type (str): Review content type ('album', 'track', 'artist')
+        content_id (int): ID of the reviewed item
+        delta_sum (Decimal): Change in the sum of ratings
+        delta_count (int): Change in the number of reviews
+    """
+    model = REVIEWED_MODELS.get(content_type)
+    if model is None or (not delta_sum and not delta_count):
+        return
+    model.objects.filter(pk=content_id).update(**rating_update(delta_sum, delta_count))
+
+
+def summary_key(content_type):
+    """
+    Content type a review's item is summarized under ('song' -> 'track').
+    """
+    model = REVIEWED_MODELS.get(content_type)
+    return 'track' if model is Song else (content_type if model else None)
+
+
+def rating_bucket(rating):
+    """
+    Histogram bucket of a rating: the number of half-stars it rounds to.
+    """
+    half_stars = int((Decimal(rating) * 2).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+    return min(max(half_stars, 0), len(ReviewSummary.BUCKETS) - 1)
+
+
+def adjust_summary(content_type, content_id, buckets, delta_sum, delta_count, reviewed_at=None):
+    """
+    Apply a change to one item's review summary with a single UPDATE,
+    creating the row the first time the item is reviewed.
+    Args:
+        content_type (str): Review content type
+        content_id (int): ID of the reviewed item
+        buckets (dict): Histogram bucket -> change in its count
+        delta_sum (Decimal): Change in the sum of ratings
+        delta_count (int): Change in the number of reviews
+        reviewed_at (datetime): Time of an added review
+    """
+    key = summary_key(content_type)
+    if key is None:
+        return
+    updates = {f'count_{bucket}': F(f'count_{bucket}') + change for bucket, change in buckets.items() if change}
+    if delta_count:
+        updates['total'] = F('total') + delta_count
+    if delta_sum:
+        updates['rating_sum'] = F('rating_sum') + delta_sum
+    if reviewed_at is not None:
+        updates['latest_review_at'] = Greatest(Coalesce('latest_review_at', Value(reviewed_at)), Value(reviewed_at))
+    elif delta_count < 0:
+        # The latest review may be the one that went; look up the newest left
+        updates['latest_review_at'] = Subquery(
+            Review.objects.filter(content_type__in=content_types_for(REVIEWED_MODELS[content_type]),
+                                  content_id=content_id)
+            .order_by('-created_at').values('created_at')[:1]
+        )
+    if not updates:
+        return
+    summary = ReviewSummary.objects.filter(content_type=key, content_id=content_id)
+    if not summary.update(**updates) and delta_count > 0:
+        ReviewSummary.objects.bulk_create([ReviewSummary(content_type=key, content_id=content_id)], ignore_conflicts=True)
+        summary.update(**updates)
+
+
+def record_review_change(previous, current, reviewed_at=None):
+    """
+    Update item totals and summaries for a review being added, edited, moved
+    to another item or deleted.
+    Args:
+        previous (tuple): (content_type, content_id, rating) the review was
+            counted under, or None if it's new
+        current (tuple): (content_type, content_id, rating) it should now be
+            counted under, or None if it was deleted
+        reviewed_at (datetime): When the review was created
+    """
+    if previous is not None and current is not None and previous[:2] == current[:2]:
+        content_type, content_id, rating = current
+        delta = rating - previous[2]
+        if delta:
+            adjust_rating(content_type, content_id, delta, 0)
+            adjust_summary(content_type, content_id, {rating_bucket(previous[2]): -1, rating_bucket(rating): 1},
+                           delta, 0)
+        return
+    if previous is not None:
+        content_type, content_id, rating = previous
+        adjust_rating(content_type, content_id, -rating, -1)
+        adjust_summary(content_type, content_id, {rating_bucket(rating): -1}, -rating, -1)
+    if current is not None:
+        content_type, content_id, rating = current
+        adjust_rating(content_type, content_id, rating, 1)
+        adjust_summary(content_type, content_id, {rating_bucket(rating): 1}, rating, 1, reviewed_at)
+
+
+def recompute_item_summaries(items):
+    """
+    Rebuild the review summaries of specific items from their reviews.
+    Args:
+        items (iterable): (content_type, content_id) pairs as stored on reviews
+    """
+    ids_by_key = {}
+    for content_type, content_id in items:
+        key = summary_key(content_type)
+        if key is not None:
+            ids_by_key.setdefault(key, set()).add(content_id)
+    summaries = []
+    for key, ids in ids_by_key.items():
+        rows = {
+            row['content_id']: row
+            for row in Review.objects.filter(
+                content_type__in=content_types_for(REVIEWED_MODELS[key]), content_id__in=ids
+            ).values('content_id').annotate(
+                total=Count('id'),
+                rating_sum=Sum('rating'),
+                latest_review_at=Max('created_at'),
+                **{
+                    f'count_{bucket}': Count('id', filter=bucket_filter(bucket))
+                    for bucket in ReviewSummary.BUCKETS
+                },
+            )
+        }
+        for content_id in ids:
+            row = rows.get(content_id, {'content_id': content_id, 'total': 0, 'rating_sum': 0})
+            summaries.append(ReviewSummary(content_type=key, **row))
+    ReviewSummary.objects.bulk_create(
+        summaries,
+        update_conflicts=True,
+        unique_fields=['content_type', 'content_id'],
+        update_fields=['total', 'rating_sum', 'latest_review_at', *(f'count_{b}' for b in ReviewSummary.BUCKETS)],
+    )
+
+
+def bucket_filter(bucket):
+    """
+    Filter matching the ratings that fall in a histogram bucket.
+    """
+    condition = Q()
+    if bucket > 0:
+        condition &= Q(rating__gte=Decimal(bucket) / 2 - Decimal('0.25'))
+    if bucket < len(ReviewSummary.BUCKETS) - 1:
+        condition &= Q(rating__lt=Decimal(bucket) / 2 + Decimal('0.25'))
+    return condition
+
+
+def average(total, count):
+    if not count:
+        return Decimal('0.0')
+    # Rounds like Postgres does when storing into average_rating
+    return (Decimal(total) / count).quantize(Decimal('0.1'), rounding=ROUND_HALF_UP)
+
+
+def reconcile_ratings(batch_size=1000, dry_run=False):
+    """
+    Recount every item's rating totals from its reviews and fix those that
+    have drifted.
+    Args:
+        batch_size (int): Number of items checked per query
+        dry_run (bool): Only count drifted items, don't write
+    Returns:
+        dict: Model name -> number of items whose totals were wrong
+    """
+    repaired = {}
+    for model in (Artist, Album, Song):
+        repaired[model.__name__] = 0
+        last_pk = 0
+        while True:
+            items = list(
+                model.objects.filter(pk__gt=last_pk).order_by('pk')
+                .only('rating_sum', 'rating_count', 'average_rating')[:batch_size]
+            )
+            if not items:
+                break
+            last_pk = items[-1].pk
+            totals = {
+                row['content_id']: row
+                for row in Review.objects.filter(
+                    content_type__in=content_types_for(model),
+                    content_id__in=[item.pk for item in items],
+                ).values('content_id').annotate(total=Sum('rating'), count=Count('id'))
+            }
+            drifted = []
+            for item in items:
+                row = totals.get(item.pk, {'total': Decimal('0'), 'count': 0})
+                total, count = Decimal(row['total'] or 0), row['count']
+                expected = (total, count, average(total, count))
+                if (item.rating_sum, item.rating_count, item.average_rating) != expected:
+                    item.rating_sum, item.rating_count, item.average_rating = expected
+                    drifted.append(item)
+            if drifted and not dry_run:
+                model.objects.bulk_update(drifted, ['rating_sum', 'rating_count', 'average_rating'])
+            repaired[model.__name__] += len(drifted)
+        if repaired[model.__name__]:
+            logger.warning('%d %s rating totals had drifted', repaired[model.__name__], model.__name__)
+    return repaired
+
+
+def review_aggregate(model, aggregate, output_field):
+    """
+    Correlated subquery computing an aggregate over the reviews of the item
+    being updated, or 0 if it has none.
+    """
+    reviews = (
+        Review.objects.filter(content_type__in=content_types_for(model), content_id=OuterRef('pk'))
+        .order_by().values('content_id').annotate(value=aggregate).values('value')
+    )
+    return Coalesce(Subquery(reviews, output_field=output_field), Value(0), output_field=output_field)
+
+
+def recomputed_columns(model):
+    """
+    Column updates that set an item's rating totals from its reviews.
+    """
+    return {
+        'rating_sum': review_aggregate(model, Sum('rating'), DecimalField(max_digits=12, decimal_places=1)),
+        'rating_count': review_aggregate(model, Count('id'), IntegerField()),
+        'average_rating': review_aggregate(model, Avg('rating'), DecimalField(max_digits=3, decimal_places=1)),
+    }
+
+
+def recompute_item_ratings(items):
+    """
+    Recompute the totals of specific items, one UPDATE per model.
+    Args:
+        items (iterable): (content_type, content_id) pairs as stored on reviews
+    """
+    ids_by_model = {}
+    for content_type, content_id in items:
+        model = REVIEWED_MODELS.get(content_type)
+        if model is not None:
+            ids_by_model.setdefault(model, set()).add(content_id)
+    for model, ids in ids_by_model.items():
+        model.objects.filter(pk__in=ids).update(**recomputed_columns(model))
+
+
+def save_review(data):
+    """
+    Create or overwrite one user's review of an item.
+
+    The existing review, if any, is locked and saved in place, so the
+    post_save signal applies the change in rating to the item's totals and
+    summary as a delta and only a new review bumps the author's count.
+    Nothing reads the item's other reviews. Batches go through
+    upsert_reviews instead.
+    Args:
+        data (dict): Review fields, including user
+    Returns:
+        Review: The stored review
+    """
+    lookup = {field: data[field] for field in ('user', 'content_type', 'content_id')}
+    with transaction.atomic():
+        review = Review.objects.select_for_update().filter(**lookup).first()
+        if review is None:
+            try:
+                with transaction.atomic():
+                    return Review.objects.create(**data)
+            except IntegrityError:
+                # Another request created it since we looked
+                review = Review.objects.select_for_update().get(**lookup)
+        for field, value in data.items():
+            setattr(review, field, value)
+        review.save()
+    return review
+
+
+def upsert_reviews(reviews):
+    """
+    Create or overwrite a batch of reviews with a single INSERT ... ON
+    CONFLICT on (user, content_type, content_id), then recompute the
+    reviewed items' totals. Later entries for the same item win. Single
+    reviews go through save_review, which adjusts instead.
+
+    The upsert doesn't tell us which rows it replaced or what their old
+    ratings were, so the totals and summaries are recomputed from the
+    (indexed) reviews of each touched item, and the authors' review counts
+    from their reviews, rather than adjusted.
+    Args:
+        reviews (iterable): Dicts of Review fields, including user
+    Returns:
+        list: The stored Review rows, one per distinct item, in input order
+    """
+    latest = {}
+    for data in reviews:
+        review = Review(**data)
+        latest.pop((review.user_id, review.content_type, review.content_id), None)
+        latest[(review.user_id, review.content_type, review.content_id)] = review
+    with transaction.atomic():
+        Review.objects.bulk_create(
+            latest.values(),
+            update_conflicts=True,
+            unique_fields=['user', 'content_type', 'content_id'],
+            update_fields=['rating', 'review_text'],
+        )
+        items = [(content_type, content_id) for _, content_type, content_id in latest]
+        recompute_item_ratings(items)
+        recompute_item_summaries(items)
+        recount_reviews({user_id for user_id, _, _ in latest})
+        invalidate_recommendations(*{user_id for user_id, _, _ in latest})
+    # Replaced rows keep their original created_at, so read back what was stored
+    stored = Review.objects.in_bulk([review.pk for review in latest.values()])
+    return [stored[review.pk] for review in latest.values()]
+
+
+def recompute_ratings(models=(Artist, Album, Song), since=None, batch_size=10000, progress=None):
+    """
+    Rewrite rating totals from the reviews table with set-based UPDATEs.
+
+    Items are processed in batches of batch_size IDs, each with a single
+    UPDATE whose sum, count and average come from grouped subqueries, so no
+    rows are loaded into Python.
+    Args:
+        models (iterable): Models to recompute
+        since (datetime): Only recompute items reviewed at or after this time
+        batch_size (int): Number of IDs per UPDATE
+        progress (callable): Called as progress(model, done, total) after each
+            batch, with done/total counted in IDs
+    Returns:
+        dict: Model name -> number of rows updated
+    """
+    updates = {}
+    for model in models:
+        updated = 0
+        columns = recomputed_columns(model)
+        if since is not None:
+            ids = sorted(set(
+                Review.objects.filter(content_type__in=content_types_for(model), created_at__gte=since)
+                .values_list('content_id', flat=True)
+            ))
+            for start in range(0, len(ids), batch_size):
+                updated += model.objects.filter(pk__in=ids[start:start + batch_size]).update(**columns)
+                if progress:
+                    progress(model, min(start + batch_size, len(ids)), len(ids))
+        else:
+            bounds = model.objects.aggregate(low=Min('pk'), high=Max('pk'))
+            if bounds['low'] is not None:
+                total = bounds['high'] - bounds['low'] + 1
+                for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+                    updated += model.objects.filter(pk__gte=start, pk__lt=start + batch_size).update(**columns)
+                    if progress:
+                        progress(model, min(start + batch_size - bounds['low'], total), total)
+        updates[model.__name__] = updated
+    return updates
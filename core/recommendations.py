@@ -0,0 +1,265 @@
+"""
+Offline item-item collaborative filtering for album recommendations.
+
+build_recommendations() loads album reviews and favorites into a sparse
+user x album matrix, held as CSR-style NumPy arrays indexed both by user and
+by album. Each album's top-K most similar albums are found by cosine
+similarity over the users who interacted with it, and each user's unseen
+albums are scored by summing the similarities of the albums they liked.
+The results replace the Recommendation table, so RecommendationView only
+has to read one user's rows.
+
+Each user's serialized recommendations are also cached, so repeat requests
+are a single cache read. The cache entry is dropped once a write that
+changes the user's recommendations commits (see signals.py).
+"""
+import logging
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import Album, Favorite, Profile, Recommendation, Review
+
+logger = logging.getLogger(__name__)
+
+# Ratings are scaled by this to weigh reviews against favorites (weight 1)
+MAX_RATING = 5.0
+
+
+class InteractionMatrix:
+    """
+    Sparse user x album matrix. Row i of the by-user view is
+    items[user_ptr[i]:user_ptr[i + 1]] with weights user_values[...], and the
+    by-album view is laid out the same way.
+    """
+    def __init__(self, user_index, item_index, values, user_ids, item_ids):
+        self.user_ids = user_ids
+        self.item_ids = item_ids
+        self.user_ptr, self.user_items, self.user_values = compress(user_index, item_index, values, len(user_ids))
+        self.item_ptr, self.item_users, self.item_values = compress(item_index, user_index, values, len(item_ids))
+        self.item_norms = np.sqrt(np.bincount(item_index, weights=values ** 2, minlength=len(item_ids)))
+
+    @classmethod
+    def from_interactions(cls, interactions):
+        """
+        Args:
+            interactions (dict): (user_id, album_id) -> weight
+        """
+        if not interactions:
+            empty = np.zeros(0, dtype=np.int64)
+            return cls(empty, empty, np.zeros(0), empty, empty)
+        pairs = np.array(list(interactions.keys()), dtype=np.int64)
+        values = np.fromiter(interactions.values(), dtype=np.float64, count=len(interactions))
+        user_ids, user_index = np.unique(pairs[:, 0], return_inverse=True)
+        item_ids, item_index = np.unique(pairs[:, 1], return_inverse=True)
+        return cls(user_index, item_index, values, user_ids, item_ids)
+
+    def user_row(self, user):
+        span = slice(self.user_ptr[user], self.user_ptr[user + 1])
+        return self.user_items[span], self.user_values[span]
+
+    def item_column(self, item):
+        span = slice(self.item_ptr[item], self.item_ptr[item + 1])
+        return self.item_users[span], self.item_values[span]
+
+
+def compress(major, minor, values, size):
+    """
+    Sort COO entries by `major` into CSR arrays (indptr, indices, values).
+    """
+    order = np.argsort(major, kind='stable')
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(major, minlength=size), out=indptr[1:])
+    return indptr, minor[order], values[order]
+
+
+def gather_rows(indptr, rows):
+    """
+    Positions of every entry in the given CSR rows, and for each position the
+    index (into `rows`) of the row it belongs to.
+    """
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    owner = np.repeat(np.arange(len(rows)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + offsets, owner
+
+
+def load_interactions():
+    """
+    Read album reviews and favorites as implicit feedback.
+    Returns:
+        dict: (user_id, album_id) -> weight; a favorite counts as 1 and a
+        review as rating / MAX_RATING, taking the larger if both exist
+    """
+    album_ids = set(Album.objects.values_list('pk', flat=True))
+    interactions = {}
+    reviews = Review.objects.filter(content_type='album').values_list('user_id', 'content_id', 'rating')
+    for user_id, album_id, rating in reviews.iterator():
+        if album_id in album_ids:
+            interactions[(user_id, album_id)] = float(rating) / MAX_RATING
+    favorites = Favorite.objects.filter(content_type='album').values_list('user_id', 'content_id')
+    for user_id, album_id in favorites.iterator():
+        if album_id in album_ids:
+            interactions[(user_id, album_id)] = 1.0
+    return interactions
+
+
+def item_neighbors(matrix, k):
+    """
+    Top-k most similar albums for every album, by cosine similarity.
+    Returns:
+        tuple: (neighbors, similarities), both n_items x k arrays; missing
+        neighbors are -1 with similarity 0
+    """
+    n_items = len(matrix.item_ids)
+    neighbors = np.full((n_items, k), -1, dtype=np.int64)
+    similarities = np.zeros((n_items, k))
+    for item in range(n_items):
+        users, weights = matrix.item_column(item)
+        positions, owner = gather_rows(matrix.user_ptr, users)
+        others, inverse = np.unique(matrix.user_items[positions], return_inverse=True)
+        dots = np.bincount(inverse, weights=matrix.user_values[positions] * weights[owner])
+        scores = dots / (matrix.item_norms[item] * matrix.item_norms[others])
+        keep = (others != item) & (scores > 0)
+        others, scores = others[keep], scores[keep]
+        if len(others) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            others, scores = others[top], scores[top]
+        order = np.argsort(-scores, kind='stable')
+        neighbors[item, :len(order)] = others[order]
+        similarities[item, :len(order)] = scores[order]
+    return neighbors, similarities
+
+
+def score_users(matrix, neighbors, similarities, limit):
+    """
+    Rank each user's unseen albums by the summed similarity to the albums
+    they interacted with, weighted by how much they liked each.
+    Yields:
+        tuple: (user_id, [(album_id, score), ...]) best first
+    """
+    for user in range(len(matrix.user_ids)):
+        items, weights = matrix.user_row(user)
+        candidates = neighbors[items]
+        scores = similarities[items] * weights[:, None]
+        keep = (candidates >= 0) & ~np.isin(candidates, items)
+        candidates, scores = candidates[keep], scores[keep]
+        if not len(candidates):
+            continue
+        unique, inverse = np.unique(candidates, return_inverse=True)
+        totals = np.bincount(inverse, weights=scores)
+        best = np.argsort(-totals, kind='stable')[:limit]
+        yield int(matrix.user_ids[user]), [
+            (int(matrix.item_ids[unique[i]]), float(totals[i])) for i in best
+        ]
+
+
+def recommendation_cache():
+    return caches[settings.RECOMMENDATION_CACHE]
+
+
+def cache_key(user_id):
+    return f"recommendations:{user_id}"
+
+
+def recommended_albums(user_id):
+    """
+    The user's stored recommendations, best first. Users we have no history
+    for get the best rated albums in their favorite genres.
+    Returns:
+        list: Album instances
+    """
+    albums = [
+        recommendation.album
+        for recommendation in Recommendation.objects.filter(user_id=user_id)
+        .select_related('album').order_by('rank')[:settings.RECOMMENDATION_LIMIT]
+    ]
+    if not albums:
+        favorite_genres = Profile.objects.filter(user_id=user_id).values_list('favorite_genres', flat=True).first() or []
+        albums = list(Album.objects.filter(genre__in=favorite_genres).order_by('-average_rating', 'pk')[:10])
+    return albums
+
+
+def get_recommendations(user_id, refresh=False):
+    """
+    The user's serialized recommendations, from the cache when possible.
+    Args:
+        user_id (int): User to recommend for
+        refresh (bool): Recompute and re-cache even if cached
+    Returns:
+        list: AlbumSerializer data
+    """
+    from .serializers import AlbumSerializer
+
+    cache = recommendation_cache()
+    data = None if refresh else cache.get(cache_key(user_id))
+    if data is None:
+        data = [dict(album) for album in AlbumSerializer(recommended_albums(user_id), many=True).data]
+        cache.set(cache_key(user_id), data, settings.RECOMMENDATION_CACHE_TTL)
+    return data
+
+
+def invalidate_recommendations(*user_ids):
+    """
+    Drop users' cached recommendations once the current transaction commits,
+    so a request in between can't re-cache the old ones.
+    """
+    keys = [cache_key(user_id) for user_id in user_ids]
+    if keys:
+        transaction.on_commit(lambda: recommendation_cache().delete_many(keys))
+
+
+def warm_recommendations(users):
+    """
+    Recompute and cache recommendations for the given users.
+    Args:
+        users (iterable): User IDs
+    Returns:
+        int: Number of users warmed
+    """
+    count = 0
+    for user_id in users:
+        get_recommendations(user_id, refresh=True)
+        count += 1
+    return count
+
+
+def build_recommendations(neighbors=None, limit=None, batch_size=1000):
+    """
+    Rebuild every user's stored album recommendations.
+    Args:
+        neighbors (int): Similar albums kept per album, defaults to
+            RECOMMENDATION_NEIGHBORS
+        limit (int): Recommendations stored per user, defaults to
+            RECOMMENDATION_LIMIT
+        batch_size (int): Rows per INSERT
+    Returns:
+        dict: Counts of 'users', 'albums' and 'recommendations'
+    """
+    neighbors = neighbors or settings.RECOMMENDATION_NEIGHBORS
+    limit = limit or settings.RECOMMENDATION_LIMIT
+
+    matrix = InteractionMatrix.from_interactions(load_interactions())
+    logger.info('Built %d x %d interaction matrix with %d entries',
+                len(matrix.user_ids), len(matrix.item_ids), len(matrix.user_items))
+    nearest, similarities = item_neighbors(matrix, neighbors)
+
+    count = 0
+    with transaction.atomic():
+        invalidate_recommendations(*Recommendation.objects.values_list('user_id', flat=True).distinct())
+        Recommendation.objects.all().delete()
+        batch = []
+        for user_id, ranked in score_users(matrix, nearest, similarities, limit):
+            for rank, (album_id, score) in enumerate(ranked):
+                batch.append(Recommendation(user_id=user_id, album_id=album_id, score=score, rank=rank))
+            if len(batch) >= batch_size:
+                Recommendation.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        Recommendation.objects.bulk_create(batch)
+        count += len(batch)
+        invalidate_recommendations(*matrix.user_ids.tolist())
+    return {'users': len(matrix.user_ids), 'albums': len(matrix.item_ids), 'recommendations': count}
@@ -0,0 +1,273 @@
+"""
+Local search over the Artist, Album and Song rows we already store, plus
+username autocomplete for profiles.
+
+On Postgres, matching uses the full-text and trigram GIN indexes on
+search_text and results are ranked by text rank plus trigram word
+similarity, which also catches small typos.
+Other databases (e.g. SQLite test runs) fall back to substring matching on
+search_text, ranked in Python.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from difflib import SequenceMatcher
+from functools import cache, reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.db.models import Case, F, Func, Q, When
+from django.db.models.functions import Length
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Artist, Album, Song, Profile, normalize_search_text
+from .spotify import get_spotify_token, search_spotify
+
+CATALOG_MODELS = {
+    'artists': Artist,
+    'albums': Album,
+    'songs': Song,
+}
+
+# Catalog section -> key used for that section in Spotify search results
+SPOTIFY_SECTIONS = {
+    'artists': 'artists',
+    'albums': 'albums',
+    'songs': 'tracks',
+}
+
+# How many rows the portable fallback ranks per result it returns
+FALLBACK_CANDIDATES = 20
+
+
+def search_queryset(queryset, query, limit=10):
+    """
+    Filter a catalog queryset down to the rows matching query, best first.
+    Returns:
+        QuerySet: At most `limit` rows ordered by rank
+    """
+    normalized = normalize_search_text(query)
+    if not normalized:
+        return queryset.none()
+    if connection.vendor == 'postgresql':
+        return postgres_search(queryset, normalized, limit)
+    return fallback_search(queryset, normalized, limit)
+
+
+def postgres_search(queryset, normalized, limit):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField, TrigramWordSimilarity
+
+    class SearchDocument(Func):
+        # Must match the expression of the *_search_fts indexes
+        template = "to_tsvector('simple'::regconfig, %(expressions)s)"
+        output_field = SearchVectorField()
+
+    # Prefix-match every word so partially typed queries still hit the index
+    terms = ' & '.join(f"{word}:*" for word in normalized.split())
+    ts_query = SearchQuery(terms, config='simple', search_type='raw')
+    return (
+        queryset
+        .annotate(document=SearchDocument('search_text'))
+        .filter(Q(document=ts_query) | Q(search_text__trigram_word_similar=normalized))
+        .annotate(rank=SearchRank(F('document'), ts_query) + TrigramWordSimilarity(normalized, 'search_text'))
+        .order_by('-rank', 'pk')[:limit]
+    )
+
+
+def fallback_search(queryset, normalized, limit):
+    words = normalized.split()
+    # Match on each word's first few letters so small typos still find
+    # candidates; very short words would match nearly everything
+    stems = {word[:3] for word in words if len(word) >= 3} or set(words)
+    candidates = queryset.filter(reduce(or_, [Q(search_text__contains=stem) for stem in stems]))
+    scored = []
+    for pk, text in candidates.values_list('pk', 'search_text')[:limit * FALLBACK_CANDIDATES]:
+        tokens = text.split()
+        # Share of query words that start a word in the text, plus overall similarity
+        hits = sum(1 for word in words if any(token.startswith(word) for token in tokens)) / len(words)
+        similarity = SequenceMatcher(None, normalized, text).ratio()
+        scored.append((hits + similarity, pk))
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    ids = [pk for score, pk in scored[:limit] if score >= 0.5]
+    if not ids:
+        return queryset.none()
+    order = Case(*[When(pk=pk, then=position) for position, pk in enumerate(ids)])
+    return queryset.filter(pk__in=ids).order_by(order)
+
+
+def search_catalog(query, limit=10, sections=CATALOG_MODELS.keys()):
+    """
+    Search stored artists, albums and songs.
+    Returns:
+        dict: Section name ('artists', 'albums', 'songs') -> ranked list of rows
+    """
+    results = {}
+    for section in sections:
+        queryset = CATALOG_MODELS[section].objects.all()
+        if section == 'albums':
+            queryset = queryset.select_related('artist')
+        elif section == 'songs':
+            queryset = queryset.select_related('artist', 'album')
+        results[section] = list(search_queryset(queryset, query, limit))
+    return results
+
+
+def search_profiles(query, limit=10):
+    """
+    Username autocomplete.
+
+    Usernames starting with the query come first, in alphabetical order (so an
+    exact match leads), served by the prefix index on username_key. If that
+    leaves room, usernames containing the query are added, most similar first;
+    on Postgres that lookup uses the trigram index.
+    Returns:
+        list: Up to `limit` profiles, with their users loaded
+    """
+    key = query.strip().lower()
+    if not key:
+        return []
+    profiles = Profile.objects.select_related('user')
+    results = list(profiles.filter(username_key__startswith=key).order_by('username_key')[:limit])
+    if len(results) < limit:
+        infix = profiles.filter(username_key__contains=key).exclude(username_key__startswith=key)
+        if connection.vendor == 'postgresql':
+            from django.contrib.postgres.search import TrigramSimilarity
+            infix = infix.annotate(rank=TrigramSimilarity('username_key', key)).order_by('-rank', 'username_key')
+        else:
+            infix = infix.order_by(Length('username_key'), 'username_key')
+        results += infix[:limit - len(results)]
+    return results
+
+
+class CatalogSearchFilter(BaseFilterBackend):
+    """
+    Ranked catalog search for list endpoints using the `search` parameter.
+    """
+    search_param = 'search'
+    max_results = 100
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return search_queryset(queryset, query, self.max_results)
+
+
+def images(url):
+    return [{'url': url}] if url else []
+
+
+def artist_summary(artist):
+    return {'id': artist.spotify_uri.split(':')[-1] if artist.spotify_uri else None,
+            'uri': artist.spotify_uri, 'name': artist.name}
+
+
+def catalog_item(obj):
+    """
+    Render a stored row in the shape of a Spotify search result item, so
+    local and Spotify results can be mixed in one list.
+    """
+    item = {
+        'id': obj.spotify_uri.split(':')[-1] if obj.spotify_uri else None,
+        'uri': obj.spotify_uri,
+        'local_id': obj.id,
+        'source': 'local',
+    }
+    if isinstance(obj, Artist):
+        item.update(type='artist', name=obj.name, genres=[obj.genre] if obj.genre else [], images=images(obj.image))
+    elif isinstance(obj, Album):
+        item.update(
+            type='album', name=obj.title, artists=[artist_summary(obj.artist)], images=images(obj.cover_art),
+            release_date=str(obj.release_date), total_tracks=obj.tracks,
+        )
+    else:
+        album = obj.album
+        item.update(
+            type='track', name=obj.title, artists=[artist_summary(obj.artist)],
+            duration_ms=int(obj.duration.total_seconds() * 1000),
+            album={'uri': album.spotify_uri, 'name': album.title, 'images': images(album.cover_art)} if album else None,
+        )
+    return item
+
+
+def needs_spotify(local_results):
+    """
+    Whether local results should be topped up from Spotify: some section has
+    fewer than SEARCH_LOCAL_MIN_RESULTS rows, or rows older than
+    SEARCH_LOCAL_MAX_AGE seconds.
+    """
+    oldest_allowed = timezone.now() - timedelta(seconds=settings.SEARCH_LOCAL_MAX_AGE)
+    for rows in local_results.values():
+        if len(rows) < settings.SEARCH_LOCAL_MIN_RESULTS:
+            return True
+        if any(row.synced_at is None or row.synced_at < oldest_allowed for row in rows):
+            return True
+    return False
+
+
+def merge_results(local_results, spotify_results, limit=10):
+    """
+    Combine local rows with Spotify search results, local first, dropping
+    Spotify items we already returned. Every item is tagged with its source.
+    Returns:
+        dict: Spotify section name ('artists', 'albums', 'tracks') -> items
+    """
+    merged = {}
+    for section, spotify_section in SPOTIFY_SECTIONS.items():
+        items = [catalog_item(obj) for obj in local_results.get(section, [])]
+        seen = {item['uri'] for item in items if item['uri']}
+        for item in (spotify_results or {}).get(spotify_section, []):
+            if item['uri'] not in seen:
+                seen.add(item['uri'])
+                items.append(dict(item, source='spotify'))
+        merged[spotify_section] = items[:limit]
+    return merged
+
+
+@cache
+def search_pool():
+    """
+    Threads that run Spotify searches while the request thread queries the
+    database. Bounded so a burst of searches can't open unlimited connections.
+    """
+    return ThreadPoolExecutor(max_workers=settings.SEARCH_POOL_SIZE, thread_name_prefix='spotify-search')
+
+
+def mark_synced(spotify_results):
+    """
+    Refresh synced_at on stored rows that Spotify just returned, so they
+    count as fresh in needs_spotify and later searches for them can be
+    answered locally.
+    """
+    now = timezone.now()
+    for section, spotify_section in SPOTIFY_SECTIONS.items():
+        uris = [item['uri'] for item in spotify_results.get(spotify_section, []) if item and item.get('uri')]
+        if uris:
+            CATALOG_MODELS[section].objects.filter(spotify_uri__in=uris).update(synced_at=now)
+
+
+def fetch_spotify_results(query, limit):
+    """
+    Get a token and search Spotify. Runs on the search pool.
+    Returns:
+        dict: Spotify search results, or None if we couldn't authenticate
+    """
+    try:
+        token = get_spotify_token()
+        if not token:
+            return None
+        return search_spotify(query, None, token, limit)
+    finally:
+        # Pool threads are long-lived, so don't keep a connection open if the
+        # rate limiter used one
+        connection.close()
+
+
+def start_spotify_search(query, limit=10):
+    """
+    Start a Spotify search in the background.
+    Returns:
+        Future: Resolves to the result of fetch_spotify_results
+    """
+    return search_pool().submit(fetch_spotify_results, query, limit)
@@ -1,7 +1,8 @@
 from rest_framework import serializers
-from .models import Profile, Artist, Album, Song, Review, Favorite, RecentSearch
+from .models import Profile, Artist, Album, Song, Review, ReviewSummary, Favorite
+from decimal import ROUND_HALF_UP
 from rest_framework.serializers import ImageField
-from django.contrib.contenttypes.models import ContentType
+from .ratings import save_review, upsert_reviews
 
 class AbsoluteImageField(ImageField):
     def to_representation(self, value):
@@ -19,57 +20,96 @@ class ProfileSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Profile
-        fields = ['id', 'username', 'first_name', 'last_name', 'display_picture', 'bio', 'favorite_genres', 'reviews', 'friends']
+        fields = ['id', 'username', 'first_name', 'last_name', 'display_picture', 'bio', 'favorite_genres', 'reviews', 'friends',
+                  'favorite_albums', 'favorite_songs', 'favorite_artists']
+        read_only_fields = ['reviews', 'friends', 'favorite_albums', 'favorite_songs', 'favorite_artists']
+
+
+class ProfileSummarySerializer(serializers.ModelSerializer):
+    """
+    Just enough of a profile to render an autocomplete suggestion.
+    """
+    username = serializers.CharField(source="user.username", read_only=True)
+
+    class Meta:
+        model = Profile
+        fields = ['id', 'username', 'display_picture']
 
 
 class ArtistSerializer(serializers.ModelSerializer):
     class Meta:
         model = Artist
-        fields = '__all__'
+        exclude = ['search_text', 'synced_at']
 
 class AlbumSerializer(serializers.ModelSerializer):
     class Meta:
         model = Album
-        fields = '__all__'
+        exclude = ['search_text', 'synced_at']
 
 class SongSerializer(serializers.ModelSerializer):
     class Meta:
         model = Song
-        fields = '__all__'
+        exclude = ['search_text', 'synced_at']
         
+class ReviewSummarySerializer(serializers.ModelSerializer):
+    average = serializers.DecimalField(max_digits=3, decimal_places=1, rounding=ROUND_HALF_UP, read_only=True)
+    histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+
+    class Meta:
+        model = ReviewSummary
+        fields = ['total', 'average', 'histogram', 'latest_review_at']
+
+
+class ReviewSummaryMixin(serializers.Serializer):
+    """
+    Adds the item's maintained review summary, for detail responses.
+    """
+    review_summary = serializers.SerializerMethodField()
+    summary_content_type = None
+
+    def get_review_summary(self, obj):
+        summary = ReviewSummary.objects.filter(content_type=self.summary_content_type, content_id=obj.pk).first()
+        return ReviewSummarySerializer(summary or ReviewSummary()).data
+
+
+class ArtistDetailSerializer(ReviewSummaryMixin, ArtistSerializer):
+    summary_content_type = 'artist'
+
+class AlbumDetailSerializer(ReviewSummaryMixin, AlbumSerializer):
+    summary_content_type = 'album'
+
+class SongDetailSerializer(ReviewSummaryMixin, SongSerializer):
+    summary_content_type = 'track'
+
+
+class ReviewListSerializer(serializers.ListSerializer):
+    def create(self, validated_data):
+        # Write the whole batch with one upsert
+        return upsert_reviews(validated_data)
+
+
 class ReviewSerializer(serializers.ModelSerializer):
     class Meta:
         model = Review
         fields = '__all__'
         read_only_fields = ['user']
+        list_serializer_class = ReviewListSerializer
 
     def validate(self, data):
-        user = self.context['request'].user
-        content_type = data['content_type']
-        content_id = data['content_id']
-
-        # Try to get existing review
-        existing_review = Review.objects.filter(
-            user=user, 
-            content_type=content_type, 
-            content_id=content_id
-        ).first()
-
-        # Store the existing review (if any) to use in create/update
-        self.context['existing_review'] = existing_review
+        # Creating overwrites, but an edit can't move a review onto an item
+        # the user has already reviewed
+        if self.instance is not None:
+            content_type = data.get('content_type', self.instance.content_type)
+            content_id = data.get('content_id', self.instance.content_id)
+            if Review.objects.filter(
+                user_id=self.instance.user_id, content_type=content_type, content_id=content_id
+            ).exclude(pk=self.instance.pk).exists():
+                raise serializers.ValidationError("You have already reviewed this item.")
         return data
 
     def create(self, validated_data):
-        existing_review = self.context.get('existing_review')
-        
-        if existing_review:
-            # Update existing review instead of creating new one
-            for key, value in validated_data.items():
-                setattr(existing_review, key, value)
-            existing_review.save()
-            return existing_review
-            
-        return super().create(validated_data)
+        # Overwrites the user's existing review of the same item, if any
+        return save_review(validated_data)
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
@@ -77,38 +117,36 @@ class FavoriteSerializer(serializers.ModelSerializer):
         model = Favorite
         fields = '__all__'
 
-class RecentSearchSerializer(serializers.ModelSerializer):
+class RecentSearchSerializer(serializers.Serializer):
+    """
+    Serializes the dicts returned by Profile.recent_searches().
+    """
+    object_id = serializers.SerializerMethodField()
+    object_uri = serializers.SerializerMethodField()
     title = serializers.SerializerMethodField()
     image = serializers.SerializerMethodField()
     description = serializers.SerializerMethodField()
     type = serializers.SerializerMethodField()
-    object_uri = serializers.SerializerMethodField()
-    object_id = serializers.SerializerMethodField()
-
-
-    class Meta:
-        model = RecentSearch
-        fields = ['object_id', 'object_uri', 'title', 'image', 'description', 'type', 'searched_at']  # Updated to use content_id
-
-    def get_title(self, obj):
-        return obj.content_object.search_title
-
-    def get_image(self, obj):
-        if isinstance(obj.content_object.search_image, str):
-            return obj.content_object.search_image
-            
-        return None
+    searched_at = serializers.DateTimeField(read_only=True)
 
-    def get_description(self, obj):
-        return obj.content_object.search_description
+    def get_object_id(self, search):
+        # Items still being imported don't have one yet
+        return search['object'].id if search['object'] is not None else None
 
-    def get_type(self, obj):
-        return obj.content_type.model.capitalize()
+    def get_object_uri(self, search):
+        if isinstance(search['object'], Profile):
+            return search['object'].id
+        return search['uri']
 
-    def get_object_uri(self, obj):
-        return obj.content_object.spotify_uri if isinstance(obj.content_object, (Song, Album, Artist)) else obj.content_object.id
+    def get_title(self, search):
+        return search['object'].search_title if search['object'] is not None else search['uri']
 
-    def get_object_id(self, obj):
-        return obj.content_object.id
+    def get_image(self, search):
+        image = search['object'].search_image if search['object'] is not None else None
+        return image if isinstance(image, str) else None
 
+    def get_description(self, search):
+        return search['object'].search_description if search['object'] is not None else None
 
+    def get_type(self, search):
+        return search['type'].capitalize()
@@ -0,0 +1,102 @@
+"""
+Keep denormalized columns in step with the rows they are derived from.
+"""
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .counters import FAVORITE_COUNTERS, adjust_counter
+from .models import Album, Artist, Profile, Review, Favorite
+from .recommendations import invalidate_recommendations
+from .ratings import record_review_change
+from .vectors import index_items
+
+
+@receiver(post_save, sender=User)
+def update_username_key(sender, instance, created, **kwargs):
+    """
+    Re-index the user's profile for username autocomplete when they're renamed.
+    """
+    if not created:
+        Profile.objects.filter(user=instance).exclude(
+            username_key=instance.username.lower()
+        ).update(username_key=instance.username.lower())
+
+
+@receiver(post_save, sender=Review)
+def count_review(sender, instance, created, **kwargs):
+    """
+    Add a new or edited review's rating to the reviewed item's totals and
+    summary, and count new reviews on the author's profile.
+    """
+    current = (instance.content_type, instance.content_id, Decimal(str(instance.rating)))
+    previous = None if created else getattr(instance, '_loaded_rating', None)
+    if previous is not None:
+        previous = (previous[0], previous[1], Decimal(str(previous[2])))
+    record_review_change(previous, current, instance.created_at)
+    instance._loaded_rating = current
+    if created:
+        adjust_counter(instance.user_id, 'reviews', 1)
+    invalidate_recommendations(instance.user_id)
+
+
+@receiver(post_delete, sender=Review)
+def uncount_review(sender, instance, **kwargs):
+    """
+    Remove a deleted review's rating from the reviewed item's totals and summary.
+    """
+    content_type, content_id, rating = getattr(
+        instance, '_loaded_rating', (instance.content_type, instance.content_id, instance.rating)
+    )
+    record_review_change((content_type, content_id, Decimal(str(rating))), None)
+    adjust_counter(instance.user_id, 'reviews', -1)
+    invalidate_recommendations(instance.user_id)
+
+
+@receiver(post_save, sender=Favorite)
+def count_favorite(sender, instance, created, **kwargs):
+    """
+    Add a new favorite to its owner's per-type favorite counter.
+    """
+    previous = None if created else getattr(instance, '_loaded_content_type', instance.content_type)
+    if previous != instance.content_type:
+        adjust_counter(instance.user_id, FAVORITE_COUNTERS.get(previous), -1)
+        adjust_counter(instance.user_id, FAVORITE_COUNTERS.get(instance.content_type), 1)
+    instance._loaded_content_type = instance.content_type
+    invalidate_recommendations(instance.user_id)
+
+
+@receiver(post_delete, sender=Favorite)
+def uncount_favorite(sender, instance, **kwargs):
+    """
+    Remove a deleted favorite from its owner's favorite counter.
+    """
+    content_type = getattr(instance, '_loaded_content_type', instance.content_type)
+    adjust_counter(instance.user_id, FAVORITE_COUNTERS.get(content_type), -1)
+    invalidate_recommendations(instance.user_id)
+
+
+@receiver(post_save, sender=Profile)
+def profile_genres_changed(sender, instance, created, **kwargs):
+    """
+    Drop cached recommendations when the user's favorite genres change,
+    since users without history are recommended albums by genre.
+    """
+    if getattr(instance, '_loaded_favorite_genres', None) != instance.favorite_genres:
+        invalidate_recommendations(instance.user_id)
+    instance._loaded_favorite_genres = instance.favorite_genres
+
+
+@receiver(post_save, sender=Album)
+@receiver(post_save, sender=Artist)
+def index_new_item(sender, instance, created, **kwargs):
+    """
+    Add new albums and artists to the similar-items index, covering rows
+    created one at a time by create_resource.
+    """
+    if created:
+        kind = 'albums' if sender is Album else 'artists'
+        transaction.on_commit(lambda: index_items(kind, [instance]))
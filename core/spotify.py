@@ -1,38 +1,428 @@
+import hashlib
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
 import requests
+from requests.adapters import HTTPAdapter
 from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
 from datetime import timedelta
 
+from .ratelimit import RateLimited, rate_limiter
+
+logger = logging.getLogger(__name__)
+
+
+class SpotifyRateLimited(requests.RequestException):
+    """
+    Raised when the shared rate limiter has no slot for a request in time.
+    """
+
+
+class SpotifyClient:
+    """
+    HTTP client for the Spotify Web API and accounts service.
+
+    Requests go through one pooled keep-alive session so connections and TLS
+    sessions are reused between calls. Every request gets the connect/read
+    timeout configured for its endpoint in SPOTIFY_HTTP_TIMEOUTS. Connection
+    errors and 5xx responses are retried with jittered exponential backoff, and
+    429 responses are retried after the delay Spotify asks for in Retry-After.
+    Each attempt first takes a slot from the shared rate limiter, and a 429
+    pauses every worker for the Retry-After period.
+    """
+
+    def __init__(self):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=settings.SPOTIFY_HTTP_POOL_SIZE,
+            pool_maxsize=settings.SPOTIFY_HTTP_POOL_SIZE,
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @property
+    def api_url(self):
+        return settings.SPOTIFY_API_URL.rstrip('/')
+
+    @property
+    def token_url(self):
+        return settings.SPOTIFY_TOKEN_URL
+
+    def get_timeout(self, endpoint):
+        timeouts = settings.SPOTIFY_HTTP_TIMEOUTS
+        return timeouts.get(endpoint, timeouts['default'])
+
+    def request(self, method, url, endpoint='default', **kwargs):
+        """
+        Send a request, retrying transient failures.
+        Returns the final response, or raises requests.RequestException if the
+        connection kept failing or no rate limit slot became available.
+        """
+        max_retries = settings.SPOTIFY_HTTP_MAX_RETRIES
+        timeout = self.get_timeout(endpoint)
+
+        for attempt in range(max_retries + 1):
+            last_attempt = attempt == max_retries
+            try:
+                rate_limiter.acquire()
+            except RateLimited as e:
+                raise SpotifyRateLimited(str(e))
+
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if last_attempt:
+                    raise
+                self.sleep(self.get_backoff(attempt))
+                continue
+
+            if response.status_code == 429 and not last_attempt:
+                delay = self.get_retry_after(response)
+                if delay is None:
+                    delay = self.get_backoff(attempt)
+                rate_limiter.pause(delay)
+                if delay > settings.SPOTIFY_HTTP_MAX_RETRY_AFTER:
+                    # Don't hold a worker for a long rate-limit window
+                    return response
+                self.sleep(delay)
+                continue
+
+            if response.status_code >= 500 and not last_attempt:
+                self.sleep(self.get_backoff(attempt))
+                continue
+
+            return response
+
+    def api_get(self, path, token, endpoint='default', **kwargs):
+        """
+        GET a Web API path (e.g. "/search") or absolute URL with the given token.
+        Returns the response, or None if Spotify could not be reached.
+        """
+        url = path if path.startswith('http') else f"{self.api_url}{path}"
+        headers = {"Authorization": f"Bearer {token}"}
+        try:
+            response = self.request('GET', url, endpoint=endpoint, headers=headers, **kwargs)
+        except requests.RequestException as e:
+            logger.warning('Spotify request to %s failed: %s', url, e)
+            return None
+
+        if response.status_code == 401:
+            # The cached token was revoked or expired early
+            token_manager.invalidate()
+        return response
+
+    def get_backoff(self, attempt):
+        base = settings.SPOTIFY_HTTP_BACKOFF
+        return random.uniform(0, min(settings.SPOTIFY_HTTP_MAX_BACKOFF, base * 2 ** attempt))
+
+    def get_retry_after(self, response):
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            pass
+        try:
+            return max((parsedate_to_datetime(value) - timezone.now()).total_seconds(), 0)
+        except (TypeError, ValueError):
+            return None
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+client = SpotifyClient()
+
+
+class SpotifyTokenManager:
+    """
+    Caches the Client Credentials access token until shortly before it expires.
+
+    The token lives in the Django cache named by SPOTIFY_TOKEN_CACHE, so every
+    worker sharing that cache backend shares one token. Threads in a process
+    serialize on a lock and processes coordinate through a short-lived cache
+    lock, so only one caller refreshes at a time. Once the token enters the
+    refresh window it keeps being served while a background thread fetches
+    its replacement.
+    """
+    cache_key = 'spotify:access_token'
+    lock_key = 'spotify:access_token:lock'
+    expiry_skew = 10  # Treat the token as expired this many seconds early
+    lock_timeout = 10
+
+    def __init__(self):
+        self._entry = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    @property
+    def cache(self):
+        return caches[settings.SPOTIFY_TOKEN_CACHE]
+
+    def get_token(self):
+        """
+        Return a valid access token, fetching a new one only when needed.
+        """
+        now = time.time()
+        entry = self._entry
+        if not entry or entry['expires_at'] <= now:
+            entry = self.cache.get(self.cache_key)
+            self._entry = entry
+
+        if entry and entry['expires_at'] > now:
+            if entry['refresh_at'] <= now:
+                # Another worker may already have published a replacement
+                shared = self._adopt_fresh_entry(now)
+                if shared:
+                    return shared['token']
+                self._refresh_in_background()
+            return entry['token']
+
+        entry = self._refresh()
+        return entry['token'] if entry else None
+
+    def invalidate(self):
+        """
+        Drop the cached token, e.g. after Spotify rejected it with a 401.
+        """
+        self._entry = None
+        self.cache.delete(self.cache_key)
+
+    def _refresh(self):
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            entry = self.cache.get(self.cache_key)
+            if entry and entry['expires_at'] > time.time():
+                self._entry = entry
+                return entry
+
+            if self.cache.add(self.lock_key, True, self.lock_timeout):
+                try:
+                    return self._fetch()
+                finally:
+                    self.cache.delete(self.lock_key)
+
+            # Another process is refreshing; wait for it to publish the token
+            deadline = time.time() + self.lock_timeout
+            while time.time() < deadline:
+                time.sleep(0.1)
+                entry = self.cache.get(self.cache_key)
+                if entry:
+                    self._entry = entry
+                    return entry
+
+            # The lock holder never finished, fetch the token ourselves
+            return self._fetch()
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, daemon=True).start()
+
+    def _adopt_fresh_entry(self, now):
+        """
+        Switch to the shared cache's token if it isn't due for refresh yet.
+        Returns:
+            dict: The adopted entry, or None
+        """
+        entry = self.cache.get(self.cache_key)
+        if entry and entry['refresh_at'] > now:
+            self._entry = entry
+            return entry
+        return None
+
+    def _background_refresh(self):
+        try:
+            if self._adopt_fresh_entry(time.time()):
+                return
+            if self.cache.add(self.lock_key, True, self.lock_timeout):
+                try:
+                    # Re-check now that we hold the lock, in case another
+                    # worker published a token just before we took it
+                    if not self._adopt_fresh_entry(time.time()):
+                        self._fetch()
+                finally:
+                    self.cache.delete(self.lock_key)
+        except Exception:
+            logger.exception('Background Spotify token refresh failed')
+        finally:
+            self._refreshing = False
+
+    def _fetch(self):
+        payload = {"grant_type": "client_credentials"}
+        auth = (settings.SPOTIFY_CLIENT_ID, settings.SPOTIFY_CLIENT_SECRET)
+
+        try:
+            response = client.request('POST', client.token_url, endpoint='token', data=payload, auth=auth)
+        except requests.RequestException as e:
+            logger.warning('Spotify token request failed: %s', e)
+            return None
+        if response.status_code != 200:
+            logger.warning('Spotify token request failed with status %s', response.status_code)
+            return None
+
+        data = response.json()
+        expires_in = int(data.get('expires_in', 3600))
+        now = time.time()
+        margin = min(settings.SPOTIFY_TOKEN_REFRESH_MARGIN, expires_in // 2)
+        entry = {
+            'token': data.get('access_token'),
+            'expires_at': now + expires_in - self.expiry_skew,
+            'refresh_at': now + expires_in - margin,
+        }
+        self.cache.set(self.cache_key, entry, max(expires_in - self.expiry_skew, 1))
+        self._entry = entry
+        return entry
+
+
+token_manager = SpotifyTokenManager()
+
 
 def get_spotify_token():
     """
-    Generate Spotify access token using Client Credentials Flow.
+    Get a Spotify access token using Client Credentials Flow.
+    The token is cached and reused until shortly before it expires.
     """
-    url = "https://accounts.spotify.com/api/token"
-    payload = {"grant_type": "client_credentials"}
-    auth = (settings.SPOTIFY_CLIENT_ID, settings.SPOTIFY_CLIENT_SECRET)
-    
-    response = requests.post(url, data=payload, auth=auth)
-    if response.status_code == 200:
-        return response.json().get('access_token')
-    return None
+    return token_manager.get_token()
+
 
+class SearchCache:
+    """
+    Cache for Spotify search results keyed by normalized (query, type, limit).
 
-def search_spotify(query, content_type, token):
+    Results are kept in a size-bounded in-process LRU and, when
+    SPOTIFY_SEARCH_CACHE_SHARED names a cache alias, in that shared cache too.
+    An entry is fresh for SPOTIFY_SEARCH_CACHE_TTL seconds; after that it is
+    still served for SPOTIFY_SEARCH_CACHE_STALE_TTL seconds while a background
+    thread refreshes it.
+    """
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+
+    @property
+    def shared(self):
+        alias = settings.SPOTIFY_SEARCH_CACHE_SHARED
+        return caches[alias] if alias else None
+
+    @staticmethod
+    def make_key(query, content_type, limit):
+        normalized = ' '.join(query.lower().split())
+        digest = hashlib.sha1(normalized.encode()).hexdigest()
+        return f"spotify:search:{(content_type or 'all').lower()}:{limit}:{digest}"
+
+    def get(self, key):
+        """
+        Return (results, is_stale), or (None, False) on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                self._entries.move_to_end(key)
+
+        if not entry and self.shared is not None:
+            entry = self.shared.get(key)
+            if entry:
+                self._store_local(key, entry)
+
+        if not entry or entry['stale_until'] <= now:
+            return None, False
+        return entry['results'], entry['fresh_until'] <= now
+
+    def set(self, key, results):
+        now = time.time()
+        ttl = settings.SPOTIFY_SEARCH_CACHE_TTL
+        stale_ttl = settings.SPOTIFY_SEARCH_CACHE_STALE_TTL
+        entry = {
+            'results': results,
+            'fresh_until': now + ttl,
+            'stale_until': now + ttl + stale_ttl,
+        }
+        self._store_local(key, entry)
+        if self.shared is not None:
+            self.shared.set(key, entry, ttl + stale_ttl)
+
+    def refresh_in_background(self, key, fetch):
+        """
+        Re-run fetch on a background thread, unless a refresh is already running.
+        """
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                results = fetch()
+                if results and 'error' not in results:
+                    self.set(key, results)
+            except Exception:
+                logger.exception('Background Spotify search refresh failed')
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _store_local(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.SPOTIFY_SEARCH_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+
+search_cache = SearchCache()
+
+
+def search_spotify(query, content_type, token, limit=10):
     """
     Search Spotify API for the given query and content type.
+    Results are served from the search cache when possible.
     """
     if content_type == "Profile":
         return None
-        
-    url = "https://api.spotify.com/v1/search"
-    headers = {"Authorization": f"Bearer {token}"}
-    
+
+    key = search_cache.make_key(query, content_type, limit)
+    results, stale = search_cache.get(key)
+    if results is not None:
+        if stale:
+            search_cache.refresh_in_background(
+                key, lambda: fetch_spotify_search(query, content_type, get_spotify_token(), limit)
+            )
+        return {section: list(items) for section, items in results.items()}
+
+    results = fetch_spotify_search(query, content_type, token, limit)
+    if 'error' not in results:
+        search_cache.set(key, results)
+    return results
+
+
+def fetch_spotify_search(query, content_type, token, limit=10):
+    """
+    Query the Spotify search endpoint directly, bypassing the cache.
+    """
     # If no specific content type, search for all types
     if content_type is None:
         params = {
             "q": query,
             "type": "track,album,artist",  # Search all types
-            "limit": 10,  # Limit results to 10 per type
+            "limit": limit,  # Limit results per type
         }
     else:
         # Handle "Song" -> "track" conversion
@@ -41,11 +431,11 @@ def search_spotify(query, content_type, token):
         params = {
             "q": query,
             "type": content_type.lower(),  # Spotify API expects lowercase type
-            "limit": 10,  # Limit results to 10
+            "limit": limit,
         }
     
-    response = requests.get(url, headers=headers, params=params)
-    if response.status_code == 200:
+    response = client.api_get("/search", token, endpoint='search', params=params)
+    if response is not None and response.status_code == 200:
         data = response.json()
         results = {}
         
@@ -76,33 +466,238 @@ def get_spotify_item(content_type, spotify_id, token):
     if content_type not in ['artist', 'album', 'track']:
         return None
         
-    url = f"https://api.spotify.com/v1/{content_type}s/{spotify_id}"
-    headers = {"Authorization": f"Bearer {token}"}
-    
-    response = requests.get(url, headers=headers)
-    print("Getting Spotify Item: " + spotify_id)
-    print(response)
-    if response.status_code == 200:
+    response = client.api_get(f"/{content_type}s/{spotify_id}", token, endpoint='item')
+    logger.debug('Getting Spotify item %s: %s', spotify_id, response)
+    if response is not None and response.status_code == 200:
         return response.json()
     return None
 
-def create_resource(content_type, spotify_uri, token):
+def parse_release_date(data):
+    """
+    Spotify release dates may only be precise to the year or month; pad them
+    out to a full date.
+    """
+    release_date = data['release_date']
+    precision = data.get('release_date_precision', 'day')
+    if precision == 'year':
+        return f"{release_date}-01-01"
+    if precision == 'month':
+        return f"{release_date}-01"
+    return release_date
+
+
+def first_image(data):
+    images = data.get('images')
+    return images[0]['url'] if images else None
+
+
+def fetch_album_tracks(album_id, token, first_page=None):
+    """
+    Get every track on an album, following the paginated tracks listing.
+    Args:
+        album_id (str): The Spotify ID of the album
+        token (str): Valid Spotify access token
+        first_page (dict): The first tracks page, if already fetched (album
+            responses embed it)
+    Returns:
+        list: Simplified track objects from Spotify
+    """
+    page = first_page
+    if page is None:
+        response = client.api_get(f"/albums/{album_id}/tracks", token, endpoint='item', params={'limit': 50})
+        if response is None or response.status_code != 200:
+            return []
+        page = response.json()
+
+    tracks = list(page['items'])
+    while page.get('next'):
+        response = client.api_get(page['next'], token, endpoint='item')
+        if response is None or response.status_code != 200:
+            logger.warning('Stopped importing tracks for album %s after %d tracks', album_id, len(tracks))
+            break
+        page = response.json()
+        tracks.extend(page['items'])
+    return tracks
+
+
+def build_album_songs(album, tracks):
+    """
+    Build unsaved Song instances for album tracks we don't have yet.
+    Existing songs are found with a single spotify_uri lookup.
+    """
+    from .models import Song, with_search_text
+
+    existing = set(
+        Song.objects.filter(spotify_uri__in=[track['uri'] for track in tracks])
+        .values_list('spotify_uri', flat=True)
+    )
+    songs = []
+    for track in tracks:
+        if track['uri'] in existing:
+            continue
+        existing.add(track['uri'])
+        songs.append(Song(
+            spotify_uri=track['uri'],
+            title=track['name'],
+            artist=album.artist,
+            album=album,
+            duration=timedelta(milliseconds=track['duration_ms']),  # Convert to timedelta
+            image=album.cover_art  # Use album cover for song image
+        ))
+    return with_search_text(songs)
+
+
+def import_album_tracks(album, token, first_page=None):
+    """
+    Create Song rows for every track on an album with a single bulk insert.
+    Returns:
+        int: The number of songs created
+    """
+    from .models import Song
+
+    tracks = fetch_album_tracks(album.spotify_uri.split(':')[-1], token, first_page)
+    songs = Song.objects.bulk_create(build_album_songs(album, tracks), ignore_conflicts=True)
+    return len(songs)
+
+
+class IngestContext:
+    """
+    Memo of the rows resolved during one ingest operation.
+
+    Pass the same context to several create_resource calls to share it across
+    a batch. Each Spotify URI is looked up in the database at most once and
+    fetched from Spotify only if it isn't stored yet.
+    """
+    def __init__(self):
+        self.resolved = {}
+
+    def get_model(self, content_type):
+        from .models import Artist, Album, Song  # Import here to avoid circular imports
+        return {'artist': Artist, 'album': Album, 'track': Song}[content_type]
+
+    def lookup(self, content_type, spotify_uri):
+        """
+        Return the stored row for a URI from the memo or the database, or None.
+        """
+        if spotify_uri not in self.resolved:
+            obj = self.get_model(content_type).objects.filter(spotify_uri=spotify_uri).first()
+            if obj is None:
+                return None
+            self.resolved[spotify_uri] = obj
+        return self.resolved[spotify_uri]
+
+    def add(self, obj):
+        self.resolved[obj.spotify_uri] = obj
+        return obj
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent ingestion of the same Spotify URI.
+
+    The first caller for a URI becomes the leader and does the work. Other
+    threads in the process wait for the leader and get its result. Across
+    processes the leader holds a lock in the INGEST_LOCK_CACHE cache, and
+    followers poll the database until the leader's row appears.
+    """
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[settings.INGEST_LOCK_CACHE]
+
+    def do(self, key, fn, lookup):
+        """
+        Run fn() once for all concurrent callers with the same key.
+        lookup() returns the finished result from the database, if any.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'done': threading.Event(), 'result': None}
+
+        if not leader:
+            if call['done'].wait(settings.INGEST_SINGLEFLIGHT_TIMEOUT):
+                return call['result']
+            return lookup()
+
+        try:
+            call['result'] = self._lead(key, fn, lookup)
+            return call['result']
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call['done'].set()
+
+    def _lead(self, key, fn, lookup):
+        lock_key = f"ingest:lock:{key}"
+        timeout = settings.INGEST_SINGLEFLIGHT_TIMEOUT
+        if self.cache.add(lock_key, True, timeout):
+            try:
+                return fn()
+            finally:
+                self.cache.delete(lock_key)
+
+        # Another process is ingesting this URI; wait for its row
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            time.sleep(0.2)
+            result = lookup()
+            if result is not None:
+                return result
+            if self.cache.get(lock_key) is None:
+                break  # It gave up without creating the row
+        return fn()
+
+
+ingest_flight = SingleFlight()
+
+
+def create_resource(content_type, spotify_uri, token, context=None, spotify_data=None):
     """
     Create a new resource in our database from Spotify data
     Args:
         content_type (str): The type of content ('artist', 'album', or 'track')
         spotify_uri (str): The Spotify URI of the item
         token (str): Valid Spotify access token
+        context (IngestContext): Memo shared across the ingest operation
+        spotify_data (dict): Item data already fetched from Spotify, if any
     Returns:
         Model instance: The created database object, or None if creation fails
     """
+    if context is None:
+        context = IngestContext()
+
+    # Nothing to fetch if we already have it
+    existing = context.lookup(content_type, spotify_uri)
+    if existing:
+        return existing
+
+    # Concurrent requests for the same URI share one fetch
+    obj = ingest_flight.do(
+        spotify_uri,
+        lambda: fetch_resource(content_type, spotify_uri, token, context, spotify_data),
+        lambda: context.lookup(content_type, spotify_uri),
+    )
+    return context.add(obj) if obj is not None else None
+
+
+def fetch_resource(content_type, spotify_uri, token, context, spotify_data=None):
+    """
+    Fetch an item from Spotify and create its row, along with the rows it
+    depends on. Use create_resource rather than calling this directly.
+    """
     from .models import Artist, Album, Song  # Import here to avoid circular imports
-    
+
     # Extract Spotify ID from URI (format: spotify:type:id)
     spotify_id = spotify_uri.split(':')[-1]
-    
+
     # Get detailed data from Spotify
-    spotify_data = get_spotify_item(content_type, spotify_id, token)
+    if spotify_data is None:
+        spotify_data = get_spotify_item(content_type, spotify_id, token)
     if not spotify_data:
         return None
 
@@ -116,57 +711,42 @@ def create_resource(content_type, spotify_uri, token):
                     'image': spotify_data['images'][0]['url'] if spotify_data.get('images') else None
                 }
             )
-            return artist
+            return context.add(artist)
 
         elif content_type == 'album':
             # First ensure we have the artist
             artist_uri = spotify_data['artists'][0]['uri']
-            artist = create_resource('artist', artist_uri, token)
-            
+            artist = create_resource('artist', artist_uri, token, context)
+
             album, created = Album.objects.get_or_create(
                 spotify_uri=spotify_uri,
                 defaults={
                     'title': spotify_data['name'],
                     'artist': artist,
                     'genre': artist.genre,  # Use artist's genre as default
-                    'release_date': spotify_data['release_date'],
+                    'release_date': parse_release_date(spotify_data),
                     'tracks': spotify_data['total_tracks'],
                     'cover_art': spotify_data['images'][0]['url'] if spotify_data.get('images') else None
                 }
             )
 
-            # If this is a new album, create all its tracks
+            # If this is a new album, create all its tracks. Full album
+            # responses embed the first page of tracks.
             if created:
-                tracks_url = f"https://api.spotify.com/v1/albums/{spotify_id}/tracks"
-                headers = {"Authorization": f"Bearer {token}"}
-                tracks_response = requests.get(tracks_url, headers=headers)
-                
-                if tracks_response.status_code == 200:
-                    tracks_data = tracks_response.json()
-                    
-                    for track in tracks_data['items']:
-                        # Create each track if it doesn't exist
-                        Song.objects.get_or_create(
-                            spotify_uri=track['uri'],
-                            defaults={
-                                'title': track['name'],
-                                'artist': artist,
-                                'album': album,
-                                'duration': timedelta(milliseconds=track['duration_ms']),  # Convert to timedelta
-                                'image': album.cover_art  # Use album cover for song image
-                            }
-                        )
-            
-            return album
+                import_album_tracks(album, token, spotify_data.get('tracks'))
+
+            return context.add(album)
 
         elif content_type == 'track':
             # Ensure we have the artist and album
             artist_uri = spotify_data['artists'][0]['uri']
-            artist = create_resource('artist', artist_uri, token)
-            
+            artist = create_resource('artist', artist_uri, token, context)
+
+            # The track response carries enough of the album to create it
+            # without fetching the album itself
             album_uri = spotify_data['album']['uri']
-            album = create_resource('album', album_uri, token)
-            
+            album = create_resource('album', album_uri, token, context, spotify_data['album'])
+
             song, created = Song.objects.get_or_create(
                 spotify_uri=spotify_uri,
                 defaults={
@@ -177,11 +757,10 @@ def create_resource(content_type, spotify_uri, token):
                     'image': spotify_data['album']['images'][0]['url'] if spotify_data['album'].get('images') else None
                 }
             )
-            return song
+            return context.add(song)
 
     except Exception as e:
-        print(f"Error creating resource: {str(e)}")
+        logger.exception('Error creating resource %s: %s', spotify_uri, e)
         return None
 
     return None
-
@@ -1,10 +1,32 @@
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.contrib.auth.models import User
-from .models import Artist, Album, Song, Review, Favorite
+from .models import Artist, Album, Song, Review, ReviewSummary, Favorite, Profile, IngestJob, Recommendation
+from .ingest import ingest_spotify_uris, parse_spotify_uri, enqueue_ingest, claim_ingest_jobs, run_ingest_job
+from datetime import timedelta
 from django.test import TestCase
+from django.test import override_settings
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APIClient
+import threading
+import time
+import requests
+from django.conf import settings
+from unittest import mock
+from django.core.cache import cache
+from . import spotify
+from .ratelimit import BACKGROUND, INTERACTIVE, RateLimited, SpotifyRateLimiter, take_token
+from .fake_spotify import FakeSpotifyServer
+from .search import mark_synced, needs_spotify, search_catalog
+from django.utils import timezone
+from django.core.management import call_command
+from io import StringIO
+from . import vectors
+import numpy as np
+import shutil
+import tempfile
 
 
 class CoreAPITests(APITestCase):
@@ -29,8 +51,8 @@ class CoreAPITests(APITestCase):
         """
         response = self.client.get("/api/artists/")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]["name"], "Test Artist")
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["name"], "Test Artist")
 
     def test_create_review(self):
         """
@@ -95,9 +117,9 @@ class CoreAPITests(APITestCase):
 
         # Verify only one review exists and it has the updated content
         response = self.client.get(f"/api/albums/{self.album.id}/reviews/")
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(float(response.data[0]["rating"]), 3.0)
-        self.assertEqual(response.data[0]["review_text"], "Changed my mind - it's just okay.")
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(float(response.data["results"][0]["rating"]), 3.0)
+        self.assertEqual(response.data["results"][0]["review_text"], "Changed my mind - it's just okay.")
 
 
 
@@ -221,7 +243,7 @@ class FavoriteAPITests(APITestCase):
         url = reverse('favorite-list')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(len(response.data['results']), 2)
 
     def test_delete_favorite(self):
         """
@@ -257,14 +279,14 @@ class FavoriteAPITests(APITestCase):
         url = reverse('favorite-albums')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['content_type'], 'album')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['content_type'], 'album')
 
         url = reverse('favorite-songs')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['content_type'], 'song')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['content_type'], 'song')
 
     def test_unauthorized_access(self):
         """
@@ -320,4 +342,1344 @@ class FavoriteAPITests(APITestCase):
         url = reverse('favorite-list')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 0)  # Should only see own favorites
\ No newline at end of file
+        self.assertEqual(len(response.data['results']), 0)  # Should only see own favorites
+
+
+class SpotifyTokenTests(TestCase):
+    def setUp(self):
+        """
+        Start every test with an empty token cache
+        """
+        cache.clear()
+        spotify.token_manager._entry = None
+
+    def token_response(self, token, expires_in=3600):
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {'access_token': token, 'expires_in': expires_in}
+        return response
+
+    @mock.patch.object(spotify.client.session, 'request')
+    def test_token_is_reused_until_expiry(self, post):
+        """
+        Verifies that repeated calls share a single token request
+        """
+        post.return_value = self.token_response('abc')
+        self.assertEqual(spotify.get_spotify_token(), 'abc')
+        self.assertEqual(spotify.get_spotify_token(), 'abc')
+        self.assertEqual(post.call_count, 1)
+
+    @mock.patch.object(spotify.client.session, 'request')
+    def test_token_is_shared_through_cache(self, post):
+        """
+        Verifies that a worker without a local copy picks up the cached token
+        """
+        post.return_value = self.token_response('abc')
+        spotify.get_spotify_token()
+        other_worker = spotify.SpotifyTokenManager()
+        self.assertEqual(other_worker.get_token(), 'abc')
+        self.assertEqual(post.call_count, 1)
+
+    @mock.patch.object(spotify.client.session, 'request')
+    def test_expired_token_is_refreshed(self, post):
+        """
+        Verifies that an expired token triggers a new token request
+        """
+        post.side_effect = [self.token_response('old'), self.token_response('new')]
+        self.assertEqual(spotify.get_spotify_token(), 'old')
+        with mock.patch('core.spotify.time.time', return_value=time.time() + 4000):
+            self.assertEqual(spotify.get_spotify_token(), 'new')
+        self.assertEqual(post.call_count, 2)
+
+    @mock.patch.object(spotify.client.session, 'request')
+    def test_refresh_is_shared_between_workers(self, post):
+        """
+        Verifies that once one worker has refreshed a token due for renewal,
+        other workers adopt it instead of fetching their own
+        """
+        post.side_effect = [self.token_response('old'), self.token_response('new')]
+        workers = [spotify.SpotifyTokenManager(), spotify.SpotifyTokenManager()]
+        for worker in workers:
+            self.assertEqual(worker.get_token(), 'old')
+        in_refresh_window = time.time() + 3600 - settings.SPOTIFY_TOKEN_REFRESH_MARGIN + 1
+        with mock.patch('core.spotify.time.time', return_value=in_refresh_window), \
+                mock.patch.object(spotify.SpotifyTokenManager, '_refresh_in_background',
+                                  lambda manager: manager._background_refresh()):
+            workers[0].get_token()
+            self.assertEqual(workers[1].get_token(), 'new')
+            self.assertEqual(workers[0].get_token(), 'new')
+        self.assertEqual(post.call_count, 2)
+
+    @mock.patch.object(spotify.client.session, 'request')
+    def test_failed_token_request_returns_none(self, post):
+        """
+        Verifies that a failed token request is not cached
+        """
+        post.return_value = mock.Mock(status_code=400)
+        self.assertIsNone(spotify.get_spotify_token())
+        self.assertIsNone(cache.get(spotify.SpotifyTokenManager.cache_key))
+
+
+class SpotifyClientTests(TestCase):
+    def setUp(self):
+        """
+        Stub out backoff sleeps and the rate limiter so retries run instantly
+        """
+        patcher = mock.patch.object(spotify.client, 'sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(spotify.rate_limiter, 'acquire')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(spotify.rate_limiter, 'pause')
+        self.pause = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def response(self, status_code, headers=None):
+        return mock.Mock(status_code=status_code, headers=headers or {})
+
+    @mock.patch.object(spotify.client.session, 'request')
+    def test_server_errors_are_retried(self, request):
+        """
+        Verifies that 5xx responses are retried with backoff
+        """
+        request.side_effect = [self.response(502), self.response(503), self.response(200)]
+        response = spotify.client.api_get('/artists/1', 'token', endpoint='item')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(request.call_count, 3)
+        self.assertEqual(self.sleep.call_count, 2)
+        self.assertEqual(request.call_args.kwargs['timeout'], spotify.client.get_timeout('item'))
+
+    @mock.patch.object(spotify.client.session, 'request')
+    def test_rate_limit_respects_retry_after(self, request):
+        """
+        Verifies that a 429 waits for the Retry-After delay before retrying
+        """
+        request.side_effect = [self.response(429, {'Retry-After': '2'}), self.response(200)]
+        response = spotify.client.api_get('/search', 'token', endpoint='search')
+        self.assertEqual(response.status_code, 200)
+        self.sleep.assert_called_once_with(2.0)
+        self.pause.assert_called_once_with(2.0)
+
+    @mock.patch.object(spotify.client.session, 'request')
+    def test_long_retry_after_is_not_waited_out(self, request):
+        """
+        Verifies that a Retry-After beyond the configured maximum is returned as-is
+        """
+        request.return_value = self.response(429, {'Retry-After': '3600'})
+        response = spotify.client.api_get('/search', 'token', endpoint='search')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(request.call_count, 1)
+        self.sleep.assert_not_called()
+
+    @mock.patch.object(spotify.client.session, 'request')
+    def test_connection_errors_return_none(self, request):
+        """
+        Verifies that a persistently unreachable Spotify yields None
+        """
+        request.side_effect = requests.ConnectionError()
+        self.assertIsNone(spotify.client.api_get('/artists/1', 'token'))
+        self.assertEqual(request.call_count, settings.SPOTIFY_HTTP_MAX_RETRIES + 1)
+
+
+class SpotifySearchCacheTests(TestCase):
+    def setUp(self):
+        """
+        Start every test with an empty search cache
+        """
+        cache.clear()
+        spotify.search_cache.clear()
+
+    def search_response(self, name):
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {'artists': {'items': [{'name': name}]}}
+        return response
+
+    @mock.patch.object(spotify.client.session, 'request')
+    def test_normalized_queries_share_results(self, request):
+        """
+        Verifies that queries differing only in case and spacing hit the cache
+        """
+        request.return_value = self.search_response('Radiohead')
+        first = spotify.search_spotify('Radiohead', None, 'token')
+        second = spotify.search_spotify('  radiohead ', None, 'token')
+        self.assertEqual(first, second)
+        self.assertEqual(request.call_count, 1)
+
+    @mock.patch.object(spotify.client.session, 'request')
+    def test_errors_are_not_cached(self, request):
+        """
+        Verifies that a failed search is retried on the next call
+        """
+        request.side_effect = [mock.Mock(status_code=400), self.search_response('Radiohead')]
+        self.assertIn('error', spotify.search_spotify('radiohead', None, 'token'))
+        self.assertEqual(spotify.search_spotify('radiohead', None, 'token')['artists'][0]['name'], 'Radiohead')
+
+    @override_settings(SPOTIFY_SEARCH_CACHE_SIZE=2)
+    def test_least_recently_used_entry_is_evicted(self):
+        """
+        Verifies that the in-process tier is bounded by SPOTIFY_SEARCH_CACHE_SIZE
+        """
+        search_cache = spotify.SearchCache()
+        search_cache.set('a', {'artists': []})
+        search_cache.set('b', {'artists': []})
+        search_cache.get('a')
+        search_cache.set('c', {'artists': []})
+        self.assertIsNone(search_cache.get('b')[0])
+        self.assertIsNotNone(search_cache.get('a')[0])
+
+    def test_stale_entry_is_served_while_refreshing(self):
+        """
+        Verifies that an expired entry is returned and refreshed in the background
+        """
+        key = spotify.search_cache.make_key('radiohead', None, 10)
+        spotify.search_cache.set(key, {'artists': [{'name': 'Old'}]})
+        later = time.time() + settings.SPOTIFY_SEARCH_CACHE_TTL + 1
+        with mock.patch('core.spotify.time.time', return_value=later), \
+                mock.patch.object(spotify.search_cache, 'refresh_in_background') as refresh:
+            results = spotify.search_spotify('radiohead', None, 'token')
+        self.assertEqual(results['artists'][0]['name'], 'Old')
+        refresh.assert_called_once()
+
+
+SPOTIFY_ARTIST = {
+    'uri': 'spotify:artist:a1', 'id': 'a1', 'name': 'Radiohead',
+    'genres': ['art rock'], 'images': [{'url': 'https://img/a1'}],
+}
+SPOTIFY_ALBUM = {
+    'uri': 'spotify:album:b1', 'id': 'b1', 'name': 'OK Computer',
+    'artists': [{'uri': 'spotify:artist:a1', 'name': 'Radiohead'}],
+    'release_date': '1997', 'release_date_precision': 'year', 'total_tracks': 2,
+    'images': [{'url': 'https://img/b1'}],
+    'tracks': {'items': [
+        {'uri': 'spotify:track:t1', 'name': 'Airbag', 'duration_ms': 284000},
+        {'uri': 'spotify:track:t2', 'name': 'Paranoid Android', 'duration_ms': 383000},
+    ], 'next': None},
+}
+SPOTIFY_TRACK = {
+    'uri': 'spotify:track:t1', 'id': 't1', 'name': 'Airbag', 'duration_ms': 284000,
+    'artists': [{'uri': 'spotify:artist:a1', 'name': 'Radiohead'}],
+    'album': {
+        'uri': 'spotify:album:b1', 'id': 'b1', 'name': 'OK Computer',
+        'artists': [{'uri': 'spotify:artist:a1', 'name': 'Radiohead'}],
+        'release_date': '1997', 'release_date_precision': 'year', 'total_tracks': 2,
+        'images': [{'url': 'https://img/b1'}],
+    },
+}
+
+
+def fake_spotify_get(path, token, endpoint='default', params=None, **kwargs):
+    """
+    Answer Spotify API paths from the fixtures above
+    """
+    catalog = {'artists': [SPOTIFY_ARTIST], 'albums': [SPOTIFY_ALBUM], 'tracks': [SPOTIFY_TRACK]}
+    kind = path.strip('/').split('/')[0]
+    items = {item['id']: item for item in catalog.get(kind, [])}
+    response = mock.Mock(status_code=200)
+    if params and 'ids' in params:
+        response.json.return_value = {kind: [items.get(i) for i in params['ids'].split(',')]}
+    elif path.endswith('/tracks') and kind == 'albums':
+        response.json.return_value = SPOTIFY_ALBUM['tracks']
+    else:
+        response.json.return_value = items[path.rstrip('/').split('/')[-1]]
+    return response
+
+
+class SpotifyIngestTests(TestCase):
+    def setUp(self):
+        """
+        Start with no ingest locks or rate limit state
+        """
+        cache.clear()
+
+    def test_parse_spotify_uri(self):
+        """
+        Verifies that URIs and open.spotify.com URLs are both understood
+        """
+        self.assertEqual(parse_spotify_uri('spotify:album:b1'), ('album', 'b1'))
+        self.assertEqual(parse_spotify_uri('https://open.spotify.com/track/t1?si=x'), ('track', 't1'))
+        self.assertEqual(parse_spotify_uri('nonsense'), (None, None))
+
+    @mock.patch.object(spotify.client, 'api_get', side_effect=fake_spotify_get)
+    def test_bulk_ingest_uses_several_items_endpoints(self, api_get):
+        """
+        Verifies that a track pulls in its album, artist and album tracks with
+        one request per type
+        """
+        imported = ingest_spotify_uris(['spotify:track:t1', 'spotify:album:b1'], token='token')
+        self.assertEqual(api_get.call_count, 3)
+        self.assertEqual(imported['spotify:track:t1'].title, 'Airbag')
+        self.assertEqual(imported['spotify:album:b1'].release_date.isoformat(), '1997-01-01')
+        self.assertEqual(Artist.objects.count(), 1)
+        self.assertEqual(Song.objects.filter(album__spotify_uri='spotify:album:b1').count(), 2)
+
+    @mock.patch.object(spotify.client, 'api_get', side_effect=fake_spotify_get)
+    def test_bulk_ingest_skips_existing_rows(self, api_get):
+        """
+        Verifies that items already in the database are not fetched again
+        """
+        artist = Artist.objects.create(name='Radiohead', genre='art rock', spotify_uri='spotify:artist:a1')
+        imported = ingest_spotify_uris(['spotify:artist:a1'], token='token')
+        self.assertEqual(imported['spotify:artist:a1'], artist)
+        api_get.assert_not_called()
+
+    def test_album_import_follows_track_pagination(self):
+        """
+        Verifies that create_resource imports every page of an album's tracks
+        and skips songs that already exist
+        """
+        Artist.objects.create(name='Radiohead', genre='art rock', spotify_uri='spotify:artist:a1')
+        existing = Album.objects.create(title='Other', artist=Artist.objects.get(), genre='', release_date='1995-01-01')
+        Song.objects.create(title='Airbag', artist=existing.artist, album=existing,
+                            duration=timedelta(seconds=1), spotify_uri='spotify:track:t1')
+        pages = {
+            '/albums/b1/tracks': {'items': SPOTIFY_ALBUM['tracks']['items'][:1], 'next': 'https://api/page2'},
+            'https://api/page2': {'items': SPOTIFY_ALBUM['tracks']['items'][1:], 'next': None},
+        }
+
+        def api_get(path, token, endpoint='default', params=None, **kwargs):
+            if path in pages:
+                return mock.Mock(status_code=200, json=mock.Mock(return_value=pages[path]))
+            return fake_spotify_get(path, token, endpoint, params, **kwargs)
+
+        with mock.patch.object(spotify.client, 'api_get', side_effect=api_get):
+            album = spotify.create_resource('album', 'spotify:album:b1', 'token')
+        self.assertEqual(list(album.songs.values_list('title', flat=True)), ['Paranoid Android'])
+        self.assertEqual(Song.objects.count(), 2)
+
+    def test_track_with_known_artist_and_album_costs_one_call(self):
+        """
+        Verifies that create_resource resolves stored artists and albums
+        without going back to Spotify
+        """
+        artist = Artist.objects.create(name='Radiohead', genre='art rock', spotify_uri='spotify:artist:a1')
+        Album.objects.create(title='OK Computer', artist=artist, genre='art rock',
+                             release_date='1997-01-01', spotify_uri='spotify:album:b1')
+        with mock.patch.object(spotify.client, 'api_get', side_effect=fake_spotify_get) as api_get:
+            song = spotify.create_resource('track', 'spotify:track:t1', 'token')
+        self.assertEqual(song.album.spotify_uri, 'spotify:album:b1')
+        self.assertEqual(api_get.call_count, 1)
+
+    def test_ingest_context_is_shared_across_a_batch(self):
+        """
+        Verifies that a batch sharing a context fetches each item only once
+        """
+        context = spotify.IngestContext()
+        with mock.patch.object(spotify.client, 'api_get', side_effect=fake_spotify_get) as api_get:
+            song = spotify.create_resource('track', 'spotify:track:t1', 'token', context)
+            calls = api_get.call_count
+            album = spotify.create_resource('album', 'spotify:album:b1', 'token', context)
+            artist = spotify.create_resource('artist', 'spotify:artist:a1', 'token', context)
+        self.assertEqual(api_get.call_count, calls)
+        self.assertEqual(song.album, album)
+        self.assertEqual(album.artist, artist)
+
+
+class IngestQueueTests(APITestCase):
+    def setUp(self):
+        """
+        Create an authenticated user with a profile
+        """
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.profile = Profile.objects.create(user=self.user)
+        self.client.force_authenticate(user=self.user)
+
+    def test_enqueue_is_idempotent(self):
+        """
+        Verifies that enqueueing the same URI twice yields one job
+        """
+        first = enqueue_ingest('album', 'spotify:album:b1')
+        second = enqueue_ingest('album', 'spotify:album:b1')
+        self.assertEqual(first, second)
+        self.assertEqual(IngestJob.objects.count(), 1)
+
+    def test_add_search_queues_unknown_items(self):
+        """
+        Verifies that an unseen item is queued and shown as pending in recent
+        searches, then resolved once the worker imports it
+        """
+        with mock.patch.object(spotify.client, 'api_get', side_effect=fake_spotify_get) as api_get:
+            response = self.client.get('/api/search/add/', {'content_type': 'Album', 'content_id': 'spotify:album:b1'})
+            api_get.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        response = self.client.get('/api/profiles/recent_searches/')
+        self.assertEqual(response.data[0]['type'], 'Album')
+        self.assertIsNone(response.data[0]['object_id'])
+
+        [job] = claim_ingest_jobs()
+        self.assertEqual(job.status, IngestJob.PENDING)
+        self.assertEqual(IngestJob.objects.get().status, IngestJob.RUNNING)
+        with mock.patch.object(spotify.client, 'api_get', side_effect=fake_spotify_get), \
+                mock.patch('core.ingest.get_spotify_token', return_value='token'):
+            album = run_ingest_job(job)
+
+        self.assertEqual(IngestJob.objects.get().status, IngestJob.DONE)
+        response = self.client.get('/api/profiles/recent_searches/')
+        self.assertEqual(response.data[0]['title'], 'OK Computer')
+        self.assertEqual(response.data[0]['object_id'], album.id)
+
+    def test_add_search_rejects_bad_content_id(self):
+        """
+        Verifies that a content_id which isn't a Spotify URI of the given type
+        is rejected instead of queued
+        """
+        for content_id in ('nonsense', 'spotify:track:t1'):
+            response = self.client.get('/api/search/add/', {'content_type': 'Album', 'content_id': content_id})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IngestJob.objects.exists())
+
+    def test_recent_searches_query_count(self):
+        """
+        Verifies that recent searches are resolved with one query per content
+        type, however many there are
+        """
+        artist = Artist.objects.create(name='Radiohead', genre='Rock')
+        other = Profile.objects.create(user=User.objects.create_user(username='other', password='testpass123'))
+        self.profile.add_recent_search(artist)
+        self.profile.add_recent_search(other)
+        self.profile.add_recent_search(enqueue_ingest('album', 'spotify:album:b1'))
+        for i in range(2):
+            album = Album.objects.create(title=f'Album {i}', artist=artist, genre='Rock', release_date='2023-01-01')
+            self.profile.add_recent_search(album)
+            self.profile.add_recent_search(Song.objects.create(title=f'Song {i}', artist=artist, album=album,
+                                                               duration='00:03:30'))
+            # Albums, songs, artists, profiles and the pending import's job
+            with self.assertNumQueries(5):
+                response = self.client.get('/api/profiles/recent_searches/')
+            self.assertEqual(len(response.data), 5 + 2 * i)
+        self.assertEqual(response.data[0]['title'], 'Song 1')
+        self.assertEqual(response.data[-1]['title'], 'Radiohead')
+        self.assertEqual(response.data[-2]['title'], str(other))
+
+    def test_failed_imports_leave_recent_searches(self):
+        """
+        Verifies that searches for items whose import failed, or was never
+        queued, aren't shown as pending forever
+        """
+        job = enqueue_ingest('album', 'spotify:album:b1')
+        self.profile.add_recent_search(job)
+        self.profile.add_recent_search(enqueue_ingest('album', 'spotify:album:b2'))
+        # Never queued, e.g. its job row was deleted
+        self.profile.recent_search_items.append(
+            {'type': 'song', 'uri': 'spotify:track:gone', 'at': '2025-01-01T00:00:00+00:00'})
+        IngestJob.objects.filter(pk=job.pk).update(status=IngestJob.FAILED)
+        response = self.client.get('/api/profiles/recent_searches/')
+        self.assertEqual([search['title'] for search in response.data], ['spotify:album:b2'])
+
+    @override_settings(RECENT_SEARCH_LIMIT=3)
+    def test_recent_searches_are_capped_and_coalesced(self):
+        """
+        Verifies that recent searches keep the newest RECENT_SEARCH_LIMIT
+        items, that searching again moves an item to the front, and that
+        repeating the latest search writes nothing
+        """
+        artist = Artist.objects.create(name='Radiohead', genre='Rock')
+        albums = [
+            Album.objects.create(title=f'Album {i}', artist=artist, genre='Rock', release_date='2023-01-01')
+            for i in range(4)
+        ]
+        for album in albums:
+            with self.assertNumQueries(1):
+                self.profile.add_recent_search(album)
+        with self.assertNumQueries(0):
+            self.profile.add_recent_search(albums[3])
+        self.profile.add_recent_search(albums[2])
+
+        self.profile.refresh_from_db()
+        titles = [search['object'].title for search in self.profile.recent_searches()]
+        self.assertEqual(titles, ['Album 2', 'Album 3', 'Album 1'])
+
+    def test_failed_jobs_are_retried_then_abandoned(self):
+        """
+        Verifies that a failing job goes back to the queue until it runs out
+        of attempts
+        """
+        enqueue_ingest('album', 'spotify:album:missing')
+        with mock.patch('core.ingest.get_spotify_token', return_value=None):
+            for _ in range(settings.INGEST_JOB_MAX_ATTEMPTS):
+                [job] = claim_ingest_jobs()
+                run_ingest_job(job)
+        self.assertEqual(IngestJob.objects.get().status, IngestJob.FAILED)
+        self.assertEqual(claim_ingest_jobs(), [])
+
+
+@override_settings(SPOTIFY_RATE_LIMIT_RATE=1, SPOTIFY_RATE_LIMIT_BURST=4, SPOTIFY_RATE_LIMIT_BACKGROUND_RESERVE=0.5)
+class RateLimiterTests(TestCase):
+    backend = 'cache'
+
+    def setUp(self):
+        """
+        Freeze time so bucket refills are deterministic
+        """
+        cache.clear()
+        self.now = 1000.0
+        patcher = mock.patch('core.ratelimit.time.time', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.limiter = SpotifyRateLimiter()
+        self.limiter.sleep = self.advance
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def drain(self, priority):
+        taken = 0
+        while True:
+            try:
+                with override_settings(SPOTIFY_RATE_LIMIT_MAX_WAIT={INTERACTIVE: 0, BACKGROUND: 0}):
+                    self.limiter.acquire(priority)
+            except RateLimited:
+                return taken
+            taken += 1
+
+    def test_background_leaves_reserve_for_interactive(self):
+        """
+        Verifies that background requests cannot use the interactive reserve
+        """
+        with override_settings(SPOTIFY_RATE_LIMIT_BACKEND=self.backend):
+            self.assertEqual(self.drain(BACKGROUND), 2)
+            self.assertEqual(self.drain(INTERACTIVE), 2)
+
+    def test_waits_for_refill(self):
+        """
+        Verifies that an empty bucket waits for the next token
+        """
+        with override_settings(SPOTIFY_RATE_LIMIT_BACKEND=self.backend):
+            self.drain(INTERACTIVE)
+            start = self.now
+            self.limiter.acquire(INTERACTIVE)
+            self.assertAlmostEqual(self.now - start, 1.0)
+
+    def test_pause_blocks_all_requests(self):
+        """
+        Verifies that a 429 pause applies even with tokens left
+        """
+        with override_settings(SPOTIFY_RATE_LIMIT_BACKEND=self.backend):
+            self.limiter.pause(30)
+            with self.assertRaises(RateLimited):
+                self.limiter.acquire(INTERACTIVE)
+            start = self.now
+            self.limiter.acquire(BACKGROUND)
+            self.assertGreaterEqual(self.now - start, 30)
+
+
+    def test_pause_during_acquire_is_kept(self):
+        """
+        Verifies that a pause set while another worker is updating the
+        bucket isn't overwritten by that update
+        """
+        def take_and_pause(*args):
+            wait = take_token(*args)
+            # Another worker gets a 429 while this one holds the bucket
+            self.limiter.pause(30)
+            return wait
+
+        with override_settings(SPOTIFY_RATE_LIMIT_BACKEND=self.backend):
+            with mock.patch('core.ratelimit.take_token', side_effect=take_and_pause):
+                self.limiter.acquire(INTERACTIVE)
+            with self.assertRaises(RateLimited):
+                self.limiter.acquire(INTERACTIVE)
+
+
+class DatabaseRateLimiterTests(RateLimiterTests):
+    backend = 'database'
+
+
+class FakeSpotifyTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """
+        Serve the recorded fixtures on a free local port
+        """
+        super().setUpClass()
+        cls.server = FakeSpotifyServer(('127.0.0.1', 0))
+        cls.server.start_in_background()
+        cls.settings_override = override_settings(
+            SPOTIFY_API_URL=f"{cls.server.base_url}/v1",
+            SPOTIFY_TOKEN_URL=f"{cls.server.base_url}/api/token",
+        )
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        """
+        Start with no cached token or searches
+        """
+        cache.clear()
+        spotify.token_manager._entry = None
+        spotify.search_cache.clear()
+
+    def test_search_and_ingest_against_fake_server(self):
+        """
+        Verifies that search and create_resource work end to end offline,
+        including track pagination on a 60 track album
+        """
+        token = spotify.get_spotify_token()
+        self.assertEqual(token, 'fake-token')
+        results = spotify.search_spotify('late set', None, token)
+        album_uri = results['albums'][0]['uri']
+
+        album = spotify.create_resource('album', album_uri, token)
+        self.assertEqual(album.songs.count(), 60)
+        self.assertEqual(str(album.release_date), '2016-09-01')
+        self.assertEqual(album.artist.name, 'Marlow Reyes')
+
+    def test_injected_errors_are_retried(self):
+        """
+        Verifies that the client gives up cleanly when every request fails
+        """
+        self.server.error_rate = 1
+        self.addCleanup(setattr, self.server, 'error_rate', 0)
+        with mock.patch.object(spotify.client, 'sleep'):
+            self.assertIsNone(spotify.get_spotify_item('artist', '0fixtureartist000000001', 'fake-token'))
+
+
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        """
+        Leave no ingest locks behind for other tests
+        """
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_concurrent_callers_share_one_call(self):
+        """
+        Verifies that concurrent work on the same key runs once and every
+        caller gets the leader's result
+        """
+        flight = spotify.SingleFlight()
+        calls = []
+        started = threading.Event()
+
+        def work():
+            calls.append(1)
+            started.set()
+            time.sleep(0.2)
+            return 'album'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(flight.do('spotify:album:b1', work, lambda: None)))
+            for _ in range(5)
+        ]
+        threads[0].start()
+        started.wait()
+        for thread in threads[1:]:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['album'] * 5)
+
+    def test_waits_for_row_from_another_process(self):
+        """
+        Verifies that a caller finding another process's lock waits for the
+        row instead of fetching it again
+        """
+        flight = spotify.SingleFlight()
+        cache.add('ingest:lock:spotify:album:b1', True)
+        work = mock.Mock()
+        lookup = mock.Mock(side_effect=[None, 'album'])
+        with mock.patch('core.spotify.time.sleep'):
+            self.assertEqual(flight.do('spotify:album:b1', work, lookup), 'album')
+        work.assert_not_called()
+
+    def test_spotify_uri_is_unique(self):
+        """
+        Verifies that the database rejects a second row for the same URI
+        """
+        Artist.objects.create(name='Radiohead', genre='', spotify_uri='spotify:artist:a1')
+        with self.assertRaises(IntegrityError):
+            Artist.objects.create(name='Radiohead', genre='', spotify_uri='spotify:artist:a1')
+
+
+class CatalogSearchTests(APITestCase):
+    def setUp(self):
+        """
+        Create a small catalog
+        """
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.radiohead = Artist.objects.create(name='Radiohead', genre='art rock')
+        self.portishead = Artist.objects.create(name='Portishead', genre='trip hop')
+        self.album = Album.objects.create(title='OK Computer', artist=self.radiohead, genre='art rock',
+                                          release_date='1997-05-21')
+        Album.objects.create(title='Dummy', artist=self.portishead, genre='trip hop', release_date='1994-08-22')
+        Song.objects.create(title='Karma Police', artist=self.radiohead, album=self.album,
+                            duration=timedelta(minutes=4))
+
+    def test_search_ranks_best_match_first(self):
+        """
+        Verifies that catalog search finds rows by name, artist and typo
+        """
+        results = search_catalog('radiohaed')
+        self.assertEqual(results['artists'][0], self.radiohead)
+        self.assertEqual(search_catalog('ok computer')['albums'], [self.album])
+        self.assertEqual(search_catalog('Rádiohead karma')['songs'][0].title, 'Karma Police')
+
+    def test_search_text_follows_artist_rename(self):
+        """
+        Verifies that renaming an artist re-indexes their albums and songs
+        """
+        artist = Artist.objects.get(pk=self.radiohead.pk)
+        artist.name = 'On A Friday'
+        artist.save()
+        self.assertEqual(search_catalog('on a friday')['albums'], [self.album])
+
+    def test_album_list_search_param(self):
+        """
+        Verifies that the album list endpoint's search uses the catalog index
+        """
+        response = self.client.get('/api/albums/', {'search': 'radiohead'})
+        self.assertEqual([album['title'] for album in response.data['results']], ['OK Computer'])
+        self.assertNotIn('search_text', response.data['results'][0])
+        self.assertIsNone(response.data['next'])
+
+    @override_settings(SEARCH_LOCAL_MIN_RESULTS=1)
+    def test_search_view_answers_locally(self):
+        """
+        Verifies that /api/search/ doesn't call Spotify when every section
+        has enough fresh local results
+        """
+        with mock.patch('core.search.get_spotify_token') as get_token:
+            response = self.client.get('/api/search/', {'q': 'radiohead'})
+        get_token.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['artists'][0]['name'], 'Radiohead')
+        self.assertEqual(response.data['artists'][0]['source'], 'local')
+        self.assertEqual(response.data['tracks'][0]['name'], 'Karma Police')
+
+    def test_search_view_merges_spotify_results(self):
+        """
+        Verifies that Spotify tops up sparse local results without duplicating
+        items we already have
+        """
+        Artist.objects.filter(pk=self.radiohead.pk).update(
+            spotify_uri='spotify:artist:radiohead', synced_at=timezone.now() - timedelta(days=30))
+        spotify_results = {
+            'artists': [
+                {'uri': 'spotify:artist:radiohead', 'name': 'Radiohead'},
+                {'uri': 'spotify:artist:thom', 'name': 'Thom Yorke'},
+            ],
+            'albums': [],
+            'tracks': [],
+        }
+        with mock.patch('core.search.get_spotify_token', return_value='token'), \
+                mock.patch('core.search.search_spotify', return_value=spotify_results):
+            response = self.client.get('/api/search/', {'q': 'radiohead'})
+        artists = response.data['artists']
+        self.assertEqual([(a['name'], a['source']) for a in artists],
+                         [('Radiohead', 'local'), ('Thom Yorke', 'spotify')])
+        self.radiohead.refresh_from_db()
+        self.assertGreater(self.radiohead.synced_at, timezone.now() - timedelta(minutes=1))
+
+    @override_settings(SEARCH_LOCAL_MIN_RESULTS=1)
+    def test_spotify_results_refresh_stale_rows(self):
+        """
+        Verifies that stored rows Spotify returns are marked as synced, so a
+        stale row only sends searches upstream until Spotify confirms it
+        """
+        Artist.objects.filter(pk=self.radiohead.pk).update(
+            spotify_uri='spotify:artist:radiohead', synced_at=timezone.now() - timedelta(days=30))
+        self.assertTrue(needs_spotify(search_catalog('radiohead')))
+        mark_synced({'artists': [{'uri': 'spotify:artist:radiohead', 'name': 'Radiohead'}]})
+        self.assertFalse(needs_spotify(search_catalog('radiohead')))
+
+    def test_search_view_without_spotify(self):
+        """
+        Verifies that local results are still served when Spotify auth fails
+        """
+        with mock.patch('core.search.get_spotify_token', return_value=None):
+            response = self.client.get('/api/search/', {'q': 'radiohead'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['artists'][0]['name'], 'Radiohead')
+            response = self.client.get('/api/search/', {'q': 'zzzz'})
+            self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+    @override_settings(SEARCH_DEADLINE=0.2)
+    def test_search_view_deadline(self):
+        """
+        Verifies that a slow Spotify search doesn't hold up the response
+        """
+        released = threading.Event()
+
+        def slow_search(*args, **kwargs):
+            released.wait(5)
+            return {'artists': [{'uri': 'spotify:artist:late', 'name': 'Late'}]}
+
+        with mock.patch('core.search.get_spotify_token', return_value='token'), \
+                mock.patch('core.search.search_spotify', side_effect=slow_search):
+            start = time.monotonic()
+            response = self.client.get('/api/search/', {'q': 'radiohead'})
+            elapsed = time.monotonic() - start
+            released.set()
+        self.assertLess(elapsed, 2)
+        self.assertTrue(response.data['partial'])
+        self.assertEqual([a['name'] for a in response.data['artists']], ['Radiohead'])
+        self.assertEqual(response.data['error'], 'Spotify search timed out')
+
+class ProfileSearchTests(APITestCase):
+    def setUp(self):
+        """
+        Create users whose names overlap in different ways
+        """
+        for username in ['sam', 'Samantha', 'samuel_k', 'big_sam', 'pam']:
+            user = User.objects.create_user(username=username, password='testpass123')
+            Profile.objects.create(user=user)
+        self.client.force_authenticate(user=user)
+
+    def test_prefix_matches_rank_first(self):
+        """
+        Verifies that autocomplete is case-insensitive and lists prefix matches
+        before infix ones
+        """
+        response = self.client.get('/api/search/profiles/', {'q': 'SAM'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p['username'] for p in response.data['profiles']],
+                         ['sam', 'Samantha', 'samuel_k', 'big_sam'])
+        self.assertEqual(set(response.data['profiles'][0]), {'id', 'username', 'display_picture'})
+
+    def test_limit_and_empty_query(self):
+        """
+        Verifies the limit parameter and that an empty query returns nothing
+        """
+        response = self.client.get('/api/search/profiles/', {'q': 'sam', 'limit': 2})
+        self.assertEqual([p['username'] for p in response.data['profiles']], ['sam', 'Samantha'])
+        response = self.client.get('/api/search/profiles/', {'q': ''})
+        self.assertEqual(response.data['profiles'], [])
+
+    def test_rename_updates_index(self):
+        """
+        Verifies that renaming a user keeps their profile findable
+        """
+        user = User.objects.get(username='pam')
+        user.username = 'Pamela'
+        user.save()
+        self.assertEqual(Profile.objects.get(user=user).username_key, 'pamela')
+        response = self.client.get('/api/search/profiles/', {'q': 'pame'})
+        self.assertEqual([p['username'] for p in response.data['profiles']], ['Pamela'])
+
+
+class RatingTotalsTests(APITestCase):
+    def setUp(self):
+        """
+        Create an album and song to review
+        """
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.other = User.objects.create_user(username='other', password='testpass123')
+        self.artist = Artist.objects.create(name='Test Artist', genre='Rock')
+        self.album = Album.objects.create(title='Test Album', artist=self.artist, genre='Rock',
+                                          release_date='2023-01-01')
+        self.song = Song.objects.create(title='Test Song', artist=self.artist, album=self.album,
+                                        duration=timedelta(minutes=3))
+
+    def test_totals_follow_review_changes(self):
+        """
+        Verifies that creating, editing, moving and deleting reviews keeps
+        the running totals and average in step
+        """
+        first = Review.objects.create(user=self.user, content_type='album', content_id=self.album.id,
+                                      rating=4.0, review_text='Good')
+        second = Review.objects.create(user=self.other, content_type='album', content_id=self.album.id,
+                                       rating=5.0, review_text='Great')
+        self.album.refresh_from_db()
+        self.assertEqual((self.album.rating_sum, self.album.rating_count), (9, 2))
+        self.assertEqual(str(self.album.average_rating), '4.5')
+
+        review = Review.objects.get(pk=first.pk)
+        review.rating = 2.0
+        review.save()
+        self.album.refresh_from_db()
+        self.assertEqual(str(self.album.average_rating), '3.5')
+
+        second.content_type, second.content_id = 'track', self.song.id
+        second.save()
+        self.album.refresh_from_db()
+        self.song.refresh_from_db()
+        self.assertEqual((self.album.rating_count, str(self.album.average_rating)), (1, '2.0'))
+        self.assertEqual((self.song.rating_count, str(self.song.average_rating)), (1, '5.0'))
+
+        Review.objects.all().delete()
+        self.album.refresh_from_db()
+        self.assertEqual((self.album.rating_sum, self.album.rating_count), (0, 0))
+        self.assertEqual(str(self.album.average_rating), '0.0')
+
+    def test_review_cost_is_constant(self):
+        """
+        Verifies that adding a review doesn't read the item's other reviews
+        """
+        for i in range(5):
+            user = User.objects.create_user(username=f'user{i}', password='testpass123')
+            Review.objects.create(user=user, content_type='album', content_id=self.album.id,
+                                  rating=3.0, review_text='Fine')
+        # Savepoint, insert, item totals, item summary, author's review count, release
+        with self.assertNumQueries(6):
+            Review.objects.create(user=self.user, content_type='album', content_id=self.album.id,
+                                  rating=4.0, review_text='Good')
+
+    def test_api_review_cost_is_constant(self):
+        """
+        Verifies that posting or overwriting a review through the API adjusts
+        the item's totals instead of re-reading its other reviews
+        """
+        for i in range(5):
+            user = User.objects.create_user(username=f'user{i}', password='testpass123')
+            Review.objects.create(user=user, content_type='album', content_id=self.album.id,
+                                  rating=3.0, review_text='Fine')
+        self.client.force_authenticate(user=self.user)
+        data = {'content_type': 'album', 'content_id': self.album.id, 'rating': 4.0, 'review_text': 'Good'}
+        # Lock lookup, insert, item totals, item summary, author's review
+        # count, and three savepoints with their releases
+        with self.assertNumQueries(11):
+            response = self.client.post('/api/reviews/', data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        # Lock lookup, update, item totals, item summary, savepoints
+        with self.assertNumQueries(8):
+            self.client.post('/api/reviews/', dict(data, rating=5.0))
+        self.album.refresh_from_db()
+        self.assertEqual((self.album.rating_sum, self.album.rating_count), (20, 6))
+
+    def test_api_review_updates_summary_incrementally(self):
+        """
+        Verifies that overwriting a review through the API moves it between
+        histogram buckets without re-aggregating the item's reviews
+        """
+        self.client.force_authenticate(user=self.user)
+        data = {'content_type': 'album', 'content_id': self.album.id, 'rating': 4.0, 'review_text': 'Good'}
+        self.client.post('/api/reviews/', data)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post('/api/reviews/', dict(data, rating=5.0))
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql'].upper()])
+        summary = ReviewSummary.objects.get(content_type='album', content_id=self.album.id)
+        self.assertEqual((summary.total, summary.count_8, summary.count_10), (1, 0, 1))
+
+    def test_edit_onto_reviewed_item_is_rejected(self):
+        """
+        Verifies that moving a review onto an item the user already reviewed
+        returns 400 rather than violating the one-review-per-item constraint
+        """
+        Review.objects.create(user=self.user, content_type='album', content_id=self.album.id,
+                              rating=4.0, review_text='Good')
+        song_review = Review.objects.create(user=self.user, content_type='track', content_id=self.song.id,
+                                            rating=3.0, review_text='Fine')
+        self.client.force_authenticate(user=self.user)
+        response = self.client.patch(f'/api/reviews/{song_review.id}/',
+                                     {'content_type': 'album', 'content_id': self.album.id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(f'/api/reviews/{song_review.id}/', {'rating': 2.0})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_reconcile_repairs_drift(self):
+        """
+        Verifies that the reconcile_ratings command recounts drifted totals
+        """
+        Review.objects.create(user=self.user, content_type='album', content_id=self.album.id,
+                              rating=4.0, review_text='Good')
+        Album.objects.filter(pk=self.album.pk).update(rating_sum=40, rating_count=7, average_rating=5.7)
+        out = StringIO()
+        call_command('reconcile_ratings', stdout=out)
+        self.assertIn('Repaired 1 drifted Album rating totals', out.getvalue())
+        self.album.refresh_from_db()
+        self.assertEqual((self.album.rating_sum, self.album.rating_count), (4, 1))
+        self.assertEqual(str(self.album.average_rating), '4.0')
+
+    def test_recompute_ratings(self):
+        """
+        Verifies that recompute_ratings rewrites totals in bulk, optionally
+        only for items reviewed since a date
+        """
+        Review.objects.create(user=self.user, content_type='album', content_id=self.album.id,
+                              rating=4.0, review_text='Good')
+        Review.objects.create(user=self.other, content_type='album', content_id=self.album.id,
+                              rating=3.0, review_text='Okay')
+        Review.objects.create(user=self.user, content_type='track', content_id=self.song.id,
+                              rating=5.0, review_text='Great')
+        Album.objects.update(rating_sum=0, rating_count=0, average_rating=0)
+        Song.objects.update(rating_sum=0, rating_count=0, average_rating=0)
+
+        out = StringIO()
+        call_command('recompute_ratings', '--since', '2999-01-01', stdout=out)
+        self.album.refresh_from_db()
+        self.assertEqual(self.album.rating_count, 0)
+
+        call_command('recompute_ratings', '--since', '2000-01-01', '--batch-size', '1', stdout=out)
+        self.album.refresh_from_db()
+        self.song.refresh_from_db()
+        self.assertEqual((self.album.rating_sum, self.album.rating_count), (7, 2))
+        self.assertEqual(str(self.album.average_rating), '3.5')
+        self.assertEqual((self.song.rating_count, str(self.song.average_rating)), (1, '5.0'))
+
+        Album.objects.update(rating_sum=0, rating_count=0, average_rating=0)
+        call_command('recompute_ratings', stdout=out)
+        self.album.refresh_from_db()
+        self.assertEqual((self.album.rating_count, str(self.album.average_rating)), (2, '3.5'))
+        self.assertIn('Recomputed 1 Album rating totals', out.getvalue())
+
+    def test_review_upsert(self):
+        """
+        Verifies that resubmitting a review overwrites it in place and keeps
+        the item's totals right
+        """
+        self.client.force_authenticate(user=self.user)
+        data = {'content_type': 'album', 'content_id': self.album.id, 'rating': 4.0, 'review_text': 'Good'}
+        first = self.client.post('/api/reviews/', data)
+        second = self.client.post('/api/reviews/', {**data, 'rating': 2.0, 'review_text': 'Meh'})
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.data['id'], first.data['id'])
+        self.assertEqual(second.data['created_at'], first.data['created_at'])
+        self.assertEqual(Review.objects.count(), 1)
+        self.album.refresh_from_db()
+        self.assertEqual((self.album.rating_count, str(self.album.average_rating)), (1, '2.0'))
+        with self.assertRaises(IntegrityError):
+            Review.objects.create(user=self.user, content_type='album', content_id=self.album.id,
+                                  rating=1.0, review_text='Again')
+
+    def test_review_batch(self):
+        """
+        Verifies that a batch of reviews is written in one request
+        """
+        self.client.force_authenticate(user=self.user)
+        Review.objects.create(user=self.user, content_type='track', content_id=self.song.id,
+                              rating=1.0, review_text='Old')
+        response = self.client.post('/api/reviews/batch/', [
+            {'content_type': 'album', 'content_id': self.album.id, 'rating': 4.0, 'review_text': 'Good'},
+            {'content_type': 'track', 'content_id': self.song.id, 'rating': 5.0, 'review_text': 'Great'},
+            {'content_type': 'artist', 'content_id': self.artist.id, 'rating': 3.0, 'review_text': 'Okay'},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([float(review['rating']) for review in response.data], [4.0, 5.0, 3.0])
+        self.assertEqual(Review.objects.filter(user=self.user).count(), 3)
+        self.song.refresh_from_db()
+        self.artist.refresh_from_db()
+        self.assertEqual((self.song.rating_count, str(self.song.average_rating)), (1, '5.0'))
+        self.assertEqual(str(self.artist.average_rating), '3.0')
+
+    def test_review_summary(self):
+        """
+        Verifies that the rating histogram follows review writes and is
+        shown on the detail endpoints
+        """
+        self.client.force_authenticate(user=self.user)
+        first = Review.objects.create(user=self.user, content_type='album', content_id=self.album.id,
+                                      rating=4.5, review_text='Great')
+        Review.objects.create(user=self.other, content_type='album', content_id=self.album.id,
+                              rating=4.7, review_text='Great')
+        self.client.post('/api/reviews/batch/', [
+            {'content_type': 'track', 'content_id': self.song.id, 'rating': 2.0, 'review_text': 'Meh'},
+        ], format='json')
+
+        response = self.client.get(f'/api/albums/{self.album.id}/')
+        summary = response.data['review_summary']
+        self.assertEqual(summary['total'], 2)
+        self.assertEqual(summary['average'], '4.6')
+        self.assertEqual(summary['histogram']['4.5'], 2)
+        self.assertEqual(sum(summary['histogram'].values()), 2)
+        self.assertIsNotNone(summary['latest_review_at'])
+        self.assertNotIn('review_summary', self.client.get('/api/albums/').data['results'][0])
+
+        review = Review.objects.get(pk=first.pk)
+        review.rating = 1.0
+        review.save()
+        self.other.delete()
+        summary = ReviewSummary.objects.get(content_type='album', content_id=self.album.id)
+        self.assertEqual((summary.total, summary.count_2, summary.count_9), (1, 1, 0))
+        self.assertEqual(summary.latest_review_at, review.created_at)
+
+        summary = self.client.get(f'/api/songs/{self.song.id}/').data['review_summary']
+        self.assertEqual((summary['total'], summary['histogram']['2.0']), (1, 1))
+        summary = self.client.get(f'/api/artists/{self.artist.id}/').data['review_summary']
+        self.assertEqual((summary['total'], summary['latest_review_at']), (0, None))
+
+
+class ProfileCounterTests(APITestCase):
+    def setUp(self):
+        """
+        Create a user with a profile and some catalog items
+        """
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.profile = Profile.objects.create(user=self.user)
+        self.client.force_authenticate(user=self.user)
+        self.artist = Artist.objects.create(name='Test Artist', genre='Rock')
+        self.album = Album.objects.create(title='Test Album', artist=self.artist, genre='Rock',
+                                          release_date='2023-01-01')
+
+    def test_counters_follow_writes(self):
+        """
+        Verifies that review and favorite counters are kept on the profile
+        """
+        self.client.post('/api/reviews/', {'content_type': 'album', 'content_id': self.album.id,
+                                           'rating': 4.0, 'review_text': 'Good'})
+        review = Review.objects.create(user=self.user, content_type='artist', content_id=self.artist.id,
+                                       rating=3.0, review_text='Okay')
+        self.client.post('/api/favorites/', {'content_type': 'album', 'content_id': self.album.id,
+                                             'user': self.user.id})
+        Favorite.objects.create(user=self.user, content_type='artist', content_id=self.artist.id)
+        self.profile.refresh_from_db()
+        self.assertEqual((self.profile.reviews, self.profile.favorite_albums, self.profile.favorite_artists), (2, 1, 1))
+
+        review.delete()
+        Favorite.objects.filter(content_type='album').delete()
+        response = self.client.get('/api/profiles/me/')
+        self.assertEqual((response.data['reviews'], response.data['favorite_albums']), (1, 0))
+
+    def test_api_review_increments_counter(self):
+        """
+        Verifies that posting a review bumps the author's counter with an
+        increment rather than a recount, and only for new reviews
+        """
+        # A recount would reset this to the true value
+        Profile.objects.filter(pk=self.profile.pk).update(reviews=5)
+        data = {'content_type': 'album', 'content_id': self.album.id, 'rating': 4.0, 'review_text': 'Good'}
+        self.client.post('/api/reviews/', data)
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.reviews, 6)
+        self.client.post('/api/reviews/', dict(data, rating=5.0))
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.reviews, 6)
+
+    def test_verify_repairs_drift(self):
+        """
+        Verifies that verify_profile_counters recounts drifted counters
+        """
+        Review.objects.create(user=self.user, content_type='album', content_id=self.album.id,
+                              rating=4.0, review_text='Good')
+        Profile.objects.filter(pk=self.profile.pk).update(reviews=9, favorite_songs=2)
+        out = StringIO()
+        call_command('verify_profile_counters', stdout=out)
+        self.assertIn('Repaired 1 drifted reviews counters', out.getvalue())
+        self.assertIn('Repaired 1 drifted favorite_songs counters', out.getvalue())
+        self.profile.refresh_from_db()
+        self.assertEqual((self.profile.reviews, self.profile.favorite_songs), (1, 0))
+
+
+class RecommendationTests(APITestCase):
+    def setUp(self):
+        """
+        Create albums and users with overlapping tastes
+        """
+        cache.clear()
+        artist = Artist.objects.create(name='Test Artist', genre='Rock')
+        self.albums = [
+            Album.objects.create(title=f'Album {i}', artist=artist, genre='Rock', release_date='2023-01-01')
+            for i in range(4)
+        ]
+        self.users = [User.objects.create_user(username=f'user{i}', password='testpass123') for i in range(3)]
+        a, b, c, d = self.albums
+        # user0 and user1 both like A and B; user1 also likes C; user2 only likes D
+        for user, album, rating in [(0, a, 5.0), (0, b, 4.0), (1, a, 5.0), (1, b, 5.0), (1, c, 4.5), (2, d, 3.0)]:
+            Review.objects.create(user=self.users[user], content_type='album', content_id=album.id,
+                                  rating=rating, review_text='')
+        Favorite.objects.create(user=self.users[2], content_type='album', content_id=c.id)
+
+    def test_build_and_serve_recommendations(self):
+        """
+        Verifies that the offline build recommends albums liked by similar
+        users and the view serves them
+        """
+        out = StringIO()
+        call_command('build_recommendations', '--neighbors', '2', stdout=out)
+        self.assertIn('for 3 users over 4 albums', out.getvalue())
+        ranked = list(Recommendation.objects.filter(user=self.users[0]).order_by('rank')
+                      .values_list('album_id', flat=True))
+        self.assertEqual(ranked[0], self.albums[2].id)
+        self.assertNotIn(self.albums[0].id, ranked)
+
+        self.client.force_authenticate(user=self.users[0])
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/recommendations/')
+        self.assertEqual(response.data[0]['title'], 'Album 2')
+
+    def test_falls_back_to_genres(self):
+        """
+        Verifies that users without recommendations get top rated albums in
+        their favorite genres
+        """
+        user = User.objects.create_user(username='newcomer', password='testpass123')
+        Profile.objects.create(user=user, favorite_genres=['Rock'])
+        self.client.force_authenticate(user=user)
+        response = self.client.get('/api/recommendations/')
+        self.assertEqual(response.data[0]['title'], 'Album 0')
+
+    def test_recommendations_are_cached(self):
+        """
+        Verifies that recommendations are served from the cache until the
+        user's reviews, favorites or genres change
+        """
+        call_command('build_recommendations', stdout=StringIO())
+        user = self.users[2]
+        Profile.objects.create(user=user)
+        self.client.force_authenticate(user=user)
+        first = self.client.get('/api/recommendations/').data
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/recommendations/').data, first)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=user, content_type='album', content_id=self.albums[0].id)
+        with self.assertNumQueries(1):
+            self.client.get('/api/recommendations/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = Profile.objects.get(user=user)
+            profile.favorite_genres = ['Rock']
+            profile.save()
+        with self.assertNumQueries(1):
+            self.client.get('/api/recommendations/')
+
+    def test_warm_recommendations(self):
+        """
+        Verifies that the warm-up command caches recently active users
+        """
+        out = StringIO()
+        call_command('warm_recommendations', '--days', '1', stdout=out)
+        self.assertIn('Warmed recommendations for 3 users', out.getvalue())
+        self.client.force_authenticate(user=self.users[0])
+        with self.assertNumQueries(0):
+            self.client.get('/api/recommendations/')
+
+
+
+class VectorIndexTests(APITestCase):
+    def setUp(self):
+        """
+        Point the vector index at a temporary directory and create a small
+        catalog with two overlapping audiences
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_override = override_settings(VECTOR_INDEX_DIR=directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.rock = Artist.objects.create(name='Rock Artist', genre='Rock')
+        self.jazz = Artist.objects.create(name='Jazz Artist', genre='Jazz')
+        self.albums = [
+            Album.objects.create(title=f'Album {i}', artist=artist, genre=artist.genre, release_date='2023-01-01')
+            for i, artist in enumerate([self.rock, self.rock, self.rock, self.jazz])
+        ]
+        users = [User.objects.create_user(username=f'user{i}', password='testpass123') for i in range(2)]
+        a, b, c, d = self.albums
+        for user, album in [(0, a), (0, b), (1, c), (1, d)]:
+            Review.objects.create(user=users[user], content_type='album', content_id=album.id,
+                                  rating=5.0, review_text='')
+        self.client.force_authenticate(user=users[0])
+
+    def test_similar_albums(self):
+        """
+        Verifies that similar albums are ranked by shared listeners and
+        genre, and that the album itself is left out
+        """
+        self.assertEqual(self.client.get(f'/api/albums/{self.albums[0].id}/similar/').data, [])
+        out = StringIO()
+        call_command('build_vector_index', stdout=out)
+        self.assertIn('Indexed 4 albums', out.getvalue())
+        self.assertIn('Indexed 2 artists', out.getvalue())
+
+        response = self.client.get(f'/api/albums/{self.albums[0].id}/similar/', {'limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([album['title'] for album in response.data], ['Album 1', 'Album 2'])
+
+        response = self.client.get(f'/api/artists/{self.rock.id}/similar/')
+        self.assertEqual([artist['name'] for artist in response.data], ['Jazz Artist'])
+
+    def test_new_items_are_appended(self):
+        """
+        Verifies that albums created after a build are added to the index
+        and can be found by later searches
+        """
+        call_command('build_vector_index', '--kind', 'albums', stdout=StringIO())
+        with self.captureOnCommitCallbacks(execute=True):
+            album = Album.objects.create(title='New Album', artist=self.jazz, genre='Jazz', release_date='2024-01-01')
+        self.assertIsNotNone(vectors.indexes['albums'].vector(album.id))
+        response = self.client.get(f'/api/albums/{self.albums[3].id}/similar/')
+        self.assertIn('New Album', [album['title'] for album in response.data])
+
+    def test_empty_rebuild_drops_old_segment(self):
+        """
+        Verifies that rebuilding into an empty index stops serving the
+        previous segment's neighbours
+        """
+        call_command('build_vector_index', '--kind', 'albums', stdout=StringIO())
+        index = vectors.indexes['albums']
+        query = index.vector(self.albums[0].id)
+        self.assertNotEqual(index.search([query], 3), [[]])
+
+        Album.objects.all().delete()
+        call_command('build_vector_index', '--kind', 'albums', stdout=StringIO())
+        self.assertEqual(index.search([query], 3), [[]])
+
+    def test_similar_items_skips_repeated_rows(self):
+        """
+        Verifies that an item appended to the index twice is only returned
+        once, and still leaves room for the other neighbours
+        """
+        call_command('build_vector_index', '--kind', 'albums', stdout=StringIO())
+        vectors.index_items('albums', [self.albums[1]])
+        similar = vectors.similar_items('albums', self.albums[0], limit=3)
+        self.assertEqual(similar, [self.albums[1].id, self.albums[2].id])
+
+    def test_top_k_matches_full_sort(self):
+        """
+        Verifies that chunked top-k search agrees with sorting every score
+        """
+        rng = np.random.default_rng(0)
+        index = rng.standard_normal((100, 8)).astype(np.float32)
+        queries = rng.standard_normal((3, 8)).astype(np.float32)
+        rows, scores = vectors.top_k(index, queries, 5, chunk=7)
+        expected = np.argsort(-(queries @ index.T), axis=1)[:, :5]
+        np.testing.assert_array_equal(rows, expected)
+
+
+class PaginationTests(APITestCase):
+    def setUp(self):
+        """
+        Create an album with reviews from several users
+        """
+        artist = Artist.objects.create(name='Test Artist', genre='Rock')
+        self.album = Album.objects.create(title='Test Album', artist=artist, genre='Rock', release_date='2023-01-01')
+        self.users = [User.objects.create_user(username=f'user{i}', password='testpass123') for i in range(5)]
+        self.reviews = [
+            Review.objects.create(user=user, content_type='album', content_id=self.album.id, rating=4.0,
+                                  review_text=f'Review {i}')
+            for i, user in enumerate(self.users)
+        ]
+        self.client.force_authenticate(user=self.users[0])
+
+    def test_cursor_pages_cover_every_review(self):
+        """
+        Verifies that following next cursors walks every review once, newest
+        first, and previous cursors walk back
+        """
+        response = self.client.get(f'/api/albums/{self.album.id}/reviews/', {'page_size': 2})
+        self.assertIsNone(response.data['previous'])
+        texts = []
+        pages = [response]
+        while True:
+            texts += [review['review_text'] for review in response.data['results']]
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+            pages.append(response)
+        self.assertEqual(texts, [f'Review {i}' for i in reversed(range(5))])
+        self.assertEqual(len(pages), 3)
+
+        response = self.client.get(pages[-1].data['previous'])
+        self.assertEqual(response.data['results'], pages[-2].data['results'])
+
+    def test_page_size_is_capped(self):
+        """
+        Verifies that clients can't ask for more than max_page_size rows
+        """
+        for i in range(3):
+            Artist.objects.create(name=f'Artist {i}', genre='Rock')
+        with mock.patch('core.pagination.KeysetPagination.max_page_size', 2):
+            response = self.client.get('/api/artists/', {'page_size': 1000})
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(response.data['results'][0]['name'], 'Artist 2')
+        self.assertIsNotNone(response.data['next'])
@@ -1,7 +1,7 @@
 from rest_framework.routers import DefaultRouter
 from .views import (ProfileViewSet, ArtistViewSet, AlbumViewSet, SongViewSet, 
                    ReviewViewSet, AlbumReviewsView, FavoriteViewSet, 
-                   RecommendationView, SearchView, AddSearchView, RegisterView)
+                   RecommendationView, SearchView, ProfileSearchView, AddSearchView, RegisterView)
 from django.urls import path
 
 router = DefaultRouter()
@@ -16,6 +16,7 @@ urlpatterns = router.urls + [
     path('albums/<int:pk>/reviews/', AlbumReviewsView.as_view(), name='album-reviews'),
     path('recommendations/', RecommendationView.as_view(), name='recommendations'),
     path('search/', SearchView.as_view(), name='search'),
+    path('search/profiles/', ProfileSearchView.as_view(), name='search-profiles'),
     path('search/add/', AddSearchView.as_view(), name='search-add'),
     path('register/', RegisterView.as_view(), name='register'),
 ]
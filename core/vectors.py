@@ -0,0 +1,313 @@
+"""
+Similar-item search over albums and artists.
+
+Every album and artist gets a unit-length feature vector made of two
+blocks: its genre words hashed into GENRE_DIMS buckets, and the users who
+reviewed or favorited it (for artists, also their albums) hashed into
+USER_DIMS buckets, weighted like the recommendation builder weighs them.
+Cosine similarity over these vectors mixes "same genre" with "liked by the
+same people".
+
+Vectors live in VECTOR_INDEX_DIR as raw float32/int64 files that workers
+memory-map read-only, so all processes on a host share one copy through the
+page cache. `manage.py build_vector_index` writes a fresh segment and swaps
+it in atomically; rows created since then are appended to the current
+segment (see index_items), which readers pick up on their next search.
+"""
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+
+from .models import Album, Artist, Favorite, Review, normalize_search_text
+from .recommendations import MAX_RATING
+
+logger = logging.getLogger(__name__)
+
+GENRE_DIMS = 32
+USER_DIMS = 128
+DIMS = GENRE_DIMS + USER_DIMS
+# Share of a vector's weight given to genre; the rest goes to interactions
+GENRE_WEIGHT = 0.3
+# Index rows scored per matrix product during search
+SEARCH_CHUNK = 65536
+# Items whose vectors are computed per batch during a full build
+BUILD_BATCH = 10000
+
+INDEXED_MODELS = {
+    'albums': Album,
+    'artists': Artist,
+}
+
+
+def genre_features(genre):
+    vector = np.zeros(GENRE_DIMS, dtype=np.float32)
+    for word in normalize_search_text(genre or '').split():
+        vector[zlib.crc32(word.encode()) % GENRE_DIMS] = 1
+    return vector
+
+
+def interaction_features(kind, ids):
+    """
+    Hashed user interaction vectors for a batch of items.
+    Returns:
+        dict: Item ID -> USER_DIMS array, only for items with interactions
+    """
+    features = {}
+
+    def add(item_id, user_id, weight):
+        if item_id not in features:
+            features[item_id] = np.zeros(USER_DIMS, dtype=np.float32)
+        features[item_id][user_id % USER_DIMS] += weight
+
+    content_type = kind[:-1]
+    owners = {album_id: album_id for album_id in ids}
+    if kind == 'artists':
+        owners = dict(Album.objects.filter(artist_id__in=ids).values_list('pk', 'artist_id'))
+        for user_id, artist_id, rating in Review.objects.filter(
+            content_type='artist', content_id__in=ids
+        ).values_list('user_id', 'content_id', 'rating'):
+            add(artist_id, user_id, float(rating) / MAX_RATING)
+        for user_id, artist_id in Favorite.objects.filter(
+            content_type=content_type, content_id__in=ids
+        ).values_list('user_id', 'content_id'):
+            add(artist_id, user_id, 1.0)
+    # Album interactions, credited to the album or to its artist
+    for user_id, album_id, rating in Review.objects.filter(
+        content_type='album', content_id__in=list(owners)
+    ).values_list('user_id', 'content_id', 'rating'):
+        add(owners[album_id], user_id, float(rating) / MAX_RATING)
+    for user_id, album_id in Favorite.objects.filter(
+        content_type='album', content_id__in=list(owners)
+    ).values_list('user_id', 'content_id'):
+        add(owners[album_id], user_id, 1.0)
+    return features
+
+
+def item_vectors(kind, items):
+    """
+    Feature vectors for albums or artists.
+    Args:
+        kind (str): 'albums' or 'artists'
+        items (list): Album or Artist instances
+    Returns:
+        tuple: (ids int64 array, vectors float32 array of shape len x DIMS)
+    """
+    ids = np.array([item.pk for item in items], dtype=np.int64)
+    vectors = np.zeros((len(items), DIMS), dtype=np.float32)
+    interactions = interaction_features(kind, ids.tolist())
+    for row, item in enumerate(items):
+        genre = genre_features(item.genre)
+        users = interactions.get(item.pk, np.zeros(USER_DIMS, dtype=np.float32))
+        for block, columns, weight in ((genre, slice(0, GENRE_DIMS), GENRE_WEIGHT),
+                                       (users, slice(GENRE_DIMS, DIMS), 1 - GENRE_WEIGHT)):
+            norm = np.linalg.norm(block)
+            if norm:
+                vectors[row, columns] = block / norm * np.sqrt(weight)
+        norm = np.linalg.norm(vectors[row])
+        if norm:
+            vectors[row] /= norm
+    return ids, vectors
+
+
+def top_k(vectors, queries, k, chunk=SEARCH_CHUNK):
+    """
+    Batched exact top-k by dot product, scanning the index in chunks so
+    memory stays bounded however large it is.
+    Returns:
+        tuple: (rows, scores), both len(queries) x k, best first; rows are
+        -1 where the index has fewer than k entries
+    """
+    best_rows = np.full((len(queries), k), -1, dtype=np.int64)
+    best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    for start in range(0, len(vectors), chunk):
+        scores = queries @ np.asarray(vectors[start:start + chunk]).T
+        rows = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+        scores = np.concatenate([best_scores, scores], axis=1)
+        rows = np.concatenate([best_rows, rows], axis=1)
+        keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, keep, axis=1)
+        best_rows = np.take_along_axis(rows, keep, axis=1)
+    order = np.argsort(-best_scores, axis=1, kind='stable')
+    return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+class VectorIndex:
+    """
+    Memory-mapped vectors for one kind of item. `<dir>/<kind>` is a symlink
+    to the current segment directory holding vectors.f32 and ids.i64.
+    """
+    def __init__(self, kind):
+        self.kind = kind
+        self.lock = threading.Lock()
+        self.state = None
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.vectors = np.zeros((0, DIMS), dtype=np.float32)
+        # Item ID -> row in ids/vectors
+        self.rows = {}
+
+    @property
+    def path(self):
+        return os.path.join(settings.VECTOR_INDEX_DIR, self.kind)
+
+    def exists(self):
+        return os.path.exists(os.path.join(self.path, 'meta.json'))
+
+    @contextmanager
+    def write_lock(self):
+        os.makedirs(settings.VECTOR_INDEX_DIR, exist_ok=True)
+        with open(os.path.join(settings.VECTOR_INDEX_DIR, f'{self.kind}.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def refresh(self):
+        """
+        Map the current segment, or just the rows appended since the last
+        call. Cheap when nothing changed: two stat calls.
+        """
+        if not self.exists():
+            with self.lock:
+                self.state = None
+                self.ids = np.zeros(0, dtype=np.int64)
+                self.vectors = np.zeros((0, DIMS), dtype=np.float32)
+                self.rows = {}
+            return
+        segment = os.path.realpath(self.path)
+        ids_path = os.path.join(segment, 'ids.i64')
+        # ids are written after their vectors, so every id has a full vector
+        count = os.path.getsize(ids_path) // 8
+        with self.lock:
+            if self.state == (segment, count):
+                return
+            start = 0
+            if self.state is not None and self.state[0] == segment:
+                start = self.state[1]
+            else:
+                self.rows = {}
+            if count:
+                self.ids = np.memmap(ids_path, dtype=np.int64, mode='r', shape=(count,))
+                self.vectors = np.memmap(os.path.join(segment, 'vectors.f32'), dtype=np.float32, mode='r',
+                                         shape=(count, DIMS))
+            else:
+                # Empty files can't be mapped; also drops any old segment's maps
+                self.ids = np.zeros(0, dtype=np.int64)
+                self.vectors = np.zeros((0, DIMS), dtype=np.float32)
+            # Later rows win, so a re-appended item uses its newest vector
+            for row in range(start, count):
+                self.rows[int(self.ids[row])] = row
+            self.state = (segment, count)
+
+    def vector(self, item_id):
+        self.refresh()
+        row = self.rows.get(item_id)
+        return None if row is None else np.asarray(self.vectors[row])
+
+    def search(self, queries, k):
+        """
+        Find the k nearest items for each query vector.
+        Returns:
+            list: One list of (item_id, score) per query, best first
+        """
+        self.refresh()
+        if not len(self.ids):
+            return [[] for _ in queries]
+        rows, scores = top_k(self.vectors, np.asarray(queries, dtype=np.float32), min(k, len(self.ids)))
+        return [
+            [(int(self.ids[row]), float(score)) for row, score in zip(query_rows, query_scores) if row >= 0]
+            for query_rows, query_scores in zip(rows, scores)
+        ]
+
+    def append(self, ids, vectors):
+        """
+        Add rows to the current segment, if one has been built.
+        """
+        if not len(ids) or not self.exists():
+            return
+        with self.write_lock():
+            segment = os.path.realpath(self.path)
+            with open(os.path.join(segment, 'vectors.f32'), 'ab') as f:
+                f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            with open(os.path.join(segment, 'ids.i64'), 'ab') as f:
+                f.write(np.ascontiguousarray(ids, dtype=np.int64).tobytes())
+
+    def build(self):
+        """
+        Compute vectors for every item into a new segment and swap it in.
+        Returns:
+            int: Number of items indexed
+        """
+        model = INDEXED_MODELS[self.kind]
+        segment = os.path.join(settings.VECTOR_INDEX_DIR, f'{self.kind}-{time.time_ns()}')
+        os.makedirs(segment)
+        count = last_pk = 0
+        with open(os.path.join(segment, 'vectors.f32'), 'wb') as vectors_file, \
+                open(os.path.join(segment, 'ids.i64'), 'wb') as ids_file:
+            while True:
+                items = list(model.objects.filter(pk__gt=last_pk).order_by('pk')[:BUILD_BATCH])
+                if not items:
+                    break
+                ids, vectors = item_vectors(self.kind, items)
+                vectors_file.write(vectors.tobytes())
+                ids_file.write(ids.tobytes())
+                count += len(items)
+                last_pk = items[-1].pk
+        with open(os.path.join(segment, 'meta.json'), 'w') as f:
+            json.dump({'dims': DIMS, 'count': count}, f)
+
+        with self.write_lock():
+            previous = os.path.realpath(self.path) if self.exists() else None
+            link = f'{self.path}.tmp'
+            if os.path.lexists(link):
+                os.remove(link)
+            os.symlink(os.path.basename(segment), link)
+            os.replace(link, self.path)
+            # Workers that still map the old files keep reading them until
+            # their next refresh
+            if previous:
+                shutil.rmtree(previous, ignore_errors=True)
+        # Rows created while the build was running
+        index_items(self.kind, list(model.objects.filter(pk__gt=last_pk)))
+        return count
+
+
+indexes = {kind: VectorIndex(kind) for kind in INDEXED_MODELS}
+
+
+def index_items(kind, items):
+    """
+    Append newly created albums or artists to the index.
+    """
+    index = indexes[kind]
+    if not items or not index.exists():
+        return
+    try:
+        index.append(*item_vectors(kind, items))
+    except OSError:
+        logger.exception('Failed to add %d %s to the vector index', len(items), kind)
+
+
+def similar_items(kind, item, limit=10):
+    """
+    IDs of the items most similar to `item`, best first. Items missing from
+    the index are compared using freshly computed vectors.
+    """
+    index = indexes[kind]
+    vector = index.vector(item.pk)
+    if vector is None:
+        vector = item_vectors(kind, [item])[1][0]
+    # Items appended more than once take several rows; search past them
+    duplicates = len(index.ids) - len(index.rows)
+    results = index.search([vector], limit + 1 + duplicates)[0]
+    ids = dict.fromkeys(item_id for item_id, score in results if item_id != item.pk and score > 0)
+    return list(ids)[:limit]
@@ -4,19 +4,26 @@ from django.shortcuts import render
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
-from .models import Profile, Artist, Album, Song, Review, Favorite, RecentSearch
-from .serializers import ProfileSerializer, ArtistSerializer, AlbumSerializer, SongSerializer, ReviewSerializer, FavoriteSerializer, RecentSearchSerializer
+from .models import Profile, Artist, Album, Song, Review, Favorite
+from .serializers import ProfileSerializer, ProfileSummarySerializer, ArtistSerializer, AlbumSerializer, SongSerializer, ArtistDetailSerializer, AlbumDetailSerializer, SongDetailSerializer, ReviewSerializer, FavoriteSerializer, RecentSearchSerializer
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated, AllowAny
 from rest_framework import generics
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter
-from django.db.models import Avg, Q
+from .search import (CatalogSearchFilter, search_catalog, search_profiles, needs_spotify, merge_results,
+                     mark_synced, start_spotify_search)
+from django.conf import settings
+import time
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from rest_framework.decorators import action
 from rest_framework import status
 from django.contrib.auth import get_user_model
 from django.shortcuts import get_object_or_404
 from rest_framework.parsers import MultiPartParser, FormParser
 from .spotify import *
+from .ingest import enqueue_ingest, parse_spotify_uri
+from .recommendations import get_recommendations
+from .vectors import similar_items
+from .pagination import ReviewPagination
 
 class HelloWorldView(APIView):
     def get(self, request):
@@ -43,40 +50,88 @@ class ProfileViewSet(ModelViewSet):
         """
         Returns the authenticated user's recent searches
         """
-        profile = request.user.profile
-        recent_searches = profile.recent_searches.all()
+        recent_searches = request.user.profile.recent_searches()
         serializer = RecentSearchSerializer(recent_searches, many=True, context={'request': request})
-        print(serializer.data)
         return Response(serializer.data)
 
-class ArtistViewSet(ModelViewSet):
+class SimilarItemsMixin:
+    """
+    Adds /similar/ to a catalog viewset, served from the vector index.
+    """
+    similar_kind = None
+    max_similar = 50
+
+    @action(detail=True, methods=['GET'])
+    def similar(self, request, pk=None):
+        """
+        Returns the items most similar to this one, best first
+        """
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), self.max_similar)
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        item = self.get_object()
+        ids = similar_items(self.similar_kind, item, max(limit, 0))
+        found = self.get_queryset().in_bulk(ids)
+        items = [found[item_id] for item_id in ids if item_id in found]
+        return Response(self.get_serializer(items, many=True).data)
+
+class ArtistViewSet(SimilarItemsMixin, ModelViewSet):
     queryset = Artist.objects.all()
     serializer_class = ArtistSerializer
+    similar_kind = 'artists'
 
-class AlbumViewSet(ModelViewSet):
+    def get_serializer_class(self):
+        if self.action == 'retrieve':
+            return ArtistDetailSerializer
+        return super().get_serializer_class()
+
+class AlbumViewSet(SimilarItemsMixin, ModelViewSet):
     queryset = Album.objects.all()
     serializer_class = AlbumSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter]
+    similar_kind = 'albums'
+    filter_backends = [DjangoFilterBackend, CatalogSearchFilter]
     filterset_fields = ['genre', 'release_date']
-    search_fields = ['title', 'artist__name']
+
+    def get_serializer_class(self):
+        if self.action == 'retrieve':
+            return AlbumDetailSerializer
+        return super().get_serializer_class()
     
 
 class SongViewSet(ModelViewSet):
     queryset = Song.objects.all()
     serializer_class = SongSerializer
 
+    def get_serializer_class(self):
+        if self.action == 'retrieve':
+            return SongDetailSerializer
+        return super().get_serializer_class()
+
 class ReviewViewSet(ModelViewSet):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
+    pagination_class = ReviewPagination
     permission_classes = [IsAuthenticatedOrReadOnly]
 
     def perform_create(self, serializer):
         # Save the review instance
         review = serializer.save(user=self.request.user)
 
+    @action(detail=False, methods=['POST'], url_path='batch', url_name='batch')
+    def batch(self, request):
+        """
+        Create or overwrite many of the user's reviews in one request
+        """
+        serializer = self.get_serializer(data=request.data, many=True, max_length=100)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(user=request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
 
 class AlbumReviewsView(generics.ListAPIView):
     serializer_class = ReviewSerializer
+    pagination_class = ReviewPagination
 
     def get_queryset(self):
         album_id = self.kwargs['pk']
@@ -95,29 +150,28 @@ class FavoriteViewSet(ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    def list_content_type(self, content_type):
+        page = self.paginate_queryset(self.get_queryset().filter(content_type=content_type))
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
     @action(detail=False, methods=['GET'], url_path='albums', url_name='albums')
     def albums(self, request):
-        favorites = self.get_queryset().filter(content_type='album')
-        return Response(FavoriteSerializer(favorites, many=True).data)
+        return self.list_content_type('album')
 
     @action(detail=False, methods=['GET'], url_path='songs', url_name='songs')
     def songs(self, request):
-        favorites = self.get_queryset().filter(content_type='song')
-        return Response(FavoriteSerializer(favorites, many=True).data)
+        return self.list_content_type('song')
 
     @action(detail=False, methods=['GET'], url_path='artists', url_name='artists')
     def artists(self, request):
-        favorites = self.get_queryset().filter(content_type='artist')
-        return Response(FavoriteSerializer(favorites, many=True).data)
+        return self.list_content_type('artist')
 
 class RecommendationView(APIView):
     permission_classes = [IsAuthenticated]
     #Improve recommendation algorithm
     def get(self, request):
-        favorite_genres = request.user.profile.favorite_genres
-        recommendations = Album.objects.filter(genre__in=favorite_genres).annotate(avg_rating=Avg('review__rating')).order_by('-avg_rating')[:10]
-        serializer = AlbumSerializer(recommendations, many=True)
-        return Response(serializer.data)
+        # Precomputed by `manage.py build_recommendations` and cached per user
+        return Response(get_recommendations(request.user.id))
 
 class SearchView(APIView):
     """
@@ -125,6 +179,7 @@ class SearchView(APIView):
     """
     def get(self, request):
         search_query = request.query_params.get('q', '')
+        deadline = time.monotonic() + settings.SEARCH_DEADLINE
         
         # Initialize results
         results = {
@@ -135,10 +190,17 @@ class SearchView(APIView):
             'songs': []     # Songs from Spotify
         }
 
+        # Look in our own catalog first and only go to Spotify when that
+        # doesn't give enough fresh results. The Spotify search runs in the
+        # background while we look up profiles.
+        limit = settings.SEARCH_RESULT_LIMIT
+        local_results = search_catalog(search_query, limit)
+        spotify_search = None
+        if needs_spotify(local_results):
+            spotify_search = start_spotify_search(search_query, limit)
+
         # Search profiles
-        profile_results = Profile.objects.filter(
-            Q(user__username__icontains=search_query)             
-        ).select_related('user')[:10]  # Limit to top 10 results
+        profile_results = search_profiles(search_query, 10)  # Limit to top 10 results
 
         # Add profile results to response
         profile_serializer = ProfileSerializer(
@@ -147,23 +209,54 @@ class SearchView(APIView):
             context={'request': request}  # Include request for full URLs
         )
         results['profiles'] = profile_serializer.data
-        
-        # Get Spotify results for other content types
-        token_response = get_spotify_token()
-        if not token_response:
-            return Response(
-                {'error': 'Failed to authenticate with Spotify API'}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
 
-        access_token = token_response
-        spotify_results = search_spotify(search_query, None, access_token)
-        
-        # Add Spotify results to response
-        results.update(spotify_results)  # This adds albums, songs, and artists from Spotify
-        
+        # Wait for Spotify until the deadline, then answer with what we have.
+        # A search that misses the deadline still finishes and fills the
+        # search cache for the next request.
+        spotify_results = {}
+        if spotify_search is not None:
+            try:
+                spotify_results = spotify_search.result(timeout=max(deadline - time.monotonic(), 0))
+            except FuturesTimeoutError:
+                spotify_results = {'error': 'Spotify search timed out'}
+                results['partial'] = True
+            if spotify_results is None:
+                if not any(local_results.values()):
+                    return Response(
+                        {'error': 'Failed to authenticate with Spotify API'},
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                    )
+                spotify_results = {}
+
+        if 'error' in spotify_results:
+            results['error'] = spotify_results['error']
+        else:
+            mark_synced(spotify_results)
+
+        # Add merged results to response; each item says whether it came
+        # from our database or from Spotify
+        results.update(merge_results(local_results, spotify_results, limit))
+
         return Response(results)
 
+class ProfileSearchView(APIView):
+    """
+    Username autocomplete, ranked with prefix matches first
+    """
+    max_limit = 20
+
+    def get(self, request):
+        search_query = request.query_params.get('q', '')
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), self.max_limit)
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        profiles = search_profiles(search_query, max(limit, 0))
+        serializer = ProfileSummarySerializer(profiles, many=True, context={'request': request})
+        return Response({'query': search_query, 'profiles': serializer.data})
+
+
 class AddSearchView(APIView):
     """
     Add a searched item to user's recent searches
@@ -176,7 +269,6 @@ class AddSearchView(APIView):
             # Get query parameters
             content_type = request.query_params.get('content_type')
             content_id = request.query_params.get('content_id')
-            print("Adding Search", content_type, content_id)
             # Validate parameters
             if not content_type or not content_id:
                 return Response({"error": "Missing parameters"}, status=status.HTTP_400_BAD_REQUEST)
@@ -191,23 +283,27 @@ class AddSearchView(APIView):
                     'Song': Song,
                     'Artist': Artist
                 }[content_type]
+                spotify_type = content_type.lower()
+                if spotify_type == 'song':
+                    spotify_type = 'track'
+                if parse_spotify_uri(content_id)[0] != spotify_type:
+                    return Response(
+                        {"error": f"content_id must be a Spotify {spotify_type} URI"},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
                 
                 searchable = model.objects.filter(spotify_uri=content_id).first()
-                print(searchable)
                 
-                # If not in database, create it from Spotify
+                # If not in database, queue it for import and record the
+                # search against the job until the worker has created it
                 if not searchable:
-                    print("Not in database")
-                    spotify_type = content_type.lower()
-                    if spotify_type == 'song':
-                        spotify_type = 'track'
-                        
-                    token_response = get_spotify_token()
-                    if not token_response:
-                        return Response({"error": "Spotify API error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-                        
-                    searchable = create_resource(spotify_type, content_id, token_response)
-                    
+                    job = enqueue_ingest(spotify_type, content_id)
+                    request.user.profile.add_recent_search(job)
+                    return Response(
+                        {"message": "Search added, item is being imported", "job_id": job.id, "status": job.status},
+                        status=status.HTTP_202_ACCEPTED
+                    )
+
             elif content_type == 'Profile':
                 searchable = Profile.objects.filter(id=content_id).first()
                 
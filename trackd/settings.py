@@ -17,12 +17,100 @@ from decouple import config
 SPOTIFY_CLIENT_ID = config('SPOTIFY_CLIENT_ID')
 SPOTIFY_CLIENT_SECRET = config('SPOTIFY_CLIENT_SECRET')
 
+# Spotify endpoints; point these at `manage.py fake_spotify` for offline testing
+SPOTIFY_API_URL = config('SPOTIFY_API_URL', default='https://api.spotify.com/v1')
+SPOTIFY_TOKEN_URL = config('SPOTIFY_TOKEN_URL', default='https://accounts.spotify.com/api/token')
+
+# Cache alias holding the shared Spotify access token, and how many seconds
+# before expiry it is refreshed in the background
+SPOTIFY_TOKEN_CACHE = config('SPOTIFY_TOKEN_CACHE', default='default')
+SPOTIFY_TOKEN_REFRESH_MARGIN = config('SPOTIFY_TOKEN_REFRESH_MARGIN', default=300, cast=int)
+
+# Pooled HTTP client used for every Spotify call. Timeouts are
+# (connect, read) seconds per endpoint; 5xx responses and connection errors
+# are retried with jittered exponential backoff, 429s after Retry-After
+# (unless Spotify asks us to wait longer than SPOTIFY_HTTP_MAX_RETRY_AFTER).
+SPOTIFY_HTTP_POOL_SIZE = config('SPOTIFY_HTTP_POOL_SIZE', default=10, cast=int)
+SPOTIFY_HTTP_TIMEOUTS = {
+    'default': (3.05, 10),
+    'token': (3.05, 5),
+    'search': (3.05, 5),
+    'item': (3.05, 10),
+}
+SPOTIFY_HTTP_MAX_RETRIES = config('SPOTIFY_HTTP_MAX_RETRIES', default=3, cast=int)
+SPOTIFY_HTTP_BACKOFF = config('SPOTIFY_HTTP_BACKOFF', default=0.5, cast=float)
+SPOTIFY_HTTP_MAX_BACKOFF = config('SPOTIFY_HTTP_MAX_BACKOFF', default=8, cast=float)
+SPOTIFY_HTTP_MAX_RETRY_AFTER = config('SPOTIFY_HTTP_MAX_RETRY_AFTER', default=10, cast=float)
+
+# Spotify search results cache: fresh for TTL seconds, then served stale for
+# up to STALE_TTL more seconds while refreshed in the background. SIZE bounds
+# the per-process LRU; SHARED optionally names a cache alias shared by workers.
+SPOTIFY_SEARCH_CACHE_TTL = config('SPOTIFY_SEARCH_CACHE_TTL', default=300, cast=int)
+SPOTIFY_SEARCH_CACHE_STALE_TTL = config('SPOTIFY_SEARCH_CACHE_STALE_TTL', default=3600, cast=int)
+SPOTIFY_SEARCH_CACHE_SIZE = config('SPOTIFY_SEARCH_CACHE_SIZE', default=1024, cast=int)
+SPOTIFY_SEARCH_CACHE_SHARED = config('SPOTIFY_SEARCH_CACHE_SHARED', default='')
+
+# Token bucket shared by every worker around all Spotify calls. RATE is
+# requests per second, BURST the bucket size. Background work (ingestion)
+# leaves BACKGROUND_RESERVE of the bucket for interactive search and waits
+# longer for a slot. BACKEND is 'cache' (uses RATE_LIMIT_CACHE) or 'database'.
+SPOTIFY_RATE_LIMIT_BACKEND = config('SPOTIFY_RATE_LIMIT_BACKEND', default='cache')
+SPOTIFY_RATE_LIMIT_CACHE = config('SPOTIFY_RATE_LIMIT_CACHE', default='default')
+SPOTIFY_RATE_LIMIT_RATE = config('SPOTIFY_RATE_LIMIT_RATE', default=5, cast=float)
+SPOTIFY_RATE_LIMIT_BURST = config('SPOTIFY_RATE_LIMIT_BURST', default=20, cast=int)
+SPOTIFY_RATE_LIMIT_BACKGROUND_RESERVE = config('SPOTIFY_RATE_LIMIT_BACKGROUND_RESERVE', default=0.5, cast=float)
+SPOTIFY_RATE_LIMIT_MAX_WAIT = {
+    'interactive': 2,
+    'background': 60,
+}
+
+# /api/search/ answers from our own catalog first and only asks Spotify when
+# a section has fewer than SEARCH_LOCAL_MIN_RESULTS local matches or rows
+# older than SEARCH_LOCAL_MAX_AGE seconds
+SEARCH_RESULT_LIMIT = config('SEARCH_RESULT_LIMIT', default=10, cast=int)
+SEARCH_LOCAL_MIN_RESULTS = config('SEARCH_LOCAL_MIN_RESULTS', default=3, cast=int)
+SEARCH_LOCAL_MAX_AGE = config('SEARCH_LOCAL_MAX_AGE', default=7 * 24 * 3600, cast=int)
+# Spotify searches run on a pool of SEARCH_POOL_SIZE threads while the
+# request thread queries the database; after SEARCH_DEADLINE seconds the
+# endpoint answers without Spotify's results
+SEARCH_POOL_SIZE = config('SEARCH_POOL_SIZE', default=8, cast=int)
+SEARCH_DEADLINE = config('SEARCH_DEADLINE', default=2.0, cast=float)
+
+# Album recommendations, rebuilt offline by `manage.py build_recommendations`:
+# similar albums kept per album, and recommendations stored per user
+RECOMMENDATION_NEIGHBORS = config('RECOMMENDATION_NEIGHBORS', default=50, cast=int)
+RECOMMENDATION_LIMIT = config('RECOMMENDATION_LIMIT', default=20, cast=int)
+# Each user's serialized recommendations are cached in RECOMMENDATION_CACHE
+# for RECOMMENDATION_CACHE_TTL seconds, and dropped when their reviews,
+# favorites or favorite genres change or recommendations are rebuilt
+RECOMMENDATION_CACHE = config('RECOMMENDATION_CACHE', default='default')
+RECOMMENDATION_CACHE_TTL = config('RECOMMENDATION_CACHE_TTL', default=6 * 3600, cast=int)
+
+# Recent searches kept per profile
+RECENT_SEARCH_LIMIT = config('RECENT_SEARCH_LIMIT', default=10, cast=int)
+
+# Background ingestion queue processed by `manage.py run_ingest_worker`
+INGEST_WORKER_CONCURRENCY = config('INGEST_WORKER_CONCURRENCY', default=2, cast=int)
+INGEST_WORKER_POLL_INTERVAL = config('INGEST_WORKER_POLL_INTERVAL', default=1.0, cast=float)
+INGEST_JOB_MAX_ATTEMPTS = config('INGEST_JOB_MAX_ATTEMPTS', default=3, cast=int)
+INGEST_JOB_TIMEOUT = config('INGEST_JOB_TIMEOUT', default=300, cast=int)  # Requeue jobs running longer than this
+
+# Concurrent imports of the same Spotify URI are coalesced: one caller fetches
+# while the others wait up to INGEST_SINGLEFLIGHT_TIMEOUT seconds for it.
+# Processes coordinate through locks in INGEST_LOCK_CACHE.
+INGEST_LOCK_CACHE = config('INGEST_LOCK_CACHE', default='default')
+INGEST_SINGLEFLIGHT_TIMEOUT = config('INGEST_SINGLEFLIGHT_TIMEOUT', default=30, cast=int)
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Album and artist feature vectors for similar-item search, built by
+# `manage.py build_vector_index` and memory-mapped by every worker
+VECTOR_INDEX_DIR = config('VECTOR_INDEX_DIR', default=str(BASE_DIR / 'vectors'))
+
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
@@ -61,6 +149,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'django_filters',
     'corsheaders',
@@ -116,6 +205,16 @@ DATABASES = {
     }
 }
 
+# Local memory by default. Point CACHE_BACKEND at a shared backend (e.g.
+# django.core.cache.backends.db.DatabaseCache after `manage.py createcachetable`,
+# or Redis) so cached state is shared between gunicorn workers.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='trackd'),
+    }
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework_simplejwt.authentication.JWTAuthentication',
@@ -125,6 +224,10 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    # Cursor pagination on every list endpoint; clients may ask for up to
+    # 100 rows with ?page_size=
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetPagination',
+    'PAGE_SIZE': config('API_PAGE_SIZE', default=20, cast=int),
 }
 
 